@@ -0,0 +1,99 @@
+"""
+Recall vs latency of HardNegativeIndex (IVF over song centroids) at catalog scale.
+
+Chunks are streamed into the index in batches, so 10M-chunk runs never hold the whole
+corpus in RAM. Ground truth is an exact scan of the same stored vectors, so recall
+isolates the IVF approximation from quantization.
+
+Run from /backend:
+    python -m benchmarks.bench_hard_negative_index --sizes 100000 1000000 --nprobe 4 8 16 32
+"""
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from services.hard_negative_index import HardNegativeIndex
+
+DIM = 384
+
+
+def stream_corpus(n_chunks, chunks_per_song, seed, batch=50000):
+    """Yields (ids, vectors, metadatas) batches of clustered unit vectors."""
+    rng = np.random.default_rng(seed)
+    n_songs = -(-n_chunks // chunks_per_song)
+    n_genres = max(1, n_songs // 200)
+    genres = rng.standard_normal((n_genres, DIM)).astype(np.float32)
+    song_genre = rng.integers(0, n_genres, size=n_songs)
+    for start in range(0, n_chunks, batch):
+        size = min(batch, n_chunks - start)
+        songs = np.arange(start, start + size) // chunks_per_song
+        song_rng = [np.random.default_rng(seed + 1000 + s) for s in np.unique(songs)]
+        song_dirs = {s: r.standard_normal(DIM).astype(np.float32) for s, r in zip(np.unique(songs), song_rng)}
+        vectors = np.stack([genres[song_genre[s]] + 0.8 * song_dirs[s] for s in songs])
+        vectors += 0.5 * rng.standard_normal((size, DIM)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = [str(i) for i in range(start, start + size)]
+        metas = [{"song": f"song{s}", "artist": f"artist{s % 997}"} for s in songs]
+        yield ids, vectors, metas
+
+
+def exact_songs(index, query, k, exclude_song):
+    return {r for r, _ in index.songs.search(query, k=k, exclude_song=exclude_song, rescore_factor=1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--chunks-per-song", type=int, default=12)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[2, 4, 8, 16, 32])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        path = tempfile.mkdtemp(prefix="melodymind_hni_")
+        try:
+            index = HardNegativeIndex(path, dim=DIM, min_train_size=min(20000, size))
+            start = time.perf_counter()
+            for ids, vectors, metas in stream_corpus(size, args.chunks_per_song, args.seed):
+                index.add(ids, vectors, metas)
+            index.rebuild()
+            build_s = time.perf_counter() - start
+            index.close()
+
+            # Reopen to measure a cold restart from the memory-mapped state
+            t0 = time.perf_counter()
+            index = HardNegativeIndex(path, dim=DIM)
+            restart_s = time.perf_counter() - t0
+            print(f"\n📦 {size:,} chunks / {index.songs.count:,} songs | build {build_s:.1f}s | "
+                  f"restart {restart_s:.2f}s | {len(index.song_ivf.centroids)} song lists")
+
+            rng = np.random.default_rng(args.seed + 1)
+            query_rows = rng.choice(index.chunks.count, args.queries, replace=False)
+            queries = index.chunks.vectors_for(np.sort(query_rows))
+            exclude = [index.chunks.metadatas[r]['song'] for r in np.sort(query_rows)]
+
+            t0 = time.perf_counter()
+            truth = [exact_songs(index, q, args.k, s) for q, s in zip(queries, exclude)]
+            exact_ms = (time.perf_counter() - t0) / args.queries * 1000
+            print(f"   exact song scan: {exact_ms:.2f} ms/query")
+
+            for nprobe in args.nprobe:
+                latencies, recalls = [], []
+                for q, s, t in zip(queries, exclude, truth):
+                    t0 = time.perf_counter()
+                    picked = index.distractor_songs(q, k=args.k, exclude_song=s, nprobe=nprobe)
+                    latencies.append(time.perf_counter() - t0)
+                    rows = {index.songs.row_by_id[f"{p['artist']}_{p['song']}"] for p in picked}
+                    recalls.append(len(rows & t) / args.k)
+                print(f"   nprobe={nprobe:<3} recall@{args.k}={np.mean(recalls):.3f} "
+                      f"p50={np.percentile(latencies, 50) * 1000:.2f}ms "
+                      f"p95={np.percentile(latencies, 95) * 1000:.2f}ms")
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Match-quality regression benchmark for services/matching.
+
+A corpus is a JSONL file of labeled tracks with their recorded YT Music search responses:
+
+    {"track": {"id", "name", "artist", "artists", "album", "duration_ms", "isrc"},
+     "expected": "<videoId>" | null,
+     "responses": {"<query>": [<yt.search results>], ...}}
+
+`run` replays every track through matching.resolve_track against the recorded responses
+(no network) and reports precision, recall, second-query ("fallback") rate, searches per
+track and per-track CPU time. With --baseline it exits non-zero on a regression, so query
+or scoring changes can be judged on accuracy and speed together.
+
+Run from /backend:
+    python -m benchmarks.bench_matching build-fake --out match_corpus.jsonl
+    python -m benchmarks.bench_matching record --labels labeled_tracks.jsonl --out match_corpus.jsonl
+    python -m benchmarks.bench_matching run --corpus match_corpus.jsonl --save-baseline match_baseline.json
+    python -m benchmarks.bench_matching run --corpus match_corpus.jsonl --baseline match_baseline.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import numpy as np
+from services import fakes, matching, tracing
+
+
+class ReplayYTMusic:
+    """Answers yt.search from recorded responses. Queries that were never recorded return []."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.unrecorded = []
+
+    def search(self, query, filter=None, scope=None, limit=20, ignore_spelling=False):
+        if query not in self.responses:
+            self.unrecorded.append(query)
+            return []
+        return self.responses[query]
+
+
+def record_queries(yt, track):
+    """Every query the matcher may issue for a track, with the live (or fake) response."""
+    queries = {matching.primary_query(track), *matching.specific_queries(track)}
+    return {q: yt.search(q, filter="songs") for q in sorted(queries)}
+
+
+# --- CORPUS BUILDING ---
+def _perturb(results, truth, roll):
+    """Real-world noise the fakes don't produce on their own, picked by `roll` in [0, 1)."""
+    for item in results:
+        if item['videoId'] != truth:
+            continue
+        if roll < 0.08:
+            item['title'] += " - Remastered 2011"
+        elif roll < 0.12:
+            item['duration_seconds'] = None
+            item['duration'] = None
+        elif roll < 0.16:
+            item['artists'].append({"name": "Featured Guest", "id": None})
+    return results
+
+
+def build_fake(args):
+    os.environ.setdefault("FAKE_LATENCY_MS", "0")
+    os.environ.setdefault("FAKE_YTMUSIC_MISSING_RATE", str(args.missing_rate))
+    catalog = fakes.load_catalog()
+    yt = fakes.FakeYTMusic(catalog)
+    rng = random.Random(args.seed)
+
+    tracks = [t for pl in catalog.values() for t in pl['tracks']]
+    count = 0
+    with open(args.out, "w", encoding="utf-8") as f:
+        for t in tracks[:args.limit]:
+            track = matching.track_from_spotify(t)
+            truth = fakes._video_id(track.name, track.artist)
+            roll = rng.random()
+            if 0.16 <= roll < 0.19:
+                track.isrc = None  # Spotify has no ISRC; the second query falls back to text
+            responses = {q: _perturb(results, truth, roll) for q, results in record_queries(yt, track).items()}
+            f.write(json.dumps({"track": track.to_dict(), "expected": truth, "responses": responses}) + "\n")
+            count += 1
+    print(f"✅ Wrote {count} labeled tracks to {args.out}")
+
+
+def record(args):
+    """Records live responses for a labeled file of {"track": spotify track, "expected": videoId|null}."""
+    from services import providers
+    oauth = None
+    if args.oauth:
+        with open(args.oauth) as f:
+            oauth = json.load(f)
+    yt = providers.ytmusic_client(args.client_secrets, oauth)
+    count = 0
+    with open(args.labels, encoding="utf-8") as src, open(args.out, "w", encoding="utf-8") as out:
+        for line in src:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            track = (matching.Track.from_dict(row['track']) if 'artist' in row['track']
+                     else matching.track_from_spotify(row['track']))
+            out.write(json.dumps({"track": track.to_dict(), "expected": row.get('expected'),
+                                  "responses": record_queries(yt, track)}) + "\n")
+            count += 1
+            time.sleep(args.delay)
+    print(f"✅ Recorded {count} tracks to {args.out}")
+
+
+# --- REPLAY ---
+def evaluate(corpus_path):
+    tp = fp = fn = tn = 0
+    cpu_ms, unrecorded = [], 0
+    stats = matching.MatchStats()
+    with open(corpus_path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+
+    for row in rows:
+        yt = ReplayYTMusic(row['responses'])
+        track = matching.Track.from_dict(row['track'])
+        start = time.process_time()
+        predicted = matching.resolve_track(yt, track, stats)
+        cpu_ms.append((time.process_time() - start) * 1000)
+        unrecorded += bool(yt.unrecorded)
+
+        expected = row['expected']
+        if predicted is None:
+            fn += expected is not None
+            tn += expected is None
+        elif predicted == expected:
+            tp += 1
+        else:
+            fp += 1
+            fn += expected is not None
+
+    summary = stats.summary()
+    return {
+        "tracks": len(rows),
+        "precision": tp / (tp + fp) if tp + fp else 1.0,
+        "recall": tp / (tp + fn) if tp + fn else 1.0,
+        "fallback_rate": summary['second_queries'] / len(rows) if rows else 0.0,
+        "searches_per_track": summary['searches_per_track'],
+        "unmatched": summary['unmatched'],
+        "wrong": fp,
+        "correct_rejections": tn,
+        "unrecorded_queries": unrecorded,
+        "cpu_ms_mean": float(np.mean(cpu_ms)) if cpu_ms else 0.0,
+        "cpu_ms_p99": float(np.percentile(cpu_ms, 99)) if cpu_ms else 0.0,
+    }
+
+
+def regressions(result, baseline, args):
+    found = []
+    for metric in ("precision", "recall"):
+        if result[metric] < baseline[metric] - args.accuracy_tolerance:
+            found.append(f"{metric} {baseline[metric]:.4f} -> {result[metric]:.4f}")
+    if result['fallback_rate'] > baseline['fallback_rate'] + args.accuracy_tolerance:
+        found.append(f"fallback_rate {baseline['fallback_rate']:.4f} -> {result['fallback_rate']:.4f}")
+    if result['cpu_ms_mean'] > baseline['cpu_ms_mean'] * (1 + args.cpu_tolerance):
+        found.append(f"cpu_ms_mean {baseline['cpu_ms_mean']:.3f} -> {result['cpu_ms_mean']:.3f}")
+    return found
+
+
+def run(args):
+    tracing.logger.disabled = True  # One JSON line per span would dominate the CPU timings
+    result = evaluate(args.corpus)
+    print(f"\n🎯 {result['tracks']} tracks from {args.corpus}")
+    print(f"   precision          {result['precision']:.4f}")
+    print(f"   recall             {result['recall']:.4f}")
+    print(f"   fallback rate      {result['fallback_rate']:.4f}  ({result['searches_per_track']:.2f} searches/track)")
+    print(f"   wrong matches      {result['wrong']}  | unmatched {result['unmatched']}")
+    print(f"   cpu per track      mean {result['cpu_ms_mean']:.3f} ms | p99 {result['cpu_ms_p99']:.3f} ms")
+    if result['unrecorded_queries']:
+        print(f"   ⚠️ {result['unrecorded_queries']} tracks issued queries missing from the corpus; re-record it")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Baseline saved to {args.save_baseline}")
+
+    failed = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            failed = regressions(result, json.load(f), args)
+    if result['precision'] < args.min_precision:
+        failed.append(f"precision {result['precision']:.4f} < {args.min_precision}")
+    if result['recall'] < args.min_recall:
+        failed.append(f"recall {result['recall']:.4f} < {args.min_recall}")
+
+    if failed:
+        print("❌ Regression: " + "; ".join(failed))
+        sys.exit(1)
+    print("✅ No regressions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    fake = sub.add_parser("build-fake", help="Label and record a corpus from the offline fakes")
+    fake.add_argument("--out", default="match_corpus.jsonl")
+    fake.add_argument("--limit", type=int, default=None)
+    fake.add_argument("--missing-rate", type=float, default=0.1,
+                      help="Share of first pages without the official upload")
+    fake.add_argument("--seed", type=int, default=5)
+    fake.set_defaults(func=build_fake)
+
+    rec = sub.add_parser("record", help="Record live YT Music responses for a labeled track file")
+    rec.add_argument("--labels", required=True)
+    rec.add_argument("--out", default="match_corpus.jsonl")
+    rec.add_argument("--client-secrets", default="client_secret.json")
+    rec.add_argument("--oauth", help="JSON file with Google OAuth credentials")
+    rec.add_argument("--delay", type=float, default=0.5, help="Seconds between tracks")
+    rec.set_defaults(func=record)
+
+    replay = sub.add_parser("run", help="Replay a corpus through the matcher")
+    replay.add_argument("--corpus", default="match_corpus.jsonl")
+    replay.add_argument("--baseline", help="Fail if results regress against this saved run")
+    replay.add_argument("--save-baseline", help="Write this run's results as the new baseline")
+    replay.add_argument("--accuracy-tolerance", type=float, default=0.005)
+    replay.add_argument("--cpu-tolerance", type=float, default=0.25, help="Allowed relative CPU time growth")
+    replay.add_argument("--min-precision", type=float, default=0.0)
+    replay.add_argument("--min-recall", type=float, default=0.0)
+    replay.set_defaults(func=run)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+"""
+Speed and quality harness for quiz generation (services/quiz_pipeline).
+
+Builds a fixture lyric corpus from the fake catalog (fakes.synthetic_lyrics, chunked like
+quick_ingest), stores it in a Chroma collection (and, with --distractor-index compact, a
+CompactVectorStore) and runs the quiz_pipeline functions generate_batch_quiz runs:
+sample_contexts -> plan_questions (distractors, templates, prompts) -> generate_questions
+(cache -> LLM -> parse/validate/repair, with LLM retries within QUIZ_REPAIR_DEADLINE_S),
+timed per stage through their on_stage hooks. Questions the LLM can't deliver are counted
+as template fallbacks, as in the API.
+The LLM is the offline FakeGemini, a replay of recorded responses, or the live API.
+
+Reports per-stage latency, tokens per question, JSON-schema validity, the
+correct-answer-in-options rate (before and after repair), retry spend and how similar
+distractors are to the correct song.
+
+Run from /backend:
+    python -m benchmarks.bench_quiz --batches 20 --questions 10
+    FAKE_GEMINI_MALFORMED_RATE=0.1 QUIZ_REPAIR_DEADLINE_S=1 python -m benchmarks.bench_quiz --concurrency 4
+    python -m benchmarks.bench_quiz --llm live --record quiz_replay.jsonl   # needs GEMINI_API_KEY
+    python -m benchmarks.bench_quiz --llm replay --replay quiz_replay.jsonl
+"""
+import os
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from pydantic import ValidationError
+from services import fakes, tracing
+from services.compact_store import CompactVectorStore
+from services.quiz_cache import QuizCache
+from services.quiz_pipeline import (QuizQuestion, PROMPT_VERSION, GEMINI_MODEL, MAX_LLM_RETRIES,
+                                    question_mode, parse_question, validate_question, option_label,
+                                    generate_questions, sample_contexts, plan_questions)
+
+DIM = 384
+STAGES = ("sample_contexts", "distractors", "template", "prompt", "cache", "llm", "validate")
+DEFAULT_PLAYLISTS = ["fake-classic-rock", "fake-modern-mix", "fake-large-200"]
+
+
+# --- FIXTURE CORPUS ---
+def load_embedder(name):
+    if name == "minilm":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer('all-MiniLM-L6-v2')
+    return fakes.FakeEmbedder(DIM)
+
+
+def build_corpus(embedder, playlists):
+    """Chunks and embeds every fixture song 4 lines at a time, like quick_ingest."""
+    catalog = fakes.load_catalog()
+    corpus = {"ids": [], "docs": [], "metas": [], "tracks": {}}
+    for playlist_id in playlists:
+        tracks = []
+        for t in catalog[playlist_id]['tracks']:
+            artist = t['artists'][0]['name']
+            tracks.append({"name": t['name'], "artist": artist})
+            lines = [line for line in fakes.synthetic_lyrics(t['name'], artist).split('\n') if line.strip()]
+            for i in range(0, len(lines), 4):
+                corpus['ids'].append(f"{artist}_{t['name']}_{i}")
+                corpus['docs'].append("\n".join(lines[i:i + 4]))
+                corpus['metas'].append({"song": t['name'], "artist": artist})
+        corpus['tracks'][playlist_id] = tracks
+
+    embeds = embedder.encode(corpus['docs'])
+    corpus['embeds'] = np.asarray(embeds, dtype=np.float32)
+
+    # Song centroids for distractor-similarity scoring
+    by_song = {}
+    for meta, vec in zip(corpus['metas'], corpus['embeds']):
+        by_song.setdefault(option_label(meta['song'], meta['artist']), []).append(vec)
+    corpus['centroids'] = {k: np.mean(v, axis=0) / max(np.linalg.norm(np.mean(v, axis=0)), 1e-9)
+                           for k, v in by_song.items()}
+    return corpus
+
+
+def _matches(meta, where):
+    """The subset of Chroma's where-filters quiz_pipeline uses: field equality, $ne, $and, $or."""
+    if not where:
+        return True
+    if "$and" in where:
+        return all(_matches(meta, w) for w in where["$and"])
+    if "$or" in where:
+        return any(_matches(meta, w) for w in where["$or"])
+    field, cond = next(iter(where.items()))
+    if isinstance(cond, dict):
+        return meta.get(field) != cond["$ne"]
+    return meta.get(field) == cond
+
+
+class FixtureCollection:
+    """In-memory stand-in for the Chroma collection (get/query only) when chromadb isn't installed."""
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def _rows(self, where):
+        return [r for r, m in enumerate(self.corpus['metas']) if _matches(m, where)]
+
+    def get(self, where=None, limit=None, include=()):
+        rows = self._rows(where)[:limit]
+        return {"ids": [self.corpus['ids'][r] for r in rows],
+                "documents": [self.corpus['docs'][r] for r in rows],
+                "metadatas": [self.corpus['metas'][r] for r in rows],
+                "embeddings": self.corpus['embeds'][rows]}
+
+    def query(self, query_embeddings, n_results=5, where=None):
+        rows = np.asarray(self._rows(where), dtype=np.int64)
+        result = {"ids": [], "metadatas": []}
+        for q in query_embeddings:
+            top = rows[np.argsort(-(self.corpus['embeds'][rows] @ np.asarray(q, dtype=np.float32)))[:n_results]]
+            result["ids"].append([self.corpus['ids'][r] for r in top])
+            result["metadatas"].append([self.corpus['metas'][r] for r in top])
+        return result
+
+
+def open_collection(path, corpus):
+    """The lyrics collection the API reads, filled with the fixture corpus."""
+    try:
+        import chromadb
+    except ImportError:
+        print("⚠️ chromadb is not installed: sample_contexts and Chroma distractor queries "
+              "time an in-memory stand-in, not Chroma")
+        return FixtureCollection(corpus)
+    collection = chromadb.PersistentClient(path=path).get_or_create_collection(name="lyrics_knowledge_base")
+    for i in range(0, len(corpus['ids']), 5000):
+        collection.upsert(ids=corpus['ids'][i:i + 5000], documents=corpus['docs'][i:i + 5000],
+                          embeddings=corpus['embeds'][i:i + 5000].tolist(), metadatas=corpus['metas'][i:i + 5000])
+    return collection
+
+
+# --- LLMS ---
+def _prompt_key(model, contents):
+    return hashlib.sha1(f"{PROMPT_VERSION}\x1f{model}\x1f{contents}".encode("utf-8")).hexdigest()
+
+
+class ReplayLLM:
+    """Serves recorded responses keyed by (prompt version, model, prompt)."""
+
+    def __init__(self, path):
+        self.responses = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    self.responses[row['key']] = row
+        self.models = self
+
+    def generate_content(self, model, contents, config=None):
+        row = self.responses.get(_prompt_key(model, contents))
+        if row is None:
+            raise KeyError("prompt not in replay file (prompt or model changed since recording?)")
+        return fakes.FakeResponse(row['text'], fakes.FakeUsage(row['prompt_tokens'], row['output_tokens']))
+
+
+class RecordingLLM:
+    """Wraps another LLM client and appends every response to a replay file."""
+
+    def __init__(self, inner, path):
+        self.inner = inner
+        self.file = open(path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.models = self
+
+    def generate_content(self, model, contents, config=None):
+        resp = self.inner.models.generate_content(model=model, contents=contents, config=config)
+        prompt_tokens, output_tokens = usage_tokens(resp, contents)
+        with self.lock:
+            self.file.write(json.dumps({"key": _prompt_key(model, contents), "text": resp.text,
+                                        "prompt_tokens": prompt_tokens, "output_tokens": output_tokens}) + "\n")
+            self.file.flush()
+        return resp
+
+
+def usage_tokens(resp, prompt):
+    usage = getattr(resp, "usage_metadata", None)
+    if usage is not None and getattr(usage, "prompt_token_count", None) is not None:
+        return usage.prompt_token_count, usage.candidates_token_count or 0
+    return len(prompt) // 4, len(resp.text or "") // 4  # ~4 characters per token
+
+
+def load_llm(args):
+    if args.llm == "replay":
+        llm = ReplayLLM(args.replay)
+    elif args.llm == "live":
+        from google import genai
+        llm = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+    else:
+        llm = fakes.FakeGemini()
+    return RecordingLLM(llm, args.record) if args.record else llm
+
+
+# --- PIPELINE ---
+def _distractor_similarity(row, meta, distractors, corpus):
+    correct = corpus['centroids'][option_label(meta['song'], meta['artist'])]
+    sims = [float(correct @ corpus['centroids'][d]) for d in distractors if d in corpus['centroids']]
+    if sims:
+        row['distractor_similarity'] = float(np.mean(sims))
+
+
+def score_answer(row, text):
+    """Quality of the LLM's first answer, before any repair."""
+    try:
+        q_data = parse_question(text, row['mode'])
+        row['json_ok'] = True
+    except ValueError:
+        q_data, row['json_ok'] = None, False
+    try:
+        QuizQuestion.model_validate_json(text or "")
+        row['schema_ok'] = True
+    except ValidationError:
+        row['schema_ok'] = False
+    if q_data is not None:
+        options = q_data.get('options') or []
+        row['four_options'] = len(options) == 4
+        row['correct_in_options'] = q_data.get('correct_answer') in options
+
+
+def run_batch(playlist_id, num_questions, collection, vector_index, llm, corpus, timings, args, cache):
+    """One generate_batch_quiz call, through the same quiz_pipeline functions and stores."""
+    clean_tracks = corpus['tracks'][playlist_id]
+    t0 = time.perf_counter()
+    contexts = sample_contexts(collection, clean_tracks)
+    timings['sample_contexts'].append(time.perf_counter() - t0)
+    if not contexts['documents']:
+        return []
+    rows = [{"mode": question_mode(i, num_questions)} for i in range(num_questions)]
+
+    def on_plan(i, stage, seconds, **info):
+        timings[stage].append(seconds)
+        row = rows[i]
+        if stage == "distractors" and info['distractors']:
+            _distractor_similarity(row, info['meta'], info['distractors'], corpus)
+        elif stage == "template" and info['served']:
+            q_data = info['question']
+            row.update(template=True, prompt_tokens=0, output_tokens=0, json_ok=True, schema_ok=True,
+                       four_options=len(q_data['options']) == 4,
+                       correct_in_options=q_data['correct_answer'] in q_data['options'],
+                       repaired=False, retried=False, playable=not validate_question(q_data))
+
+    _, llm_slots, specs, fallbacks = plan_questions(contexts, num_questions, clean_tracks, vector_index,
+                                                    template_share=args.template_share, on_stage=on_plan)
+
+    def on_stage(j, stage, seconds, **info):
+        timings[stage].append(seconds)
+        row = rows[llm_slots[j]]
+        if stage == "cache":
+            row['cache_hit'] = info['hit']
+        elif stage == "llm":
+            row['retried'] = row.get('retried', False) or info['retry']
+            if 'error' in info:
+                row.setdefault('error', type(info['error']).__name__)
+                return
+            row.pop('error', None)
+            prompt_tokens, output_tokens = usage_tokens(info['resp'], info['prompt'])
+            row['prompt_tokens'] = row.get('prompt_tokens', 0) + prompt_tokens
+            row['output_tokens'] = row.get('output_tokens', 0) + output_tokens
+            if not info['retry']:
+                score_answer(row, getattr(info['resp'], "text", None))
+        else:
+            row['repaired'] = info['outcome'] == "repaired"
+
+    answers, _ = generate_questions(llm, specs, max_retries=args.retries, cache=cache, on_stage=on_stage)
+    for i, answer in zip(llm_slots, answers):
+        row = rows[i]
+        if row.get('cache_hit'):
+            row.update(prompt_tokens=0, output_tokens=0, json_ok=True, schema_ok=True,
+                       four_options=len(answer['options']) == 4,
+                       correct_in_options=answer['correct_answer'] in answer['options'],
+                       repaired=False, retried=False)
+        row.setdefault('repaired', False)
+        row['playable'] = answer is not None and not validate_question(answer)
+        # Like generate_batch_quiz: a question the LLM couldn't deliver is served from its template
+        row['fallback'] = answer is None and fallbacks[i] is not None
+    return rows
+
+
+def rate(rows, key):
+    values = [r[key] for r in rows if key in r]
+    return sum(values) / len(values) if values else float("nan")
+
+
+def summarize(rows, timings, batch_seconds):
+    answered = [r for r in rows if "error" not in r]
+    hard = [r for r in rows if r['mode'] == "Hard"]
+    tokens = [r['prompt_tokens'] + r['output_tokens'] for r in answered]
+    return {
+        "questions": len(rows),
+        "llm_errors": len(rows) - len(answered),
+        "json_valid_rate": rate(answered, "json_ok"),
+        "schema_valid_rate": rate(answered, "schema_ok"),
+        "four_options_rate": rate(answered, "four_options"),
+        "correct_in_options_rate": rate(answered, "correct_in_options"),
+        "template_rate": sum(1 for r in rows if r.get('template')) / len(rows) if rows else 0.0,
+        "cache_hit_rate": sum(1 for r in rows if r.get('cache_hit')) / len(rows) if rows else 0.0,
+        "fallback_rate": sum(1 for r in rows if r.get('fallback')) / len(rows) if rows else 0.0,
+        "repaired_rate": rate(answered, "repaired"),
+        "retry_rate": rate(answered, "retried"),
+        "playable_rate": rate(answered, "playable"),
+        "distractor_similarity_mean": rate(hard, "distractor_similarity"),
+        "tokens_per_question": float(np.mean(tokens)) if tokens else 0.0,
+        "prompt_tokens_per_question": float(np.mean([r['prompt_tokens'] for r in answered])) if answered else 0.0,
+        "batch_p50_ms": float(np.percentile(batch_seconds, 50) * 1000) if batch_seconds else 0.0,
+        "batch_p95_ms": float(np.percentile(batch_seconds, 95) * 1000) if batch_seconds else 0.0,
+        "stages_ms": {stage: {"p50": float(np.percentile(v, 50) * 1000), "p95": float(np.percentile(v, 95) * 1000)}
+                      for stage, v in timings.items() if v},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batches", type=int, default=10, help="generate_batch_quiz calls to simulate")
+    parser.add_argument("--questions", type=int, default=10, help="Questions per batch")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Batches generated in parallel (like concurrent quiz requests)")
+    parser.add_argument("--retries", type=int, default=MAX_LLM_RETRIES,
+                        help="LLM retries for answers local repair can't fix (QUIZ_MAX_LLM_RETRIES)")
+    parser.add_argument("--template-share", type=float, default=0.0,
+                        help="Share of questions built from templates instead of the LLM")
+    parser.add_argument("--cache", action="store_true", help="Serve repeat questions from a fresh QuizCache")
+    parser.add_argument("--playlists", nargs="+", default=DEFAULT_PLAYLISTS)
+    parser.add_argument("--embedder", choices=["hashing", "minilm"], default="hashing")
+    parser.add_argument("--distractor-index", choices=["chroma", "compact"], default="chroma",
+                        help="Where hard-question distractors are searched (compact = COMPACT_STORE_PATH set)")
+    parser.add_argument("--llm", choices=["fake", "replay", "live"], default="fake")
+    parser.add_argument("--replay", help="Replay file for --llm replay")
+    parser.add_argument("--record", help="Append every LLM response to this replay file")
+    parser.add_argument("--seed", type=int, default=3)
+    parser.add_argument("--json", help="Also write the summary to this file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("FAKE_GEMINI_LATENCY_MS", "200")
+    tracing.logger.disabled = True
+    random.seed(args.seed)
+
+    path = tempfile.mkdtemp(prefix="melodymind_quiz_bench_")
+    try:
+        t0 = time.perf_counter()
+        corpus = build_corpus(load_embedder(args.embedder), args.playlists)
+        collection = open_collection(os.path.join(path, "chroma_db"), corpus)
+        vector_index = collection
+        if args.distractor_index == "compact":
+            vector_index = CompactVectorStore(os.path.join(path, "compact_store"), dim=DIM, dtype="float16")
+            vector_index.upsert(corpus['ids'], corpus['embeds'], corpus['metas'])
+        print(f"📚 Fixture corpus: {len(corpus['docs'])} chunks from {len(corpus['centroids'])} songs "
+              f"({time.perf_counter() - t0:.1f}s)")
+
+        llm = load_llm(args)
+        cache = QuizCache(os.path.join(path, "quiz_cache")) if args.cache else None
+        timings = {stage: [] for stage in STAGES}
+        rows, batch_seconds = [], []
+
+        def timed_batch(b):
+            start = time.perf_counter()
+            batch = run_batch(args.playlists[b % len(args.playlists)], args.questions,
+                              collection, vector_index, llm, corpus, timings, args, cache)
+            batch_seconds.append(time.perf_counter() - start)
+            return batch
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for batch in pool.map(timed_batch, range(args.batches)):
+                rows.extend(batch)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    result = summarize(rows, timings, batch_seconds)
+    print(f"\n🧪 {result['questions']} questions in {args.batches} batches "
+          f"(concurrency {args.concurrency}, llm={args.llm}, prompt v{PROMPT_VERSION}, {GEMINI_MODEL})")
+    print(f"{'stage':<18}{'p50 ms':>10}{'p95 ms':>10}")
+    for stage, v in result['stages_ms'].items():
+        print(f"{stage:<18}{v['p50']:>10.2f}{v['p95']:>10.2f}")
+    print(f"{'batch end-to-end':<18}{result['batch_p50_ms']:>10.0f}{result['batch_p95_ms']:>10.0f}")
+    print(f"\n   LLM errors              {result['llm_errors']}")
+    print(f"   JSON valid              {result['json_valid_rate']:.3f}")
+    print(f"   schema valid            {result['schema_valid_rate']:.3f}")
+    print(f"   exactly 4 options       {result['four_options_rate']:.3f}")
+    print(f"   correct answer listed   {result['correct_in_options_rate']:.3f}")
+    print(f"   built from templates    {result['template_rate']:.3f}")
+    print(f"   served from cache       {result['cache_hit_rate']:.3f}")
+    print(f"   repaired locally        {result['repaired_rate']:.3f}")
+    print(f"   re-asked the LLM        {result['retry_rate']:.3f}")
+    print(f"   playable after repair   {result['playable_rate']:.3f}")
+    print(f"   template fallbacks      {result['fallback_rate']:.3f}")
+    print(f"   distractor similarity   {result['distractor_similarity_mean']:.3f} (hard questions)")
+    print(f"   tokens / question       {result['tokens_per_question']:.0f} "
+          f"({result['prompt_tokens_per_question']:.0f} prompt)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Peak memory of the track records a transfer holds while it runs.
+
+Streams synthetic Spotify playlist pages (full nested track objects, JSON-decoded like
+spotipy's so every string is a fresh object) and keeps `--jobs` playlists' worth of
+records alive at once, like concurrent transfers do. Each variant runs in a fresh process
+so ru_maxrss reflects only that variant:
+
+    stream  keeps nothing (the floor every variant pays for streaming pages)
+    raw     keeps the Spotify track objects
+    dict    keeps per-track dicts (the record transfers used before matching.Track)
+    track   keeps matching.Track records (__slots__, interned artist/album strings)
+
+Peak RSS per 10k tracks is (variant peak - stream peak) scaled to 10k tracks.
+
+Run from /backend:
+    python -m benchmarks.bench_track_memory --tracks 10000 --jobs 4
+"""
+import json
+import queue
+import random
+import argparse
+import resource
+import multiprocessing as mp
+
+MARKETS = ["AD", "AR", "AT", "AU", "BE", "BR", "CA", "CH", "DE", "DK", "ES", "FI", "FR", "GB",
+           "IE", "IT", "JP", "MX", "NL", "NO", "NZ", "PL", "PT", "SE", "US"]
+
+
+def _artist(name):
+    artist_id = f"{abs(hash(name)) % 10 ** 22:022d}"
+    return {"external_urls": {"spotify": f"https://open.spotify.com/artist/{artist_id}"},
+            "href": f"https://api.spotify.com/v1/artists/{artist_id}", "id": artist_id,
+            "name": name, "type": "artist", "uri": f"spotify:artist:{artist_id}"}
+
+
+def _track(rng, n, artist_pool):
+    # A few artists cover most of a library, like real playlists
+    artists = [_artist(a) for a in {rng.choice(artist_pool[:50] if rng.random() < 0.6 else artist_pool)
+                                    for _ in range(1 + (rng.random() < 0.25))}]
+    track_id = f"{n:022d}"
+    album = f"Album {rng.randrange(len(artist_pool) * 3)}"
+    return {
+        "album": {"album_type": "album", "artists": artists[:1], "available_markets": MARKETS,
+                  "id": f"a{n:021d}", "images": [{"height": h, "width": h, "url": f"https://i.scdn.co/image/{n}-{h}"}
+                                                for h in (640, 300, 64)],
+                  "name": album, "release_date": "2011-01-01", "total_tracks": 12, "type": "album"},
+        "artists": artists,
+        "available_markets": MARKETS,
+        "disc_number": 1,
+        "duration_ms": rng.randrange(120_000, 360_000),
+        "explicit": False,
+        "external_ids": {"isrc": f"GB{n:010d}"},
+        "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+        "href": f"https://api.spotify.com/v1/tracks/{track_id}",
+        "id": track_id,
+        "name": f"Song {n}",
+        "popularity": rng.randrange(100),
+        "preview_url": None,
+        "track_number": rng.randrange(1, 13),
+        "type": "track",
+        "uri": f"spotify:track:{track_id}",
+    }
+
+
+def pages(n_tracks, seed, page_size=100):
+    """Playlist pages as spotipy returns them: freshly decoded JSON, one page at a time."""
+    rng = random.Random(seed)
+    artist_pool = [f"Artist {i}" for i in range(max(50, n_tracks // 20))]
+    for start in range(0, n_tracks, page_size):
+        items = [{"added_at": "2024-01-01T00:00:00Z", "track": _track(rng, n, artist_pool)}
+                 for n in range(start, min(start + page_size, n_tracks))]
+        yield json.loads(json.dumps({"items": items}))
+
+
+def dict_record(track):
+    """The per-track dict transfers kept before matching.Track."""
+    artists = [a['name'] for a in track.get('artists') or [] if a.get('name')]
+    return {
+        "id": track['id'],
+        "name": track['name'],
+        "artist": artists[0] if artists else "",
+        "artists": artists,
+        "album": (track.get('album') or {}).get('name'),
+        "duration_ms": track.get('duration_ms'),
+        "isrc": (track.get('external_ids') or {}).get('isrc'),
+    }
+
+
+def run_variant(variant, n_tracks, jobs, seed, out):
+    """Runs in a fresh process so ru_maxrss reflects only this variant."""
+    try:
+        out.put(measure_variant(variant, n_tracks, jobs, seed))
+    except Exception as e:
+        out.put({"variant": variant, "error": f"{type(e).__name__}: {e}"})
+
+
+def measure_variant(variant, n_tracks, jobs, seed):
+    from services.matching import track_from_spotify
+    reduce = {"stream": None, "raw": lambda t: t, "dict": dict_record, "track": track_from_spotify}[variant]
+
+    held = []
+    for job in range(jobs):
+        records = []
+        for page in pages(n_tracks, seed + job):
+            if reduce is not None:
+                records.extend(reduce(item['track']) for item in page['items'] if item['track'])
+        held.append(records)
+
+    return {"variant": variant, "records": sum(len(r) for r in held),
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def wait_result(proc, out, poll_s=5.0):
+    """The child's result, or an error row if it exited (crashed, OOM-killed...) without one."""
+    while True:
+        try:
+            return out.get(timeout=poll_s)
+        except queue.Empty:
+            if not proc.is_alive():
+                try:
+                    return out.get(timeout=1.0)  # Sent just before exiting
+                except queue.Empty:
+                    return {"error": f"exited with code {proc.exitcode}"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tracks", type=int, default=10_000, help="Tracks per playlist (per job)")
+    parser.add_argument("--jobs", type=int, default=4, help="Transfers whose records are alive at once")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--variants", nargs="+", default=["raw", "dict", "track"])
+    parser.add_argument("--json", help="Also write the results table to this file")
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    rows = []
+    for variant in ["stream", *args.variants]:
+        out = ctx.Queue()
+        proc = ctx.Process(target=run_variant, args=(variant, args.tracks, args.jobs, args.seed, out))
+        proc.start()
+        result = wait_result(proc, out)
+        proc.join()
+        if "error" in result:
+            print(f"   ❌ {variant}: {result['error']}")
+            if variant == "stream":
+                raise SystemExit("The streaming floor failed; nothing to compare against.")
+            continue
+        rows.append(result)
+
+    floor = rows[0]['peak_rss_mb']
+    total = args.tracks * args.jobs
+    print(f"\n🧠 {args.jobs} jobs x {args.tracks} tracks (streaming floor {floor:.1f} MB peak RSS)")
+    for result in rows[1:]:
+        result['mb_per_10k_tracks'] = (result['peak_rss_mb'] - floor) * 10_000 / total
+        print(f"   {result['variant']:<6} peak RSS {result['peak_rss_mb']:7.1f} MB | "
+              f"{result['mb_per_10k_tracks']:6.2f} MB per 10k tracks")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
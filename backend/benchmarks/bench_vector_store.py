@@ -0,0 +1,164 @@
+"""
+Compares the Chroma path against CompactVectorStore (float16 / int8 / int8 + rescore)
+on recall@k, peak RAM, disk size and query latency.
+
+Run from /backend:
+    python -m benchmarks.bench_vector_store --chunks 200000 --queries 200 --k 10
+"""
+import os
+import time
+import json
+import queue
+import shutil
+import argparse
+import resource
+import tempfile
+import multiprocessing as mp
+import numpy as np
+
+DIM = 384
+
+
+def make_corpus(n_chunks, chunks_per_song, seed):
+    """Clustered unit vectors: chunks of the same song sit near a shared song direction."""
+    rng = np.random.default_rng(seed)
+    n_songs = max(1, n_chunks // chunks_per_song)
+    centers = rng.standard_normal((n_songs, DIM)).astype(np.float32)
+    songs = rng.integers(0, n_songs, size=n_chunks)
+    vectors = centers[songs] + 0.6 * rng.standard_normal((n_chunks, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, songs
+
+
+def exact_top_k(vectors, songs, query_rows, k):
+    """Float32 brute-force ground truth, excluding the query's own song like the quiz does."""
+    truth = []
+    for row in query_rows:
+        scores = vectors @ vectors[row]
+        scores[songs == songs[row]] = -np.inf
+        truth.append(set(np.argpartition(-scores, k)[:k].tolist()))
+    return truth
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, f))
+               for root, _, files in os.walk(path) for f in files)
+
+
+def run_variant(variant, data_path, query_rows, k, out):
+    """Runs in a fresh process so ru_maxrss reflects only this variant."""
+    try:
+        out.put(measure_variant(variant, data_path, query_rows, k))
+    except Exception as e:
+        out.put({"variant": variant, "error": f"{type(e).__name__}: {e}"})
+
+
+def measure_variant(variant, data_path, query_rows, k):
+    vectors = np.load(os.path.join(data_path, "vectors.npy"), mmap_mode="r")
+    songs = np.load(os.path.join(data_path, "songs.npy"), mmap_mode="r")
+    ids = [str(i) for i in range(len(vectors))]
+    metas = [{"song": str(s), "artist": "bench"} for s in songs.tolist()]
+    store_path = os.path.join(data_path, variant)
+    batch = 5000
+
+    start = time.perf_counter()
+    if variant == "chroma":
+        import chromadb
+        client = chromadb.PersistentClient(path=store_path)
+        store = client.get_or_create_collection(name="bench", metadata={"hnsw:space": "cosine"})
+        for i in range(0, len(vectors), batch):
+            store.add(ids=ids[i:i + batch], embeddings=np.asarray(vectors[i:i + batch]).tolist(),
+                      metadatas=metas[i:i + batch])
+    else:
+        from services.compact_store import CompactVectorStore
+        dtype, _, rescore = variant.partition("+")
+        store = CompactVectorStore(store_path, dim=DIM, dtype=dtype, rescore=bool(rescore))
+        for i in range(0, len(vectors), batch):
+            store.upsert(ids[i:i + batch], np.asarray(vectors[i:i + batch]), metas[i:i + batch])
+    build_s = time.perf_counter() - start
+
+    latencies = []
+    found = []
+    for row in query_rows:
+        t0 = time.perf_counter()
+        res = store.query(query_embeddings=[np.asarray(vectors[row]).tolist()], n_results=k,
+                          where={"song": {"$ne": str(songs[row])}})
+        latencies.append(time.perf_counter() - t0)
+        found.append({int(i) for i in res['ids'][0]})
+
+    return {
+        "variant": variant,
+        "build_s": build_s,
+        "found": [sorted(f) for f in found],
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "disk_mb": dir_size(store_path) / 1e6,
+    }
+
+
+def wait_result(proc, out, poll_s=5.0):
+    """The child's result, or an error row if it exited (crashed, OOM-killed...) without one."""
+    while True:
+        try:
+            return out.get(timeout=poll_s)
+        except queue.Empty:
+            if not proc.is_alive():
+                try:
+                    return out.get(timeout=1.0)  # Sent just before exiting
+                except queue.Empty:
+                    return {"error": f"exited with code {proc.exitcode}"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--chunks-per-song", type=int, default=12)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--variants", nargs="+",
+                        default=["chroma", "float16", "int8", "int8+rescore"])
+    parser.add_argument("--json", help="Also write the results table to this file")
+    args = parser.parse_args()
+
+    print(f"⏳ Building {args.chunks} synthetic chunks...")
+    vectors, songs = make_corpus(args.chunks, args.chunks_per_song, args.seed)
+    query_rows = np.random.default_rng(args.seed + 1).choice(len(vectors), args.queries, replace=False)
+    truth = exact_top_k(vectors, songs, query_rows, args.k)
+
+    data_path = tempfile.mkdtemp(prefix="melodymind_bench_")
+    np.save(os.path.join(data_path, "vectors.npy"), vectors)
+    np.save(os.path.join(data_path, "songs.npy"), songs)
+    del vectors
+
+    ctx = mp.get_context("spawn")
+    rows = []
+    try:
+        for variant in args.variants:
+            out = ctx.Queue()
+            proc = ctx.Process(target=run_variant, args=(variant, data_path, query_rows.tolist(), args.k, out))
+            proc.start()
+            result = wait_result(proc, out)
+            proc.join()
+            if "error" in result:
+                print(f"   ❌ {variant}: {result['error']}")
+                continue
+
+            hits = [len(truth[i] & set(f)) / args.k for i, f in enumerate(result.pop("found"))]
+            result["recall_at_k"] = float(np.mean(hits))
+            rows.append(result)
+            print(f"   ✅ {variant}: recall@{args.k}={result['recall_at_k']:.3f} "
+                  f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+                  f"peak RSS={result['peak_rss_mb']:.0f}MB disk={result['disk_mb']:.1f}MB "
+                  f"build={result['build_s']:.1f}s")
+    finally:
+        shutil.rmtree(data_path, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Offline load test for /start_trivia, /start_transfer and /transfer_status.
+
+By default it starts its own uvicorn server with MELODYMIND_PROVIDERS=fake (so nothing
+leaves the machine and no embedding model is downloaded) and a throwaway Chroma directory,
+then runs `--users` concurrent virtual users for `--duration` seconds and reports
+throughput and latency percentiles.
+
+Run from /backend:
+    python -m loadtest.driver --users 20 --duration 60
+    FAKE_GEMINI_LATENCY_MS=3000 FAKE_ERROR_RATE=0.02 python -m loadtest.driver --users 50
+    python -m loadtest.driver --url http://127.0.0.1:8000   # against an already running server
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import httpx
+
+DEFAULT_PLAYLISTS = ["fake-classic-rock", "fake-modern-mix", "fake-large-200"]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, name, seconds, ok):
+        self.latencies.setdefault(name, []).append(seconds)
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, elapsed):
+        rows = []
+        for name, values in sorted(self.latencies.items()):
+            rows.append({
+                "name": name,
+                "count": len(values),
+                "errors": self.errors.get(name, 0),
+                "rps": len(values) / elapsed,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p90_ms": percentile(values, 90) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "max_ms": max(values) * 1000,
+            })
+        return rows
+
+
+async def timed(client, recorder, name, method, path, **kwargs):
+    start = time.perf_counter()
+    try:
+        resp = await client.request(method, path, **kwargs)
+        ok = resp.status_code < 400
+    except httpx.HTTPError:
+        resp, ok = None, False
+    recorder.record(name, time.perf_counter() - start, ok)
+    return resp
+
+
+async def virtual_user(user_id, client, recorder, args, deadline):
+    rng = random.Random(args.seed + user_id)
+    while time.monotonic() < deadline:
+        playlist_id = rng.choice(args.playlists)
+        body = {"playlist_id": playlist_id, "playlist_name": f"Load test {playlist_id}"}
+
+        if rng.random() < args.transfer_share:
+            started = time.perf_counter()
+            resp = await timed(client, recorder, "POST /start_transfer", "POST", "/start_transfer", json=body)
+            if resp is None or resp.status_code >= 400:
+                continue
+            # Poll like the frontend does until the background transfer settles
+            while time.monotonic() < deadline:
+                await asyncio.sleep(args.poll_interval)
+                status = await timed(client, recorder, "GET /transfer_status", "GET", "/transfer_status")
+                if status is not None and status.status_code == 200 and \
+                        status.json().get("status") in ("completed", "error", "idle"):
+                    recorder.record("transfer end-to-end", time.perf_counter() - started,
+                                    status.json().get("status") == "completed")
+                    break
+        else:
+            await timed(client, recorder, "POST /start_trivia", "POST", "/start_trivia", json=body)
+
+        await asyncio.sleep(rng.expovariate(1 / args.think_time) if args.think_time else 0)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_server(port, state_dir):
+    """Fake-provider server whose on-disk state all lives in `state_dir`, so every run starts cold."""
+    env = dict(os.environ, MELODYMIND_PROVIDERS="fake", TRACE_LOG="0",
+               CHROMA_PATH=os.path.join(state_dir, "chroma_db"),
+               QUIZ_CACHE_PATH=os.path.join(state_dir, "quiz_cache"),
+               PLAYLIST_PROFILE_PATH=os.path.join(state_dir, "playlist_profiles"),
+               SYNC_STATE_PATH=os.path.join(state_dir, "sync_state.json"))
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env,
+    )
+
+
+async def wait_until_up(url, timeout=120):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/metrics")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"Server at {url} did not come up within {timeout}s")
+
+
+async def run(args):
+    recorder = Recorder()
+    timeout = httpx.Timeout(args.request_timeout)
+    limits = httpx.Limits(max_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=args.url, timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        deadline = time.monotonic() + args.duration
+        await asyncio.gather(*(virtual_user(i, client, recorder, args, deadline) for i in range(args.users)))
+        elapsed = time.perf_counter() - start
+        metrics = (await client.get("/metrics")).text
+    return recorder.summary(elapsed), elapsed, metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Target an existing server instead of spawning a fake-provider one")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--transfer-share", type=float, default=0.3, help="Share of users' actions that are transfers")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean pause between actions (seconds)")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Matches the frontend's polling")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--playlists", nargs="+", default=DEFAULT_PLAYLISTS)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Write the summary rows to this file")
+    parser.add_argument("--metrics-out", help="Save the server's /metrics snapshot to this file")
+    args = parser.parse_args()
+
+    server = state_dir = None
+    if not args.url:
+        port = free_port()
+        args.url = f"http://127.0.0.1:{port}"
+        state_dir = tempfile.mkdtemp(prefix="melodymind_load_")
+        server = spawn_server(port, state_dir)
+        print(f"🚀 Started fake-provider server on {args.url}")
+
+    try:
+        asyncio.run(wait_until_up(args.url))
+        print(f"🔥 {args.users} users for {args.duration:.0f}s against {args.url}...")
+        rows, elapsed, metrics = asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if state_dir is not None:
+            shutil.rmtree(state_dir, ignore_errors=True)
+
+    print(f"\n{'endpoint':<24}{'count':>7}{'errors':>8}{'req/s':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for r in rows:
+        print(f"{r['name']:<24}{r['count']:>7}{r['errors']:>8}{r['rps']:>8.2f}"
+              f"{r['p50_ms']:>10.0f}{r['p90_ms']:>10.0f}{r['p99_ms']:>10.0f}{r['max_ms']:>10.0f}")
+    print(f"\n⏱️  {elapsed:.1f}s wall clock")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+    if args.metrics_out:
+        with open(args.metrics_out, "w") as f:
+            f.write(metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,19 @@
-import difflib
 import os
-import random
 from fastapi import FastAPI, BackgroundTasks, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import spotipy
 from dotenv import load_dotenv
 from spotipy.oauth2 import SpotifyOAuth
-from ytmusicapi import YTMusic
-from services.quiz_engine import quick_ingest, generate_batch_quiz
+from services import providers
+from services.quiz_engine import quick_ingest, is_ingested, generate_batch_quiz, song_vectors, engine_stats
+from services.tracing import span, traced, render_prometheus
+from services.playlist_sync import SyncStateStore, sync_playlist
+from services.library_transfer import run_library_transfer
+from services.commit_stage import AdaptiveCommitter
+from services.matching import MatchStats, resolve_track, track_from_spotify
+from services.playlist_profile import PlaylistProfileStore, sample_tracks, sample_first_page
+from services.prefetch import PrefetchScheduler, PREFETCH_PLAYLISTS
 import json
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
@@ -43,7 +47,8 @@ SPOTIFY_CLIENT_ID = os.getenv("SPOTIPY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIPY_CLIENT_SECRET")
 REDIRECT_URI = os.getenv("SPOTIPY_REDIRECT_URI")
 
-sp_oauth = SpotifyOAuth(
+# With MELODYMIND_PROVIDERS=fake no Spotify app credentials are needed (or used)
+sp_oauth = None if providers.use_fakes() else SpotifyOAuth(
     client_id=SPOTIFY_CLIENT_ID,
     client_secret=SPOTIFY_CLIENT_SECRET,
     redirect_uri=REDIRECT_URI,
@@ -55,137 +60,161 @@ user_token_info = None
 # Global store for transfer statuses: { "user_id": {"status": "processing", "error": None} }
 transfer_statuses = {}
 
+# Spotify playlist -> YT Music playlist mapping + snapshot_id for incremental syncs
+sync_state = SyncStateStore()
+playlist_profiles = PlaylistProfileStore()
+
+def fold_song_vectors(playlist_id, tracks):
+    """Adds the lyric vectors of newly ingested songs to the playlist profile's centroid."""
+    missing = playlist_profiles.missing_vectors(playlist_id, tracks)
+    if missing:
+        playlist_profiles.add_song_vectors(playlist_id, song_vectors(missing))
+
+# Warms quiz context for listed playlists while the user is still choosing one, and
+# keeps profile upkeep off the request path
+prefetcher = PrefetchScheduler(quick_ingest, playlist_profiles, fold=fold_song_vectors, is_warm=is_ingested)
+
 class PlaylistRequest(BaseModel):
     playlist_id: str
     playlist_name: str
+    sync: bool = False  # Only apply what changed since the last sync of this playlist
+
+class LibraryTransferRequest(BaseModel):
+    playlists: list[PlaylistRequest]
 
 # --- HELPER FUNCTIONS ---
 def get_spotify_client():
+    if providers.use_fakes():
+        return providers.spotify_client(None)
     if not user_token_info:
         raise HTTPException(status_code=401, detail="Not logged in")
-    return spotipy.Spotify(auth=user_token_info['access_token'])
+    return providers.spotify_client(user_token_info['access_token'])
 
-def find_best_match(results, target_title, target_artist):
-    """
-    Scans top results for a matching artist. 
-    Returns the specific match if found, otherwise returns the top result.
-    """
-    if not results:
+def get_google_oauth_creds():
+    """Maps the stored Google credentials to the dict ytmusicapi expects (None when faked)."""
+    if providers.use_fakes():
         return None
+    raw_creds = user_google_tokens['current_user']
+    return {
+        'access_token': raw_creds['token'],  # Mapping 'token' -> 'access_token'
+        'refresh_token': raw_creds['refresh_token'],
+        'scope': raw_creds['scopes'],
+        'token_type': 'Bearer',
+        'expires_in': 3600 # Approximate, helps library know when to refresh
+    }
 
-    # Normalize target strings
-    t_title = target_title.lower()
-    t_artist = target_artist.lower()
+def fetch_playlist_tracks(sp, playlist_id):
+    """Every track of a playlist (all pages) as compact Track records; raw pages are dropped as they are read."""
+    tracks = []
+    with span("spotify.playlist_items", external="spotify"):
+        page = sp.playlist_items(playlist_id, limit=100)
+    while page:
+        for item in page['items']:
+            track = item['track']
+            if track and track.get('id'):
+                tracks.append(track_from_spotify(track))
+        if not page['next']:
+            break
+        with span("spotify.playlist_items", external="spotify"):
+            page = sp.next(page)
+    return tracks
 
-    # 1. PRIORITY: Look for the correct artist in the top 5 results
-    for item in results[:5]:
-        # Extract result details (YT Music returns a list of artists)
-        res_title = item['title'].lower()
-        res_artists = [a['name'].lower() for a in item['artists']]
-        
-        # Check if the target artist appears in the result's artist list
-        # We use strict containment because "The Beatles" should match "The Beatles"
-        artist_match = any(t_artist in a or a in t_artist for a in res_artists)
+def connect_ytmusic():
+    """
+    Builds and probes the YT Music client. Returns (client, None), or (None, error code) if
+    auth fails; callers record the error under their own status key.
+    """
+    if 'current_user' not in user_google_tokens and not providers.use_fakes():
+        print("❌ User not logged into YouTube Music")
+        return None, "AUTH_EXPIRED"
 
-        # Check title similarity (handles "Remastered", "Radio Edit", etc.)
-        # SequenceMatcher ratio > 0.6 is a loose match, > 0.8 is strong.
-        title_similarity = difflib.SequenceMatcher(None, t_title, res_title).ratio()
+    # 1. Setup Credentials
+    oauth_creds = get_google_oauth_creds()
 
-        if artist_match and title_similarity > 0.7:
-            return item['videoId']
+    try:
+        yt = providers.ytmusic_client(GOOGLE_CLIENT_SECRETS_FILE, oauth_creds)
 
-    # 2. FALLBACK: If no specific artist match found, trust YouTube's top rank
-    print(f" ⚠️ No strict match found for '{target_artist}'. Using top result: {results[0]['title']}")
-    return results[0]['videoId']
+        # PROBE: Verify the connection actually works by asking for the user's library
+        # This forces an error immediately if the credentials are bad
+        yt.get_liked_songs(limit=1)
+        return yt, None
 
+    except Exception as e:
+        # This block catches 401 Unauthorized or 400 Bad Request
+        print(f"⛔ AUTHENTICATION FAILED")
+        return None, "AUTH_EXPIRED"
 
-def run_transfer_task(name, tracks):
+@traced("run_transfer_task")
+def run_transfer_task(playlist_id, name):
     """Background task to move songs to YT Music"""
     # Set initial status
     global transfer_statuses
-    total_tracks = len(tracks)
     
     # Initialize status
     transfer_statuses["current_user"] = {
         "status": "processing",
         "current_song": "Initializing...",
         "progress": 0,
-        "total": total_tracks,
+        "total": 0,
         "error": None
     }
     
     print(f"🚀 Starting Transfer: {name}")
-    # 1. Retrieve the user's token (Logic A: From Memory)
-    if 'current_user' not in user_google_tokens:
-        print("❌ User not logged into YouTube Music")
-        return
-
-    # 1. Setup Credentials
-    raw_creds = user_google_tokens['current_user']
-    oauth_creds = {
-        'access_token': raw_creds['token'],  # Mapping 'token' -> 'access_token'
-        'refresh_token': raw_creds['refresh_token'],
-        'scope': raw_creds['scopes'],
-        'token_type': 'Bearer',
-        'expires_in': 3600 # Approximate, helps library know when to refresh
-    }
-    
-    try:
-        yt = YTMusic(GOOGLE_CLIENT_SECRETS_FILE, oauth_credentials=oauth_creds)
-        
-        # PROBE: Verify the connection actually works by asking for the user's library
-        # This forces an error immediately if the credentials are bad
-        yt.get_liked_songs(limit=1)
-        
-    except Exception as e:
-        # This block catches 401 Unauthorized or 400 Bad Request
-        print(f"⛔ AUTHENTICATION FAILED")
-        transfer_statuses["current_user"] = {"status": "error", "error": "AUTH_EXPIRED"}
+    yt, error = connect_ytmusic()
+    if yt is None:
+        transfer_statuses["current_user"] = {"status": "error", "error": error}
         return
     
+    committer = None
     try:
+        # 1. Read the whole playlist here, not in the request handler: every page is a
+        # blocking Spotify call the user would otherwise wait for
+        transfer_statuses["current_user"]["current_song"] = "Reading playlist..."
+        tracks = fetch_playlist_tracks(get_spotify_client(), playlist_id)
+        total_tracks = len(tracks)
+        transfer_statuses["current_user"]["total"] = total_tracks
+
         # 2. Create the Playlist first
-        pl_id = yt.create_playlist(title=name, description="Transferred by MelodyMind")
+        with span("yt.create_playlist", external="ytmusic"):
+            pl_id = yt.create_playlist(title=name, description="Transferred by MelodyMind")
         print(f"✅ Playlist Created: {pl_id}")
         
-        # 3. Collect Video IDs (Don't add them yet!)
-        video_ids_to_add = []
-        
+        # 3. Search and commit in parallel: matches are queued and added in adaptive
+        # batches from a background thread while the remaining searches run
+        committer = AdaptiveCommitter(yt, pl_id)
+        match_stats = MatchStats()
+        matched = 0
+
         for i, t in enumerate(tracks):
             # Update status for the frontend to see
             transfer_statuses["current_user"].update({
-                "current_song": f"{t['name']} by {t['artist']}",
+                "current_song": f"{t.name} by {t.artist}",
                 "progress": i + 1
             })
             
-            query = f"{t['name']} by {t['artist']}"
-            search = yt.search(query, filter="songs")
-            if search:
-                best_video_id = find_best_match(search, t['name'], t['artist'])
-                if best_video_id:
-                    video_ids_to_add.append(best_video_id)
-                    print(f"   found: {t['name']}")
-                    # yt.add_playlist_items(pl_id, [best_video_id])
-                    # print(f"✅ Added {t['name']}")
-                else:
-                    print(f"❌ Could not find valid match for {t['name']}")  
-                         
-        # 4. Batch Add (Chunks of 50 to avoid timeouts)
-        if video_ids_to_add:
-            transfer_statuses["current_user"]["current_song"] = "Finalizing playlist..."
-            print(f"📥 Batch adding {len(video_ids_to_add)} songs...")
-            
-            chunk_size = 50
-            for i in range(0, len(video_ids_to_add), chunk_size):
-                chunk = video_ids_to_add[i:i + chunk_size]
-                yt.add_playlist_items(pl_id, chunk)
-                print(f"   ✅ Added batch {i // chunk_size + 1}")   
-        
-        # 4. Mark Complete
+            if committer.error is not None:
+                raise committer.error  # The playlist refuses adds: no point searching on
+            best_video_id = resolve_track(yt, t, match_stats)
+            if best_video_id:
+                committer.submit(best_video_id)
+                matched += 1
+                print(f"   found: {t.name}")
+            else:
+                print(f"❌ Could not find valid match for {t.name}")
+
+        # 4. Wait for the last batches to land
+        transfer_statuses["current_user"]["current_song"] = "Finalizing playlist..."
+        print(f"📥 Committing the remaining of {matched} songs...")
+        commit_summary = committer.close()
+        print(f"   ✅ Added {commit_summary['committed']} in {commit_summary['batches']} batches")
+
+        # 5. Mark Complete
         transfer_statuses["current_user"].update({
             "status": "completed",
             "current_song": "All songs added!",
-            "progress": total_tracks
+            "progress": total_tracks,
+            "failed_items": commit_summary['failed'],
+            "match": match_stats.summary()
         })
         print(f"🎉 Transfer Completed Successfully!")
         
@@ -195,41 +224,137 @@ def run_transfer_task(name, tracks):
             "status": "error", 
             "error": str(e)
         }
+    finally:
+        # Stop the commit thread if the job died before close(); a no-op after it
+        if committer is not None:
+            committer.cancel()
+
+@traced("run_sync_task")
+def run_sync_task(playlist_id, name):
+    """Background task: incremental re-transfer that only applies what changed on Spotify"""
+    transfer_statuses["current_user"] = {
+        "status": "processing",
+        "current_song": "Checking for changes...",
+        "progress": 0,
+        "total": 0,
+        "error": None
+    }
+
+    try:
+        sp = get_spotify_client()
+        with span("spotify.playlist", external="spotify"):
+            snapshot_id = sp.playlist(playlist_id, fields="snapshot_id")['snapshot_id']
+
+        # Unchanged since the last sync: nothing to search, add or remove
+        previous = sync_state.get(playlist_id)
+        if previous and previous['snapshot_id'] == snapshot_id:
+            print(f"⏭️  {name} unchanged since last sync")
+            transfer_statuses["current_user"].update({
+                "status": "completed",
+                "current_song": "Already up to date!",
+            })
+            return
 
+        tracks = fetch_playlist_tracks(sp, playlist_id)
+        yt, error = connect_ytmusic()
+        if yt is None:
+            transfer_statuses["current_user"] = {"status": "error", "error": error}
+            return
+
+        def on_progress(done, total, label):
+            transfer_statuses["current_user"].update({"current_song": label, "progress": done, "total": total})
+
+        def add_batch(yt_playlist_id, video_ids):
+            transfer_statuses["current_user"]["current_song"] = "Finalizing playlist..."
+            committer = AdaptiveCommitter(yt, yt_playlist_id)
+            committer.submit(video_ids)
+            return committer.close()
+
+        print(f"🔄 Syncing {name} ({len(tracks)} tracks)")
+        match_stats = MatchStats()
+        summary = sync_playlist(yt, sync_state, playlist_id, name, snapshot_id, tracks,
+                                lambda t: resolve_track(yt, t, match_stats), add_batch, on_progress)
+        print(f"🎉 Sync complete: {summary}")
+        transfer_statuses["current_user"].update({
+            "status": "completed",
+            "current_song": f"Synced: +{summary['added']} / -{summary['removed']} / {summary['moved']} moved",
+            **summary,
+            "match": match_stats.summary()
+        })
+
+    except Exception as e:
+        print(f"Sync Failed: {e}")
+        transfer_statuses["current_user"] = {
+            "status": "error",
+            "error": str(e)
+        }
+
+def run_library_task(playlists):
+    """Background task: many playlists as one job with cross-playlist dedup"""
+    status = transfer_statuses["library"] = {"status": "processing", "error": None}
+
+    yt, error = connect_ytmusic()
+    if yt is None:
+        transfer_statuses["library"] = {"status": "error", "error": error}
+        return
+
+    try:
+        sp = get_spotify_client()
+        match_stats = MatchStats()
+        run_library_transfer(
+            yt, playlists,
+            fetch_tracks=lambda playlist_id: fetch_playlist_tracks(sp, playlist_id),
+            resolve_video_id=lambda t, call: resolve_track(yt, t, match_stats, call),
+            status=status,
+            match_stats=match_stats,
+        )
+    except Exception as e:
+        print(f"Library Transfer Failed: {e}")
+        status.update({"status": "error", "error": str(e)})
+
+@traced("prepare_quiz_for_playlist")
 async def prepare_quiz_for_playlist(playlist_id):
     """Common logic: Scrape top songs from playlist -> Generate Quiz"""
     sp = get_spotify_client()
-    response = sp.playlist_items(playlist_id, limit=10)
-    # select random 5 songs from the playlist
-    selected_tracks = random.sample(response['items'], min(5, len(response['items'])))
-    
-    clean_tracks = []
-    for item in selected_tracks:
-        if item['track']:
-            clean_tracks.append({
-                "name": item['track']['name'],
-                "artist": item['track']['artists'][0]['name']
-            })
-        
-    # Ingest Top 5 songs to ensure quiz has relevant content
-    print(f"⚡ Ingesting {len(clean_tracks[:5])} songs for context...")
-    for t in clean_tracks[:5]: 
-        quick_ingest(t['artist'], t['name'])
-        
-    print("🧠 Generating Quiz...")
-    quiz_data = generate_batch_quiz(num_questions=5, clean_tracks=clean_tracks)
+    # The user is waiting: speculative prefetching pauses until the quiz is ready
+    with prefetcher.foreground():
+        # Sample from the stored profile without calling Spotify; the prefetch worker checks
+        # its snapshot (and rebuilds it if the playlist changed) after this request
+        profile = playlist_profiles.get(playlist_id)
+        if profile is not None:
+            # Prefer the songs the prefetcher already picked (and most likely ingested)
+            clean_tracks = (prefetcher.take_planned(playlist_id, profile['snapshot_id'])
+                            or sample_tracks(profile, 5))
+        else:
+            clean_tracks = sample_first_page(sp, playlist_id, 5)
+        prefetcher.refresh_later(sp, playlist_id)
+
+        # Ingest Top 5 songs to ensure quiz has relevant content
+        print(f"⚡ Ingesting {len(clean_tracks[:5])} songs for context...")
+        for t in clean_tracks[:5]: 
+            quick_ingest(t['artist'], t['name'])
+        prefetcher.fold_later(playlist_id, clean_tracks[:5])
+            
+        print("🧠 Generating Quiz...")
+        quiz_data = generate_batch_quiz(num_questions=5, clean_tracks=clean_tracks)
     
     return quiz_data, clean_tracks
 
 # --- ENDPOINTS ---
 @app.get("/login")
 def login():
+    if sp_oauth is None:
+        # Fake providers need no Spotify login: go straight to the callback
+        return {"url": "http://127.0.0.1:8000/callback?code=fake"}
     auth_url = sp_oauth.get_authorize_url()
     return {"url": auth_url}
 
 @app.get("/callback")
 def callback(code: str):
     global user_token_info
+    if sp_oauth is None:
+        user_token_info = {"access_token": "fake"}
+        return {"message": "Login successful (fake providers). Close this window."}
     user_token_info = sp_oauth.get_access_token(code)
     return {"message": "Login successful. Close this window."}
 
@@ -288,15 +413,38 @@ def google_callback(code: str):
 @app.get("/playlists")
 def get_playlists():
     sp = get_spotify_client()
-    results = sp.current_user_playlists(limit=30)
+    with span("spotify.current_user_playlists", external="spotify"):
+        results = sp.current_user_playlists(limit=30)
+    if PREFETCH_PLAYLISTS:
+        # The first listed playlists are the likeliest picks; snapshot_id comes free with the listing
+        prefetcher.schedule("current_user", sp, [(item['id'], item.get('snapshot_id'))
+                                                 for item in results['items'][:PREFETCH_PLAYLISTS]])
     return [{"name": item['name'], "id": item['id'], "image": item['images'][0]['url'] if item['images'] else ""} for item in results['items']]
 
 @app.post("/start_transfer")
 async def start_transfer(req: PlaylistRequest, background_tasks: BackgroundTasks):
     """Mode A: Transfer + Quiz"""
-    quiz_data, clean_tracks = await prepare_quiz_for_playlist(req.playlist_id)
-    background_tasks.add_task(run_transfer_task, req.playlist_name, clean_tracks)
-    return {"quiz": quiz_data, "mode": "transfer"}
+    quiz_data, _ = await prepare_quiz_for_playlist(req.playlist_id)
+    if req.sync:
+        background_tasks.add_task(run_sync_task, req.playlist_id, req.playlist_name)
+    else:
+        # Transfer the whole playlist, not just the handful of tracks sampled for the quiz;
+        # the task reads it, so the quiz response doesn't wait on every page
+        background_tasks.add_task(run_transfer_task, req.playlist_id, req.playlist_name)
+    return {"quiz": quiz_data, "mode": "transfer", "sync": req.sync}
+
+@app.post("/start_library_transfer")
+def start_library_transfer(req: LibraryTransferRequest, background_tasks: BackgroundTasks):
+    """Mode C: Transfer many playlists at once, searching each unique track only once"""
+    if not req.playlists:
+        raise HTTPException(status_code=400, detail="No playlists given")
+    playlists = [(p.playlist_id, p.playlist_name) for p in req.playlists]
+    background_tasks.add_task(run_library_task, playlists)
+    return {"status": "started", "playlists": len(playlists)}
+
+@app.get("/library_transfer_status")
+def get_library_transfer_status():
+    return transfer_statuses.get("library", {"status": "idle"})
 
 @app.post("/start_trivia")
 async def start_trivia(req: PlaylistRequest):
@@ -309,6 +457,13 @@ def get_transfer_status():
     # In a real app, use a unique session ID. For now, we use a global key.
     return transfer_statuses.get("current_user", {"status": "idle"})
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Span latency histograms, external-call counters and cache/store/prefetch gauges (Prometheus text format)."""
+    gauges = engine_stats()
+    gauges.update({f"prefetch_{k}": v for k, v in prefetcher.stats().items()})
+    return render_prometheus(gauges)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)     
\ No newline at end of file
@@ -0,0 +1,164 @@
+import time
+import queue
+import threading
+import contextvars
+from .tracing import span
+from .rate_limit import is_rate_limited, http_status
+
+_CLOSE = object()
+# Statuses that reject the videos in the request, not the request itself: worth bisecting
+ITEM_REJECTION_STATUSES = {400, 404, 409, 422}
+
+
+class AdaptiveCommitter:
+    """
+    Adds videos to one YT Music playlist from a background thread, so commits overlap the
+    search stage instead of waiting for it to finish.
+
+    - Batch size adapts (AIMD): it grows while adds stay under `target_latency_s` and
+      shrinks when they are slow or fail.
+    - A batch rejected for its items (HTTP 400-style) is bisected until the bad videoIds
+      are isolated; they are reported in `failed` instead of aborting the transfer.
+    - HTTP 429 responses are retried with backoff rather than bisected.
+    - Any other error (auth, server, unknown), or `max_consecutive_rejections` single
+      videos in a row rejected the same way, means the playlist itself is refusing adds:
+      the commit stage stops and close() raises the error.
+
+    Videos are committed in submission order, one batch at a time, so playlist order is kept.
+    """
+
+    def __init__(self, yt, playlist_id, initial_batch=50, min_batch=5, max_batch=200,
+                 target_latency_s=3.0, max_wait_s=5.0, max_retries=3, max_consecutive_rejections=10,
+                 call=None, on_commit=None):
+        self.yt = yt
+        self.playlist_id = playlist_id
+        self.batch_size = initial_batch
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.target_latency_s = target_latency_s
+        self.max_wait_s = max_wait_s
+        self.max_retries = max_retries
+        self.max_consecutive_rejections = max_consecutive_rejections
+        # `call(func, *args)` lets callers route adds through a shared rate-limit budget
+        self.call = call or (lambda func, *args: func(*args))
+        self.on_commit = on_commit
+
+        self.committed = 0
+        self.failed = []
+        self.batches = 0
+        self.retries = 0
+        self.error = None
+        self.cancelled = False
+        self.rejection_streak = (None, 0)  # (status, single videos rejected in a row)
+
+        self.queue = queue.Queue()
+        ctx = contextvars.copy_context()  # Keep commit spans nested under the caller's trace
+        self.thread = threading.Thread(target=ctx.run, args=(self._run,), daemon=True)
+        self.thread.start()
+
+    # --- PRODUCER SIDE ---
+    def submit(self, video_ids):
+        """Queues videos for commit. Never blocks on the network."""
+        if isinstance(video_ids, str):
+            video_ids = [video_ids]
+        for video_id in video_ids:
+            self.queue.put(video_id)
+
+    def close(self):
+        """Flushes everything queued, waits for the worker and returns a summary."""
+        self.queue.put(_CLOSE)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.summary()
+
+    def cancel(self):
+        """Stops the worker without committing what is still queued. Safe to call after close()."""
+        self.cancelled = True
+        self.queue.put(_CLOSE)
+        self.thread.join()
+
+    def summary(self):
+        return {"committed": self.committed, "failed": list(self.failed), "batches": self.batches,
+                "retries": self.retries, "final_batch_size": self.batch_size}
+
+    # --- WORKER SIDE ---
+    def _run(self):
+        pending = []
+        oldest = None
+        try:
+            while True:
+                # Partial batches wait at most max_wait_s for more search results
+                timeout = None if not pending else max(0.0, self.max_wait_s - (time.monotonic() - oldest))
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is _CLOSE or self.cancelled:
+                    while pending and not self.cancelled:
+                        batch, pending = pending[:self.batch_size], pending[self.batch_size:]
+                        self._commit(batch)
+                    return
+                if item is not None:
+                    if not pending:
+                        oldest = time.monotonic()
+                    pending.append(item)
+                    if len(pending) < self.batch_size:
+                        continue
+
+                # Batch full, or the oldest pending video waited long enough
+                while pending and (len(pending) >= self.batch_size or item is None):
+                    batch, pending = pending[:self.batch_size], pending[self.batch_size:]
+                    self._commit(batch)
+                oldest = time.monotonic() if pending else None
+        except Exception as e:
+            self.error = e
+
+    def _add(self, batch):
+        """One add call with 429 backoff. Returns elapsed seconds; raises on other errors."""
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                with span("yt.add_playlist_items", external="ytmusic", batch=len(batch)):
+                    self.call(self.yt.add_playlist_items, self.playlist_id, batch)
+                return time.perf_counter() - start
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                self.batch_size = max(self.min_batch, self.batch_size // 2)
+                time.sleep(2 ** attempt)
+
+    def _commit(self, batch):
+        try:
+            elapsed = self._add(batch)
+        except Exception as e:
+            status = http_status(e)
+            if status not in ITEM_REJECTION_STATUSES:
+                raise
+            self.batch_size = max(self.min_batch, self.batch_size // 2)
+            if len(batch) == 1:
+                streak = self.rejection_streak[1] + 1 if self.rejection_streak[0] == status else 1
+                self.rejection_streak = (status, streak)
+                if streak >= self.max_consecutive_rejections:
+                    # Every video fails the same way: it's the request, not the videos
+                    raise
+                print(f"   ⚠️ Skipping video {batch[0]}: {e}")
+                self.failed.append(batch[0])
+                return
+            # Bisect to isolate the bad videoIds; the good halves still go in, in order
+            mid = len(batch) // 2
+            self._commit(batch[:mid])
+            self._commit(batch[mid:])
+            return
+
+        self.batches += 1
+        self.committed += len(batch)
+        self.rejection_streak = (None, 0)
+        if elapsed < self.target_latency_s / 2:
+            self.batch_size = min(self.max_batch, self.batch_size + max(5, self.batch_size // 4))
+        elif elapsed > self.target_latency_s:
+            self.batch_size = max(self.min_batch, int(self.batch_size * 0.7))
+        if self.on_commit:
+            self.on_commit(self.committed)
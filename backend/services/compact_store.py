@@ -0,0 +1,291 @@
+import os
+import json
+import threading
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process guard
+    fcntl = None
+
+# On-disk layout of a store directory:
+#   meta.json       -> dim, dtype, count, capacity
+#   vectors.bin     -> (capacity, dim) float16 or int8 memmap used for scanning
+#   scales.bin      -> (capacity,) float32 per-vector scale (int8 only)
+#   rescore.bin     -> (capacity, dim) float16 memmap used to re-rank int8 candidates
+#   songs.bin       -> (capacity,) int32 song code per row, for vectorized song filters
+#   metadata.jsonl  -> append-only sidecar {"row", "id", "song", "artist"}; last write wins
+#   writer.lock     -> held by the one process that has the store open
+
+SUPPORTED_DTYPES = ("float16", "int8")
+
+
+def lock_directory(path):
+    """
+    Takes the store directory's writer lock for as long as the returned file stays open.
+    Rows are reserved from an in-memory counter, so a second process writing the same
+    store would overwrite rows the first still maps to its own ids.
+    """
+    lock_file = open(os.path.join(path, "writer.lock"), "w")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise RuntimeError(f"{path} is open in another process (is the backend or a bulk ingest "
+                               f"running against it?)") from None
+    return lock_file
+
+
+def open_memmap(filename, dtype, shape):
+    """Maps `filename` as a writable array, growing (or creating) the file to fit `shape`."""
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    with open(filename, "ab") as f:
+        if f.tell() < nbytes:
+            f.truncate(nbytes)
+    return np.memmap(filename, dtype=dtype, mode="r+", shape=shape)
+
+
+class CompactVectorStore:
+    """
+    A compact, memory-mapped alternative to the Chroma collection for lyric embeddings.
+
+    Vectors are kept as float16 or int8 (symmetric per-vector scale) instead of Python
+    float lists, so a million 384-dim chunks cost ~730MB (float16) or ~370MB (int8) on
+    disk and only the pages touched by a scan are resident.
+    Queries are exact brute-force scans; int8 stores re-rank their top candidates
+    against a float16 copy so recall stays close to the float32 result.
+
+    Embeddings are assumed to be L2-normalized (all-MiniLM-L6-v2 normalizes its output),
+    so cosine similarity is a plain dot product.
+    """
+
+    def __init__(self, path, dim=384, dtype="float16", rescore=True, initial_capacity=1024):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"dtype must be one of {SUPPORTED_DTYPES}, got {dtype!r}")
+
+        self.path = path
+        # Writer threads (live ingest, prefetch) share one row counter; other processes are locked out
+        self.lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self.lock_file = lock_directory(path)
+
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.dim = meta['dim']
+            self.dtype = meta['dtype']
+            self.rescore = meta['rescore']
+            self.count = meta['count']
+            self.capacity = meta['capacity']
+        else:
+            self.dim = dim
+            self.dtype = dtype
+            self.rescore = rescore and dtype == "int8"
+            self.count = 0
+            self.capacity = initial_capacity
+
+        self._open_arrays()
+
+        # Sidecar: row -> (id, song, artist), plus lookups for upserts and song filters
+        self.ids = [None] * self.count
+        self.metadatas = [None] * self.count
+        self.row_by_id = {}
+        self.song_codes = {}
+        self._load_sidecar()
+
+    # --- STORAGE ---
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _memmap(self, name, dtype, shape):
+        return open_memmap(self._file(name), dtype, shape)
+
+    def _open_arrays(self):
+        self.vectors = self._memmap("vectors.bin", self.dtype, (self.capacity, self.dim))
+        self.songs = self._memmap("songs.bin", np.int32, (self.capacity,))
+        self.scales = self._memmap("scales.bin", np.float32, (self.capacity,)) if self.dtype == "int8" else None
+        self.rescore_vectors = (self._memmap("rescore.bin", np.float16, (self.capacity, self.dim))
+                                if self.rescore else None)
+
+    def _grow(self, needed):
+        if needed <= self.capacity:
+            return
+        self.flush()
+        while self.capacity < needed:
+            self.capacity *= 2
+        self._open_arrays()
+
+    def _load_sidecar(self):
+        sidecar = self._file("metadata.jsonl")
+        if not os.path.exists(sidecar):
+            return
+        with open(sidecar, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                r = row['row']
+                if r >= self.count:
+                    continue  # Written after the last flush of meta.json; vectors may be partial
+                self.ids[r] = row['id']
+                self.metadatas[r] = {"song": row['song'], "artist": row['artist']}
+                self.row_by_id[row['id']] = r
+                self._song_code(row['song'])
+
+    def _song_code(self, song):
+        if song not in self.song_codes:
+            self.song_codes[song] = len(self.song_codes)
+        return self.song_codes[song]
+
+    def flush(self):
+        """Persists arrays and the row count. Call after a batch of upserts."""
+        with self.lock:
+            self.vectors.flush()
+            self.songs.flush()
+            if self.scales is not None:
+                self.scales.flush()
+            if self.rescore_vectors is not None:
+                self.rescore_vectors.flush()
+            # Write-then-rename so a crash never leaves a truncated meta.json
+            tmp_path = self._file("meta.json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"dim": self.dim, "dtype": self.dtype, "rescore": self.rescore,
+                           "count": self.count, "capacity": self.capacity}, f)
+            os.replace(tmp_path, self._file("meta.json"))
+
+    def close(self):
+        """Flushes and releases the directory so another process (or a reopen) can use it."""
+        with self.lock:
+            self.flush()
+            self.lock_file.close()
+
+    # --- WRITES ---
+    def _encode(self, embeddings):
+        """Quantizes float32 rows into the storage dtype. Returns (vectors, scales)."""
+        if self.dtype == "float16":
+            return embeddings.astype(np.float16), None
+        scales = np.abs(embeddings).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+
+    def upsert(self, ids, embeddings, metadatas):
+        """Inserts or overwrites rows. `embeddings` may be a numpy array or a list of lists."""
+        with self.lock:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            if embeddings.ndim != 2 or embeddings.shape[1] != self.dim:
+                raise ValueError(f"Expected embeddings of shape (n, {self.dim}), got {embeddings.shape}")
+
+            rows = []
+            new_row_by_id = {}
+            for chunk_id in ids:
+                if chunk_id in self.row_by_id:
+                    rows.append(self.row_by_id[chunk_id])
+                else:
+                    rows.append(new_row_by_id.setdefault(chunk_id, self.count + len(new_row_by_id)))
+            new_rows = len(new_row_by_id)
+            self._grow(self.count + new_rows)
+
+            rows = np.asarray(rows, dtype=np.int64)
+            quantized, scales = self._encode(embeddings)
+            self.vectors[rows] = quantized
+            if scales is not None:
+                self.scales[rows] = scales
+            if self.rescore_vectors is not None:
+                self.rescore_vectors[rows] = embeddings.astype(np.float16)
+            self.songs[rows] = [self._song_code(m['song']) for m in metadatas]
+
+            self.ids.extend([None] * new_rows)
+            self.metadatas.extend([None] * new_rows)
+            self.count += new_rows
+
+            with open(self._file("metadata.jsonl"), "a", encoding="utf-8") as f:
+                for r, chunk_id, meta in zip(rows.tolist(), ids, metadatas):
+                    self.ids[r] = chunk_id
+                    self.metadatas[r] = {"song": meta['song'], "artist": meta['artist']}
+                    self.row_by_id[chunk_id] = r
+                    f.write(json.dumps({"row": r, "id": chunk_id,
+                                        "song": meta['song'], "artist": meta['artist']}) + "\n")
+            self.flush()
+
+    def vectors_for(self, rows):
+        """Best available float32 vectors for `rows` (the float16 rescore copy if there is one)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.rescore_vectors is not None:
+            return np.asarray(self.rescore_vectors[rows], dtype=np.float32)
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows][:, None]
+        return vectors
+
+    # --- SEARCH ---
+    def _scan(self, query, exclude_code, limit, block_rows):
+        """Approximate (stored-precision) scores for all rows, keeping the best `limit`."""
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+
+        for start in range(0, self.count, block_rows):
+            stop = min(start + block_rows, self.count)
+            block = np.asarray(self.vectors[start:stop], dtype=np.float32)
+            scores = block @ query
+            if self.scales is not None:
+                scores *= self.scales[start:stop]
+            if exclude_code is not None:
+                scores[self.songs[start:stop] == exclude_code] = -np.inf
+
+            take = min(limit, stop - start)
+            top = np.argpartition(-scores, take - 1)[:take]
+            best_rows = np.concatenate([best_rows, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if len(best_rows) > limit:
+                keep = np.argpartition(-best_scores, limit - 1)[:limit]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        keep = np.isfinite(best_scores)
+        return best_rows[keep], best_scores[keep]
+
+    def search(self, query_embedding, k=5, exclude_song=None, rescore_factor=4, block_rows=65536):
+        """Returns [(row, cosine_similarity)] for the k nearest rows, best first."""
+        if self.count == 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        exclude_code = self.song_codes.get(exclude_song) if exclude_song is not None else None
+        if exclude_song is not None and exclude_code is None:
+            exclude_code = -1  # Song not in the store: nothing to exclude
+
+        use_rescore = self.rescore_vectors is not None and rescore_factor > 1
+        limit = k * rescore_factor if use_rescore else k
+        rows, scores = self._scan(query, exclude_code, limit, block_rows)
+
+        if use_rescore and len(rows):
+            rows = np.sort(rows)  # Sorted reads keep memmap access sequential
+            scores = np.asarray(self.rescore_vectors[rows], dtype=np.float32) @ query
+
+        order = np.argsort(-scores)[:k]
+        return [(int(rows[i]), float(scores[i])) for i in order]
+
+    def query(self, query_embeddings, n_results=5, where=None, **kwargs):
+        """
+        Chroma-shaped wrapper around search() so callers can swap stores.
+        Supports the one filter the quiz engine uses: {"song": {"$ne": title}}.
+        """
+        exclude_song = None
+        if where:
+            exclude_song = where.get("song", {}).get("$ne")
+
+        result = {"ids": [], "metadatas": [], "distances": []}
+        for q in query_embeddings:
+            hits = self.search(q, k=n_results, exclude_song=exclude_song, **kwargs)
+            result["ids"].append([self.ids[r] for r, _ in hits])
+            result["metadatas"].append([self.metadatas[r] for r, _ in hits])
+            result["distances"].append([1.0 - s for _, s in hits])
+        return result
+
+    def resident_bytes(self):
+        """Bytes of vector data a full scan touches (what must fit in page cache to stay fast)."""
+        total = self.count * self.dim * np.dtype(self.dtype).itemsize + self.count * 4
+        if self.scales is not None:
+            total += self.count * 4
+        return total
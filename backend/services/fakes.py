@@ -0,0 +1,458 @@
+"""
+Deterministic offline stand-ins for Spotify, YouTube Music, Genius and Gemini, plus a
+hashing embedder in place of the sentence-transformers model.
+
+They implement only the client methods the backend calls, return payloads shaped like
+the real libraries, and are seeded from fixtures/playlists.json. Each service has a
+configurable latency, error rate and rate limit so load tests see realistic behaviour:
+
+    FAKE_SEED=42
+    FAKE_<SERVICE>_LATENCY_MS / FAKE_<SERVICE>_JITTER_MS / FAKE_<SERVICE>_ERROR_RATE / FAKE_<SERVICE>_RATE_LIMIT
+    (SERVICE = SPOTIFY | YTMUSIC | GENIUS | GEMINI; FAKE_LATENCY_MS etc. set every service at once)
+    FAKE_GENIUS_MISSING_RATE    share of songs with no lyrics
+    FAKE_YTMUSIC_MISSING_RATE   share of searches where the official track is absent
+    FAKE_YTMUSIC_BAD_VIDEO_RATE share of videoIds that fail when added to a playlist
+    FAKE_GEMINI_MALFORMED_RATE  share of LLM responses that are invalid JSON or break the schema
+"""
+import os
+import json
+import time
+import zlib
+import random
+import threading
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+from .rate_limit import RateLimiter
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "fixtures", "playlists.json")
+
+DEFAULT_LATENCY_MS = {"spotify": 120, "ytmusic": 250, "genius": 400, "gemini": 1500}
+
+LYRIC_WORDS = (
+    "night", "river", "fire", "golden", "highway", "heart", "echo", "silver", "rain", "dancing",
+    "shadow", "midnight", "city", "ocean", "whisper", "thunder", "summer", "broken", "neon", "dream",
+    "falling", "light", "stranger", "morning", "wild", "paper", "crown", "electric", "velvet", "storm",
+)
+
+
+class FakeServiceError(Exception):
+    """Injected failure; `status` mirrors the HTTP status a real client would surface."""
+
+    def __init__(self, service, operation, status=500):
+        super().__init__(f"{service}.{operation} failed with HTTP {status} (injected)")
+        self.service = service
+        self.operation = operation
+        self.status = status
+        self.http_status = status
+
+
+class FakeRateLimitError(FakeServiceError):
+    def __init__(self, service, operation):
+        super().__init__(service, operation, status=429)
+
+
+def stable_int(*parts):
+    """Process-independent hash (str hash() is randomized per interpreter)."""
+    return zlib.crc32("\x1f".join(str(p) for p in parts).encode("utf-8"))
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+class FakeServiceConfig:
+    def __init__(self, service):
+        prefix = f"FAKE_{service.upper()}_"
+        self.service = service
+        self.seed = int(_env_float("FAKE_SEED", 42))
+        self.latency_ms = _env_float(prefix + "LATENCY_MS", _env_float("FAKE_LATENCY_MS", DEFAULT_LATENCY_MS[service]))
+        self.jitter_ms = _env_float(prefix + "JITTER_MS", _env_float("FAKE_JITTER_MS", self.latency_ms * 0.25))
+        self.error_rate = _env_float(prefix + "ERROR_RATE", _env_float("FAKE_ERROR_RATE", 0.0))
+        self.rate_limit = _env_float(prefix + "RATE_LIMIT", _env_float("FAKE_RATE_LIMIT", 0.0))
+
+
+class _FakeService:
+    """Shared latency / error / rate-limit behaviour. Randomness is keyed by call number."""
+
+    def __init__(self, service, config=None):
+        self.config = config or FakeServiceConfig(service)
+        self.service = service
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.limiter = RateLimiter(self.config.rate_limit) if self.config.rate_limit > 0 else None
+
+    def _rng(self, *parts):
+        return random.Random(stable_int(self.config.seed, self.service, *parts))
+
+    def _call(self, operation):
+        with self.lock:
+            self.calls += 1
+            n = self.calls
+        rng = self._rng("call", n)
+
+        if self.limiter is not None and not self.limiter.try_acquire():
+            raise FakeRateLimitError(self.service, operation)
+
+        delay = max(0.0, rng.gauss(self.config.latency_ms, self.config.jitter_ms)) / 1000
+        if delay:
+            time.sleep(delay)
+
+        if rng.random() < self.config.error_rate:
+            raise FakeServiceError(self.service, operation)
+
+
+# --- FIXTURE CATALOG ---
+def _track_id(name, artist):
+    return f"{stable_int('track', name.lower(), artist.lower()):010d}fk"
+
+
+def _video_id(name, artist, variant="official"):
+    return f"v{stable_int('video', name.lower(), artist.lower(), variant):010d}"
+
+
+def _fixture_track(name, artists, album, duration_ms):
+    return {
+        "id": _track_id(name, artists[0]),
+        "name": name,
+        "artists": [{"name": a, "id": f"{stable_int('artist', a):08d}"} for a in artists],
+        "album": {"name": album},
+        "duration_ms": duration_ms,
+        "external_ids": {"isrc": f"QZFK{stable_int('isrc', name, artists[0]) % 10 ** 8:08d}"},
+    }
+
+
+def _synthetic_track(i, playlist_id):
+    name = f"Synthetic Song {i}"
+    artist = f"Synthetic Artist {stable_int(playlist_id, i) % 97}"
+    return _fixture_track(name, [artist], f"Synthetic Album {i // 12}", 150000 + stable_int(name) % 150000)
+
+
+def load_catalog(path=FIXTURES_PATH):
+    """Returns {playlist_id: {"id", "name", "tracks": [spotify track dicts]}}."""
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    catalog = {}
+    for pl in raw['playlists']:
+        if "synthetic_tracks" in pl:
+            tracks = [_synthetic_track(i, pl['id']) for i in range(pl['synthetic_tracks'])]
+        else:
+            tracks = [_fixture_track(t['name'], t['artists'], t['album'], t['duration_ms']) for t in pl['tracks']]
+        catalog[pl['id']] = {"id": pl['id'], "name": pl['name'], "tracks": tracks}
+    return catalog
+
+
+def _snapshot_id(tracks):
+    return f"snap{stable_int(*[t['id'] for t in tracks]):010d}"
+
+
+# --- SPOTIFY ---
+class FakeSpotify(_FakeService):
+    """The subset of spotipy.Spotify used by the backend."""
+
+    def __init__(self, catalog, config=None):
+        super().__init__("spotify", config)
+        self.catalog = catalog
+
+    def _playlist(self, playlist_id):
+        if playlist_id not in self.catalog:
+            raise FakeServiceError(self.service, "playlist", status=404)
+        return self.catalog[playlist_id]
+
+    def current_user_playlists(self, limit=50, offset=0):
+        self._call("current_user_playlists")
+        items = [{
+            "id": pl['id'],
+            "name": pl['name'],
+            "images": [],
+            "snapshot_id": _snapshot_id(pl['tracks']),
+            "tracks": {"total": len(pl['tracks'])},
+        } for pl in list(self.catalog.values())[offset:offset + limit]]
+        return {"items": items, "next": None, "total": len(self.catalog)}
+
+    def playlist(self, playlist_id, fields=None, market=None, additional_types=("track",)):
+        self._call("playlist")
+        pl = self._playlist(playlist_id)
+        return {"id": pl['id'], "name": pl['name'], "snapshot_id": _snapshot_id(pl['tracks']),
+                "tracks": {"total": len(pl['tracks'])}}
+
+    def playlist_items(self, playlist_id, fields=None, limit=100, offset=0, market=None,
+                       additional_types=("track", "episode")):
+        self._call("playlist_items")
+        tracks = self._playlist(playlist_id)['tracks']
+        page = tracks[offset:offset + limit]
+        has_next = offset + limit < len(tracks)
+        return {
+            "items": [{"track": t} for t in page],
+            "offset": offset,
+            "limit": limit,
+            "total": len(tracks),
+            "next": f"fake://playlists/{playlist_id}/items?offset={offset + limit}&limit={limit}" if has_next else None,
+        }
+
+    def next(self, result):
+        if not result.get("next"):
+            return None
+        url = urlparse(result['next'])
+        query = parse_qs(url.query)
+        playlist_id = url.path.split("/")[1]
+        return self.playlist_items(playlist_id, limit=int(query['limit'][0]), offset=int(query['offset'][0]))
+
+
+# --- YOUTUBE MUSIC ---
+class FakeYTMusic(_FakeService):
+    """The subset of ytmusicapi.YTMusic used by the backend, with in-memory playlists."""
+
+    def __init__(self, catalog, config=None):
+        super().__init__("ytmusic", config)
+        self.missing_rate = _env_float("FAKE_YTMUSIC_MISSING_RATE", 0.05)
+        self.bad_video_rate = _env_float("FAKE_YTMUSIC_BAD_VIDEO_RATE", 0.0)
+        self.known = {}
+        self.by_isrc = {}
+        for pl in catalog.values():
+            for t in pl['tracks']:
+                self.known[(t['name'].lower(), t['artists'][0]['name'].lower())] = t
+                self.by_isrc[t['external_ids']['isrc']] = t
+        self.playlists = {}
+        self.playlist_lock = threading.Lock()
+
+    @staticmethod
+    def _result(video_id, title, artists, album, duration_s):
+        minutes, seconds = divmod(int(duration_s), 60)
+        return {
+            "resultType": "song",
+            "videoId": video_id,
+            "title": title,
+            "artists": [{"name": a, "id": None} for a in artists],
+            "album": {"name": album, "id": None},
+            "duration": f"{minutes}:{seconds:02d}",
+            "duration_seconds": int(duration_s),
+        }
+
+    def search(self, query, filter=None, scope=None, limit=20, ignore_spelling=False):
+        self._call("search")
+        # An ISRC query finds the same song, but how YT Music ranks (or whether it finds) the
+        # official upload for one is undocumented: it gets the same odds as any other query.
+        # Measure real behaviour with recorded responses (benchmarks/bench_matching record).
+        by_isrc = self.by_isrc.get(query.strip().upper())
+        if by_isrc:
+            name, artist = by_isrc['name'], by_isrc['artists'][0]['name']
+        else:
+            name, _, artist = query.rpartition(" by ")
+            if not name:
+                name, artist = query, "Unknown Artist"
+        rng = self._rng("search", query.lower())
+
+        known = self.known.get((name.lower(), artist.lower()))
+        artists = [a['name'] for a in known['artists']] if known else [artist]
+        album = known['album']['name'] if known else f"{name} (Single)"
+        duration_s = known['duration_ms'] / 1000 if known else 150 + stable_int(name, artist) % 150
+
+        results = [
+            self._result(_video_id(name, artist, "live"), f"{name} (Live)", artists, f"{album} (Live)", duration_s + 40),
+            self._result(_video_id(name, artist, "cover"), name, ["Karaoke Hits Band"], "Karaoke Hits", duration_s + 3),
+            self._result(_video_id(name, artist, "remix"), f"{name} (Remix)", [f"DJ {artist}"], "Remixes", duration_s + 75),
+            self._result(_video_id(name, artist, "other"), f"{name} Tribute", ["Various Artists"], "Tributes", duration_s - 20),
+        ]
+        rng.shuffle(results)
+        if rng.random() >= self.missing_rate:
+            official = self._result(_video_id(name, artist), name, artists, album, duration_s)
+            results.insert(rng.choices([0, 1, 2, 3], weights=[60, 20, 12, 8])[0], official)
+        return results[:limit]
+
+    def _is_bad(self, video_id):
+        return self.bad_video_rate and self._rng("bad", video_id).random() < self.bad_video_rate
+
+    def get_liked_songs(self, limit=100):
+        self._call("get_liked_songs")
+        return {"tracks": []}
+
+    def create_playlist(self, title, description, privacy_status="PRIVATE", video_ids=None, source_playlist=None):
+        self._call("create_playlist")
+        with self.playlist_lock:
+            playlist_id = f"FAKEPL{len(self.playlists) + 1:06d}"
+            self.playlists[playlist_id] = {"title": title, "items": []}
+        if video_ids:
+            self.add_playlist_items(playlist_id, video_ids)
+        return playlist_id
+
+    def add_playlist_items(self, playlistId, videoIds=None, source_playlist=None, duplicates=False):
+        self._call("add_playlist_items")
+        if any(self._is_bad(v) for v in videoIds):
+            raise FakeServiceError(self.service, "add_playlist_items", status=400)
+        with self.playlist_lock:
+            items = self.playlists[playlistId]['items']
+            results = []
+            for video_id in videoIds:
+                item = {"videoId": video_id, "setVideoId": f"set{stable_int(playlistId, video_id, len(items)):010d}"}
+                items.append(item)
+                results.append(item)
+        return {"status": "STATUS_SUCCEEDED", "playlistEditResults": results}
+
+    def get_playlist(self, playlistId, limit=100, related=False, suggestions_limit=0):
+        self._call("get_playlist")
+        with self.playlist_lock:
+            pl = self.playlists[playlistId]
+            items = pl['items'] if limit is None else pl['items'][:limit]
+            tracks = [{"videoId": i['videoId'], "setVideoId": i['setVideoId']} for i in items]
+        return {"id": playlistId, "title": pl['title'], "trackCount": len(pl['items']), "tracks": tracks}
+
+    def remove_playlist_items(self, playlistId, videos):
+        self._call("remove_playlist_items")
+        drop = {v['setVideoId'] for v in videos}
+        with self.playlist_lock:
+            pl = self.playlists[playlistId]
+            pl['items'] = [i for i in pl['items'] if i['setVideoId'] not in drop]
+        return "STATUS_SUCCEEDED"
+
+    def edit_playlist(self, playlistId, title=None, description=None, privacyStatus=None,
+                      moveItem=None, addPlaylistId=None, addToTop=None):
+        self._call("edit_playlist")
+        with self.playlist_lock:
+            pl = self.playlists[playlistId]
+            if title:
+                pl['title'] = title
+            if moveItem:
+                set_id, before_id = moveItem if isinstance(moveItem, tuple) else (moveItem, None)
+                item = next(i for i in pl['items'] if i['setVideoId'] == set_id)
+                pl['items'].remove(item)
+                idx = next((n for n, i in enumerate(pl['items']) if i['setVideoId'] == before_id), len(pl['items']))
+                pl['items'].insert(idx, item)
+        return "STATUS_SUCCEEDED"
+
+
+# --- EMBEDDINGS ---
+class FakeEmbedder:
+    """
+    Dependency-free bag-of-words embedder with all-MiniLM-L6-v2's shape (384 dims, unit
+    norm): close enough to rank lyric chunks by overlap, and needs no model download.
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def encode(self, docs, batch_size=None):
+        out = np.zeros((len(docs), self.dim), dtype=np.float32)
+        for i, doc in enumerate(docs):
+            for word in doc.lower().split():
+                h = stable_int("embed", word)
+                out[i, h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-9)
+
+
+# --- GENIUS ---
+class FakeSong:
+    def __init__(self, title, artist, lyrics):
+        self.title = title
+        self.artist = artist
+        self.lyrics = lyrics
+
+
+def synthetic_lyrics(title, artist, lines=32):
+    """Stable pseudo-lyrics so every song has distinct, repeatable chunks."""
+    rng = random.Random(stable_int("lyrics", title.lower(), artist.lower()))
+    hook = " ".join(rng.choice(LYRIC_WORDS) for _ in range(5))
+    out = []
+    for i in range(lines):
+        if i % 8 == 7:
+            out.append(f"Oh {hook}")
+        else:
+            out.append(" ".join(rng.choice(LYRIC_WORDS) for _ in range(rng.randint(4, 8))).capitalize())
+    return f"{title} Lyrics\n" + "\n".join(out)
+
+
+class FakeGenius(_FakeService):
+    """The subset of lyricsgenius.Genius used by the backend."""
+
+    def __init__(self, config=None):
+        super().__init__("genius", config)
+        self.missing_rate = _env_float("FAKE_GENIUS_MISSING_RATE", 0.05)
+        self.verbose = False
+        self.remove_section_headers = True
+
+    def search_song(self, title=None, artist="", song_id=None, get_full_info=True):
+        self._call("search_song")
+        if self._rng("missing", title.lower(), artist.lower()).random() < self.missing_rate:
+            return None
+        return FakeSong(title, artist, synthetic_lyrics(title, artist))
+
+
+# --- GEMINI ---
+class FakeUsage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeResponse:
+    def __init__(self, text, usage):
+        self.text = text
+        self.usage_metadata = usage
+
+
+def _quoted_after(text, marker):
+    """First double-quoted string after `marker`, or None."""
+    start = text.find(marker)
+    if start < 0:
+        return None
+    first = text.find('"', start + len(marker))
+    last = text.find('"', first + 1)
+    return text[first + 1:last] if first >= 0 and last > first else None
+
+
+class _FakeModels:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def generate_content(self, model, contents, config=None):
+        return self.owner.generate_content(model, contents, config)
+
+
+class FakeGemini(_FakeService):
+    """Stands in for google.genai.Client; answers quiz prompts with schema-shaped JSON."""
+
+    def __init__(self, config=None):
+        super().__init__("gemini", config)
+        self.malformed_rate = _env_float("FAKE_GEMINI_MALFORMED_RATE", 0.0)
+        self.models = _FakeModels(self)
+
+    def generate_content(self, model, contents, config=None):
+        self._call("generate_content")
+        rng = self._rng("generate", contents)
+
+        correct = _quoted_after(contents, "THE CORRECT ANSWER IS:")
+        if correct:
+            distractors = []
+            marker = contents.find("MUST BE:")
+            if marker >= 0:
+                line = contents[marker + len("MUST BE:"):].strip().split("\n")[0]
+                try:
+                    distractors = json.loads(line)
+                except ValueError:
+                    distractors = []
+            options = [correct] + distractors[:3]
+            rng.shuffle(options)
+            question = {"question": "Which song contains these lyrics?", "options": options,
+                        "correct_answer": correct,
+                        "explanation": f"The imagery matches the themes of {correct}."}
+        else:
+            song = _quoted_after(contents, "from the song") or "this song"
+            options = [f"It is about {w}" for w in rng.sample(LYRIC_WORDS, 4)]
+            question = {"question": f"What is the central image in this part of \"{song}\"?",
+                        "options": options, "correct_answer": options[0],
+                        "explanation": "The repeated imagery in the segment points to it."}
+            rng.shuffle(options)
+
+        roll = rng.random()
+        if roll < self.malformed_rate / 2:
+            text = json.dumps(question)[:-7]  # Truncated JSON
+        elif roll < self.malformed_rate:
+            question['options'] = question['options'][:3]
+            question['correct_answer'] = question['correct_answer'].upper()
+            text = json.dumps(question)
+        else:
+            text = json.dumps(question)
+        return FakeResponse(text, FakeUsage(len(contents) // 4, len(text) // 4))
@@ -0,0 +1,292 @@
+import os
+import json
+import threading
+import numpy as np
+from .compact_store import CompactVectorStore, open_memmap
+
+# Directory layout:
+#   chunks/          -> CompactVectorStore of lyric chunk embeddings
+#   songs/           -> CompactVectorStore of normalized song centroids (one row per song)
+#   song_sums.bin    -> float32 running sum of chunk vectors per song row
+#   song_counts.bin  -> int32 chunk count per song row
+#   song_ivf/        -> IVF coarse centroids + per-row list assignments over song centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index: vectors are bucketed under their nearest coarse centroid and a
+    query only scans the `nprobe` closest buckets.
+
+    Only list assignments are stored here (a memory-mapped int32 per row); the vectors
+    themselves stay in the owning CompactVectorStore, so the index adds 4 bytes per row.
+    """
+
+    def __init__(self, path, dim):
+        self.path = path
+        self.dim = dim
+        os.makedirs(path, exist_ok=True)
+
+        self.centroids = None
+        self.trained_count = 0
+        self.count = 0
+        self.capacity = 1024
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.trained_count = meta['trained_count']
+            self.count = meta['count']
+            self.capacity = meta['capacity']
+            self.centroids = np.load(os.path.join(path, "centroids.npy"))
+        self.assignments = open_memmap(os.path.join(path, "assignments.bin"), np.int32, (self.capacity,))
+        self._build_lists()
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def _build_lists(self):
+        """Rebuilds in-memory posting lists from the assignment array (one argsort on restart)."""
+        self.lists = {}
+        self.list_sizes = {}
+        if not self.trained or self.count == 0:
+            return
+        assigned = np.asarray(self.assignments[:self.count])
+        order = np.argsort(assigned, kind="stable")
+        bounds = np.searchsorted(assigned[order], np.arange(len(self.centroids) + 1))
+        for c in range(len(self.centroids)):
+            rows = order[bounds[c]:bounds[c + 1]].astype(np.int64)
+            if len(rows):
+                self.lists[c] = rows
+                self.list_sizes[c] = len(rows)
+
+    def save(self):
+        self.assignments.flush()
+        if self.trained:
+            # Write-then-rename so a crash never leaves a truncated file behind
+            tmp_path = os.path.join(self.path, "centroids.tmp.npy")
+            np.save(tmp_path, self.centroids)
+            os.replace(tmp_path, os.path.join(self.path, "centroids.npy"))
+            tmp_path = os.path.join(self.path, "meta.json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"trained_count": self.trained_count, "count": self.count,
+                           "capacity": self.capacity}, f)
+            os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+
+    def train(self, sample, nlist, iterations=10, seed=0):
+        """Spherical k-means on a sample of (normalized) vectors."""
+        rng = np.random.default_rng(seed)
+        nlist = min(nlist, len(sample))
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Re-seed empty buckets from random sample points
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = sums / norms
+        self.centroids = centroids.astype(np.float32)
+
+    def assign(self, rows, vectors):
+        """Places (or moves) rows into their nearest list. Rows must be assigned in append order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        needed = int(rows.max()) + 1
+        if needed > self.capacity:
+            self.assignments.flush()
+            while self.capacity < needed:
+                self.capacity *= 2
+            self.assignments = open_memmap(os.path.join(self.path, "assignments.bin"), np.int32, (self.capacity,))
+
+        moved = rows[rows < self.count]
+        if not self.trained:
+            self.count = max(self.count, needed)
+            return
+
+        nearest = np.argmax(np.asarray(vectors, dtype=np.float32) @ self.centroids.T, axis=1).astype(np.int32)
+        if len(moved):
+            # Updated rows (e.g. a song centroid that shifted): drop them from their old list first
+            for c in np.unique(self.assignments[moved]):
+                c = int(c)
+                if c in self.lists:
+                    self.lists[c] = self.lists[c][~np.isin(self.lists[c], moved)]
+        self.assignments[rows] = nearest
+        for c in np.unique(nearest):
+            c = int(c)
+            new_rows = rows[nearest == c]
+            self.lists[c] = np.concatenate([self.lists.get(c, np.empty(0, dtype=np.int64)), new_rows])
+        self.list_sizes = {c: len(r) for c, r in self.lists.items()}
+        self.count = max(self.count, needed)
+
+    def candidates(self, query, nprobe):
+        """Rows stored in the `nprobe` lists closest to the query."""
+        nearest = np.argsort(-(self.centroids @ query))[:nprobe]
+        lists = [self.lists[int(c)] for c in nearest if int(c) in self.lists]
+        return np.concatenate(lists) if lists else np.empty(0, dtype=np.int64)
+
+
+class HardNegativeIndex:
+    """
+    Catalog-scale index for picking hard-negative distractors without filtered Chroma queries.
+
+    Maintains chunk embeddings plus one centroid per song (mean of its chunk vectors), the
+    centroids behind an IVF structure, so distractors can be chosen at song granularity:
+    "which other *songs* sound most like this lyric". Everything is memory-mapped under
+    `path`, so a restart only re-reads the metadata sidecars and rebuilds posting lists.
+
+    Until `min_train_size` chunks exist the index falls back to exact scans; add() then
+    retrains each time the song count grows 4x, and rebuild() retrains on demand. Like its
+    stores, the index can only be open in one process at a time.
+    """
+
+    def __init__(self, path, dim=384, dtype="int8", nprobe=8, min_train_size=20000):
+        self.path = path
+        self.dim = dim
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.lock = threading.RLock()  # Song rows are reserved from the song store's count
+        os.makedirs(path, exist_ok=True)
+
+        self.chunks = CompactVectorStore(os.path.join(path, "chunks"), dim=dim, dtype=dtype, rescore=True)
+        self.songs = CompactVectorStore(os.path.join(path, "songs"), dim=dim, dtype="float16")
+        self.song_ivf = IVFIndex(os.path.join(path, "song_ivf"), dim)
+        self._open_song_sums(max(self.songs.capacity, 1024))
+
+    def _open_song_sums(self, capacity):
+        self.sum_capacity = capacity
+        self.song_sums = open_memmap(os.path.join(self.path, "song_sums.bin"), np.float32, (capacity, self.dim))
+        self.song_counts = open_memmap(os.path.join(self.path, "song_counts.bin"), np.int32, (capacity,))
+
+    @staticmethod
+    def song_id(meta):
+        return f"{meta['artist']}_{meta['song']}"
+
+    def __len__(self):
+        return self.chunks.count
+
+    # --- INGESTION ---
+    def add(self, ids, embeddings, metadatas):
+        """Incremental insert of freshly ingested chunks (same arguments as a Chroma upsert)."""
+        with self.lock:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            new_ids = [i for i in ids if i not in self.chunks.row_by_id]
+            self.chunks.upsert(ids, embeddings, metadatas)
+
+            # Fold only genuinely new chunks into their song's running sum
+            fresh = set(new_ids)
+            by_song = {}
+            for chunk_id, vector, meta in zip(ids, embeddings, metadatas):
+                if chunk_id in fresh:
+                    entry = by_song.setdefault(self.song_id(meta), [meta, []])
+                    entry[1].append(vector)
+            if by_song:
+                self._update_songs(by_song)
+
+            if self.needs_rebuild():
+                self.rebuild()  # Amortized: retrains once the catalog has grown `growth`-fold
+            self.save()
+
+    def _update_songs(self, by_song):
+        song_ids = list(by_song)
+        metas = [{"song": by_song[s][0]['song'], "artist": by_song[s][0]['artist']} for s in song_ids]
+
+        # Reserve rows first so sums and centroids line up with the song store
+        known = [s in self.songs.row_by_id for s in song_ids]
+        next_row = self.songs.count
+        rows = []
+        for s, is_known in zip(song_ids, known):
+            rows.append(self.songs.row_by_id[s] if is_known else next_row)
+            next_row += 0 if is_known else 1
+        if next_row > self.sum_capacity:
+            capacity = self.sum_capacity
+            while capacity < next_row:
+                capacity *= 2
+            self._open_song_sums(capacity)
+
+        rows = np.asarray(rows, dtype=np.int64)
+        for row, s in zip(rows, song_ids):
+            vectors = np.asarray(by_song[s][1])
+            if row >= self.songs.count:
+                self.song_sums[row] = 0
+                self.song_counts[row] = 0
+            self.song_sums[row] += vectors.sum(axis=0)
+            self.song_counts[row] += len(vectors)
+
+        sums = np.asarray(self.song_sums[rows])
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+        self.songs.upsert(song_ids, centroids, metas)
+        self.song_ivf.assign(rows, centroids)
+
+    def rebuild(self, nlist=None, sample_size=50000, seed=0):
+        """(Re)trains the song centroids' coarse centroids and reassigns every song."""
+        with self.lock:
+            store, ivf = self.songs, self.song_ivf
+            if store.count == 0:
+                return
+            lists = nlist or max(1, int(4 * np.sqrt(store.count)))
+            rng = np.random.default_rng(seed)
+            sample_rows = np.sort(rng.choice(store.count, min(sample_size, store.count), replace=False))
+            ivf.train(store.vectors_for(sample_rows), lists, seed=seed)
+            ivf.trained_count = store.count
+            ivf.lists, ivf.list_sizes = {}, {}
+            ivf.count = 0
+            for start in range(0, store.count, 65536):
+                block = np.arange(start, min(start + 65536, store.count))
+                ivf.assign(block, store.vectors_for(block))
+            self.save()
+
+    def needs_rebuild(self, growth=4.0):
+        """True once the data has grown enough that the trained centroids are stale."""
+        if not self.song_ivf.trained:
+            return self.chunks.count >= self.min_train_size
+        return self.songs.count >= growth * self.song_ivf.trained_count
+
+    def save(self):
+        with self.lock:
+            self.song_sums.flush()
+            self.song_counts.flush()
+            self.song_ivf.save()
+
+    def close(self):
+        """Saves and releases the index so another process (or a reopen) can use it."""
+        with self.lock:
+            self.save()
+            self.chunks.close()
+            self.songs.close()
+
+    # --- SEARCH ---
+    def _nearest(self, store, ivf, query, k, exclude_song, nprobe):
+        if not ivf.trained:
+            return store.search(query, k=k, exclude_song=exclude_song)
+        rows = ivf.candidates(query, nprobe or self.nprobe)
+        exclude_code = store.song_codes.get(exclude_song) if exclude_song is not None else None
+        if exclude_code is not None:
+            rows = rows[np.asarray(store.songs[rows]) != exclude_code]
+        if len(rows) == 0:
+            return []
+        rows = np.sort(rows)
+        scores = store.vectors_for(rows) @ query
+        top = np.argsort(-scores)[:k]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def distractor_songs(self, query_embedding, k=3, exclude_song=None, exclude_artist=None, nprobe=None):
+        """
+        The k songs whose centroids are closest to the query, skipping the correct song
+        (and optionally its artist, so the answer can't be guessed by artist name).
+        """
+        query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        # Over-fetch: the artist filter is applied after scoring
+        hits = self._nearest(self.songs, self.song_ivf, query, k * 4 + 1, None, nprobe)
+        picked = []
+        for row, score in hits:
+            meta = self.songs.metadatas[row]
+            if meta['song'] == exclude_song or (exclude_artist and meta['artist'] == exclude_artist):
+                continue
+            picked.append({"song": meta['song'], "artist": meta['artist'], "score": score})
+            if len(picked) == k:
+                break
+        return picked
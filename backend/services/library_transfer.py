@@ -0,0 +1,156 @@
+import os
+import time
+import threading
+import contextvars
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .rate_limit import RateLimiter, is_rate_limited
+from .tracing import span, traced
+from .commit_stage import AdaptiveCommitter
+
+# One budget for the whole job: every YT Music call (search or add) takes a token
+LIBRARY_RATE_LIMIT = float(os.getenv("LIBRARY_RATE_LIMIT", "5"))  # calls per second
+LIBRARY_WORKERS = int(os.getenv("LIBRARY_WORKERS", "8"))
+MAX_RETRIES = 3
+
+
+def _with_budget(limiter, func, *args):
+    """Runs a YT Music call inside the shared budget, backing off on HTTP 429."""
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire()
+        try:
+            return func(*args)
+        except Exception as e:
+            if not is_rate_limited(e) or attempt == MAX_RETRIES:
+                raise
+            time.sleep(2 ** attempt)
+
+
+@traced("run_library_transfer")
+def run_library_transfer(yt, playlists, fetch_tracks, resolve_video_id, status,
+                         workers=LIBRARY_WORKERS, rate_limit=LIBRARY_RATE_LIMIT, match_stats=None):
+    """
+    Transfers many playlists as one job.
+
+    The union of tracks across all playlists is resolved once (searches run concurrently,
+    sharing one rate-limit budget), then each destination playlist is created and filled
+    from the shared track -> videoId map.
+
+    - `playlists`: [(spotify_playlist_id, name)]
+    - `fetch_tracks(playlist_id)`: [matching.Track] for one playlist
+    - `resolve_video_id(track, call)`: best videoId or None, making every YT Music search
+      through `call(func, *args)` so each one takes a token from the job's budget
+    - `status`: dict updated in place for progress polling
+    - `match_stats`: optional MatchStats fed by `resolve_video_id`, reported under "match"
+    """
+    limiter = RateLimiter(rate_limit, burst=max(1, workers))
+    status.update({
+        "status": "processing",
+        "phase": "reading playlists",
+        "playlists_total": len(playlists),
+        "playlists_done": 0,
+        "tracks_total": 0,
+        "unique_tracks": 0,
+        "resolved": 0,
+        "matched": 0,
+        "unmatched": 0,
+        "current_playlist": None,
+        "results": [],
+        "error": None,
+    })
+
+    # 1. Read every playlist and build the union of unique tracks. Playlists only keep
+    # track ids, so a track shared by many playlists is held as one record.
+    playlist_tracks = {}
+    unique = {}
+    occurrences = Counter()
+    for playlist_id, name in playlists:
+        status["current_playlist"] = name
+        tracks = fetch_tracks(playlist_id)
+        playlist_tracks[playlist_id] = [t.id for t in tracks]
+        for t in tracks:
+            unique.setdefault(t.id, t)
+            occurrences[t.id] += 1
+        status["tracks_total"] += len(tracks)
+    status["unique_tracks"] = len(unique)
+    print(f"📚 Library job: {status['tracks_total']} tracks, {len(unique)} unique across {len(playlists)} playlists")
+
+    # 2. Resolve each unique track once, concurrently
+    status["phase"] = "matching"
+    video_ids = {}
+    counter_lock = threading.Lock()
+    searches_saved = 0
+
+    def resolve(track):
+        """(videoId or None, YT Music searches it took)"""
+        searches = 0
+
+        def call(func, *args):
+            nonlocal searches
+            searches += 1
+            return _with_budget(limiter, func, *args)
+
+        try:
+            return resolve_video_id(track, call), searches
+        except Exception as e:
+            print(f"   ❌ Search failed for {track.name}: {e}")
+            return None, searches
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Each worker runs in a copy of this context so its search spans nest under the job's trace
+        futures = {pool.submit(contextvars.copy_context().run, resolve, t): track_id
+                   for track_id, t in unique.items()}
+        for future in as_completed(futures):
+            track_id = futures[future]
+            video_id, searches = future.result()
+            video_ids[track_id] = video_id
+            # Every repeat of this track in another playlist would have repeated its searches
+            searches_saved += searches * (occurrences[track_id] - 1)
+            with counter_lock:
+                status["resolved"] += 1
+                status["matched" if video_id else "unmatched"] += 1
+
+    # 3. Fan the resolved videoIds out into each destination playlist. Every playlist gets
+    # its own adaptive committer, so commits to different playlists run in parallel.
+    status["phase"] = "writing playlists"
+    budgeted = lambda func, *args: (limiter.acquire(), func(*args))[1]
+    committers = []
+    for playlist_id, name in playlists:
+        status["current_playlist"] = name
+        ids = [video_ids[track_id] for track_id in playlist_tracks[playlist_id] if video_ids.get(track_id)]
+        try:
+            with span("yt.create_playlist", external="ytmusic"):
+                yt_playlist_id = _with_budget(limiter, yt.create_playlist, name, "Transferred by MelodyMind")
+        except Exception as e:
+            # One failed destination shouldn't sink the rest of the library
+            print(f"   ❌ Playlist {name} failed: {e}")
+            status["results"].append({"playlist_id": playlist_id, "name": name, "error": str(e)})
+            status["playlists_done"] += 1
+            continue
+        committer = AdaptiveCommitter(yt, yt_playlist_id, call=budgeted)
+        committer.submit(ids)
+        committers.append((playlist_id, name, yt_playlist_id, committer))
+
+    for playlist_id, name, yt_playlist_id, committer in committers:
+        status["current_playlist"] = name
+        try:
+            summary = committer.close()
+            status["results"].append({"playlist_id": playlist_id, "name": name,
+                                      "yt_playlist_id": yt_playlist_id, "added": summary['committed'],
+                                      "failed_items": summary['failed'],
+                                      "missing": len(playlist_tracks[playlist_id]) - summary['committed']})
+        except Exception as e:
+            print(f"   ❌ Playlist {name} failed: {e}")
+            status["results"].append({"playlist_id": playlist_id, "name": name, "error": str(e)})
+        status["playlists_done"] += 1
+
+    failed = sum(1 for r in status["results"] if "error" in r)
+    status.update({
+        "status": "completed" if not failed else "completed_with_errors",
+        "phase": "done",
+        "current_playlist": None,
+        "searches_saved": searches_saved,
+        **({"match": match_stats.summary()} if match_stats is not None else {}),
+    })
+    print(f"🎉 Library job done: {status['matched']}/{status['unique_tracks']} matched, {failed} playlists failed")
+    return status
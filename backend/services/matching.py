@@ -0,0 +1,241 @@
+import re
+import sys
+import difflib
+import threading
+from .tracing import span
+
+DURATION_TOLERANCE_S = 3  # The same recording rarely differs by more between services
+DURATION_FALLOFF_S = 15  # Beyond the tolerance, duration agreement fades to 0 over this many seconds
+HIGH_CONFIDENCE = 0.8  # Accept straight from the first search page
+MIN_CONFIDENCE = 0.6  # Below this (or with no artist overlap) the track stays unmatched
+TOP_RESULTS = 5
+
+WEIGHTS = {"title": 0.35, "artists": 0.35, "duration": 0.25, "album": 0.05}
+
+# "Song - 2011 Remaster", "Song (Radio Edit)", "Song [Mono]" all name the same recording
+_VERSION_TAG = re.compile(
+    r"\s*(\([^)]*\)|\[[^\]]*\]|-\s.*)$"
+)
+_SAME_RECORDING = ("remaster", "radio edit", "single version", "album version", "mono", "stereo", "explicit")
+# Words that mark a different recording when the Spotify title doesn't have them
+_VARIANT_WORDS = ("live", "remix", "cover", "karaoke", "instrumental", "acoustic", "tribute",
+                  "sped up", "slowed", "8d", "reprise", "demo")
+
+
+class Track:
+    """
+    Compact record for one Spotify track, kept from playlist extraction through matching.
+
+    `__slots__` drops the per-object dict, and artist/album strings are interned so a
+    library of 10k+ tracks shares one copy of each name instead of one per track.
+    """
+    __slots__ = ("id", "name", "artists", "album", "duration_ms", "isrc")
+
+    def __init__(self, id, name, artists=(), album=None, duration_ms=None, isrc=None):
+        self.id = sys.intern(id)
+        self.name = name
+        self.artists = tuple(sys.intern(a) for a in artists)
+        self.album = sys.intern(album) if album else None
+        self.duration_ms = duration_ms
+        self.isrc = isrc
+
+    @property
+    def artist(self):
+        return self.artists[0] if self.artists else ""
+
+    def to_dict(self):
+        return {"id": self.id, "name": self.name, "artist": self.artist, "artists": list(self.artists),
+                "album": self.album, "duration_ms": self.duration_ms, "isrc": self.isrc}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['name'], data.get('artists') or [data['artist']], data.get('album'),
+                   data.get('duration_ms'), data.get('isrc'))
+
+
+def track_from_spotify(track):
+    """Reduces a Spotify track object to what matching needs."""
+    return Track(
+        track['id'],
+        track['name'],
+        [a['name'] for a in track.get('artists') or [] if a.get('name')],
+        (track.get('album') or {}).get('name'),
+        track.get('duration_ms'),
+        (track.get('external_ids') or {}).get('isrc'),
+    )
+
+
+def normalize_title(title):
+    """Lowercases and strips trailing tags that don't change the recording (remaster, mono...)."""
+    title = title.lower().strip()
+    while True:
+        tag = _VERSION_TAG.search(title)
+        if not tag or not any(word in tag.group(1) for word in _SAME_RECORDING):
+            return title
+        title = title[:tag.start()].strip()
+
+
+def _artist_score(target_artists, result_artists):
+    """Share of the Spotify artists that appear among the result's artists."""
+    if not target_artists:
+        return 0.0
+    result_artists = [a.lower() for a in result_artists]
+    hits = sum(1 for t in target_artists
+               if any(t.lower() in a or a in t.lower() for a in result_artists if a))
+    return hits / len(target_artists)
+
+
+def _duration_score(target_ms, result_s):
+    if not target_ms or result_s is None:
+        return 0.5  # Unknown: neither evidence for nor against
+    delta = abs(target_ms / 1000 - result_s)
+    if delta <= DURATION_TOLERANCE_S:
+        return 1.0
+    return max(0.0, 1.0 - (delta - DURATION_TOLERANCE_S) / DURATION_FALLOFF_S)
+
+
+def _result_duration_s(item):
+    if item.get('duration_seconds') is not None:
+        return item['duration_seconds']
+    parts = (item.get('duration') or "").split(":")
+    if not all(p.isdigit() for p in parts) or parts == [""]:
+        return None
+    seconds = 0
+    for p in parts:
+        seconds = seconds * 60 + int(p)
+    return seconds
+
+
+def score_result(item, track):
+    """
+    Confidence in [0, 1] that a YT Music search result is the Spotify track: a weighted mix
+    of title similarity, artist overlap (all artists, not just the first), duration
+    agreement and album similarity. Returns (confidence, artist_score).
+    """
+    t_title = normalize_title(track.name)
+    r_title = normalize_title(item.get('title') or "")
+    title = difflib.SequenceMatcher(None, t_title, r_title).ratio()
+
+    # Live/remix/cover uploads share the title but are a different recording
+    r_text = f"{item.get('title') or ''} {(item.get('album') or {}).get('name') or ''}".lower()
+    if any(w in r_text and w not in track.name.lower() for w in _VARIANT_WORDS):
+        title *= 0.5
+
+    artists = _artist_score(track.artists or [track.artist], [a['name'] for a in item.get('artists') or []])
+    duration = _duration_score(track.duration_ms, _result_duration_s(item))
+
+    album = 0.0
+    r_album = (item.get('album') or {}).get('name')
+    if track.album and r_album:
+        album = difflib.SequenceMatcher(None, normalize_title(track.album), normalize_title(r_album)).ratio()
+
+    confidence = (WEIGHTS["title"] * title + WEIGHTS["artists"] * artists
+                  + WEIGHTS["duration"] * duration + WEIGHTS["album"] * album)
+    return confidence, artists
+
+
+def best_match(results, track):
+    """Best of the top search results as (videoId, confidence, artist_score), or (None, 0, 0)."""
+    best = (None, 0.0, 0.0)
+    for item in (results or [])[:TOP_RESULTS]:
+        if not item.get('videoId'):
+            continue
+        confidence, artists = score_result(item, track)
+        if confidence > best[1]:
+            best = (item['videoId'], confidence, artists)
+    return best
+
+
+def primary_query(track):
+    return f"{track.name} by {track.artist}"
+
+
+def specific_queries(track):
+    """
+    Narrower follow-up queries, in order: the ISRC when Spotify has one, then title + every
+    artist + album. YT Music doesn't document ISRC search, so the text query stays as the
+    fallback for when the ISRC one finds nothing confident.
+    """
+    parts = [track.name, *track.artists]
+    if track.album:
+        parts.append(track.album)
+    return [track.isrc, " ".join(parts)] if track.isrc else [" ".join(parts)]
+
+
+class MatchStats:
+    """
+    Per-job matching counters. `mismatch_rate` is the share of accepted matches that were
+    below HIGH_CONFIDENCE, i.e. the ones most likely to be the wrong recording.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tracks = 0
+        self.searches = 0
+        self.second_queries = 0
+        self.confident = 0
+        self.low_confidence = 0
+        self.unmatched = 0
+
+    def record(self, searches, confidence, matched):
+        with self.lock:
+            self.tracks += 1
+            self.searches += searches
+            self.second_queries += searches > 1
+            if not matched:
+                self.unmatched += 1
+            elif confidence >= HIGH_CONFIDENCE:
+                self.confident += 1
+            else:
+                self.low_confidence += 1
+
+    def summary(self):
+        with self.lock:
+            matched = self.confident + self.low_confidence
+            return {
+                "tracks": self.tracks,
+                "search_calls": self.searches,
+                "searches_per_track": round(self.searches / self.tracks, 3) if self.tracks else 0.0,
+                "second_queries": self.second_queries,
+                "unmatched": self.unmatched,
+                "low_confidence": self.low_confidence,
+                "mismatch_rate": round(self.low_confidence / matched, 4) if matched else 0.0,
+            }
+
+
+def _search(yt, query, call=None):
+    with span("yt.search", external="ytmusic") as s:
+        results = call(yt.search, query, "songs") if call else yt.search(query, filter="songs")
+        s.set(results=len(results or []))
+    return results
+
+
+def resolve_track(yt, track, stats=None, call=None):
+    """
+    Searches YT Music for one track and returns the best matching videoId (or None).
+
+    The first page is usually enough once duration and all artists are compared; more
+    specific queries are only spent while the best candidate so far is low confidence.
+    `call(func, *args)` wraps each search, e.g. to take it from a shared rate-limit budget.
+    """
+    searches = 1
+    with span("match") as s:
+        video_id, confidence, artists = best_match(_search(yt, primary_query(track), call), track)
+        for query in specific_queries(track):
+            if confidence >= HIGH_CONFIDENCE:
+                break
+            searches += 1
+            retry = best_match(_search(yt, query, call), track)
+            if retry[1] > confidence:
+                video_id, confidence, artists = retry
+
+        matched = video_id is not None and confidence >= MIN_CONFIDENCE and artists > 0
+        s.set(confidence=round(confidence, 3), searches=searches, matched=matched)
+
+    if stats is not None:
+        stats.record(searches, confidence, matched)
+    if not matched:
+        return None
+    if confidence < HIGH_CONFIDENCE:
+        print(f" ⚠️ Low-confidence match ({confidence:.2f}) for '{track.name}' by {track.artist}")
+    return video_id
@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import random
+import base64
+import threading
+from collections import Counter
+import numpy as np
+from .tracing import span
+
+PLAYLIST_PROFILE_PATH = os.getenv("PLAYLIST_PROFILE_PATH", "./playlist_profiles")
+PROFILE_MAX_TRACKS = int(os.getenv("PROFILE_MAX_TRACKS", "1000"))  # Pages streamed per rebuild
+SAMPLE_SIZE = 50  # Tracks kept (reservoir-sampled) for quiz song sampling
+VIBE_WEIGHT = 1.0  # Extra sampling weight of a song whose lyrics match the playlist centroid
+TOP_ARTISTS = 50  # Artists kept with weights
+FEATURED_WEIGHT = 0.5  # Credit for non-primary artists on a track
+
+
+def song_key(song, artist):
+    return f"{artist}_{song}"
+
+
+def _encode_vector(vector):
+    return base64.b64encode(np.asarray(vector, dtype=np.float16).tobytes()).decode("ascii")
+
+
+def _decode_vector(text):
+    return np.frombuffer(base64.b64decode(text), dtype=np.float16).astype(np.float32)
+
+
+class ProfileBuilder:
+    """
+    Aggregates a playlist one page at a time, so a profile never needs the whole
+    playlist (or its raw Spotify JSON) in memory.
+    """
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+        self.artists = Counter()
+        self.track_count = 0
+        self.sample = []
+        self.song_keys = set()
+
+    def add_page(self, items):
+        for item in items:
+            track = item.get('track')
+            if not track or not track.get('id'):
+                continue
+            names = [a['name'] for a in track.get('artists') or [] if a.get('name')]
+            if not names:
+                continue
+            self.artists[names[0]] += 1.0
+            for name in names[1:]:
+                self.artists[name] += FEATURED_WEIGHT
+            self.song_keys.add(song_key(track['name'], names[0]))
+
+            # Reservoir sampling keeps a uniform sample of everything streamed so far
+            record = {"id": track['id'], "name": track['name'], "artist": names[0]}
+            self.track_count += 1
+            if len(self.sample) < SAMPLE_SIZE:
+                self.sample.append(record)
+            else:
+                j = self.rng.randrange(self.track_count)
+                if j < SAMPLE_SIZE:
+                    self.sample[j] = record
+
+    def profile(self, playlist_id, snapshot_id, previous=None):
+        total = sum(self.artists.values()) or 1.0
+        top = self.artists.most_common(TOP_ARTISTS)
+        # Lyric vectors of songs still on the playlist carry over to the new snapshot
+        song_vectors = {k: v for k, v in ((previous or {}).get('song_vectors') or {}).items()
+                        if k in self.song_keys}
+        return {
+            "playlist_id": playlist_id,
+            "snapshot_id": snapshot_id,
+            "updated": time.time(),
+            "track_count": self.track_count,
+            "top_artists": [name for name, _ in top],
+            "artist_weights": {name: round(count / total, 5) for name, count in top},
+            "sample": self.sample,
+            "song_keys": sorted(self.song_keys),
+            "song_vectors": song_vectors,
+        }
+
+
+class PlaylistProfileStore:
+    """
+    One JSON file per playlist profile:
+
+    {"playlist_id", "snapshot_id", "updated", "track_count", "top_artists",
+     "artist_weights": {artist: share}, "sample": [{"id", "name", "artist"}],
+     "song_keys": [...], "song_vectors": {song_key: base64 float16 mean lyric embedding}}
+    """
+
+    def __init__(self, path=PLAYLIST_PROFILE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.cache = {}
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, playlist_id):
+        return os.path.join(self.path, f"{playlist_id}.json")
+
+    def get(self, playlist_id):
+        with self.lock:
+            if playlist_id not in self.cache:
+                path = self._file(playlist_id)
+                if not os.path.exists(path):
+                    return None
+                with open(path, encoding="utf-8") as f:
+                    self.cache[playlist_id] = json.load(f)
+            return self.cache[playlist_id]
+
+    def put(self, playlist_id, profile):
+        with self.lock:
+            self.cache[playlist_id] = profile
+            # Write-then-rename so a crash never leaves a truncated profile
+            tmp_path = self._file(playlist_id) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(profile, f)
+            os.replace(tmp_path, self._file(playlist_id))
+
+    def missing_vectors(self, playlist_id, tracks):
+        """The tracks ({"name", "artist"}) on this playlist whose lyric vector isn't folded in yet."""
+        profile = self.get(playlist_id)
+        if profile is None:
+            return []
+        known = set(profile['song_keys'])
+        return [t for t in tracks if song_key(t['name'], t['artist']) in known
+                and song_key(t['name'], t['artist']) not in profile['song_vectors']]
+
+    def add_song_vectors(self, playlist_id, vectors):
+        """Folds mean lyric embeddings ({song_key: vector}) of ingested songs into the centroid."""
+        profile = self.get(playlist_id)
+        if profile is None or not vectors:
+            return
+        known = set(profile['song_keys'])
+        fresh = {k: _encode_vector(v) for k, v in vectors.items()
+                 if k in known and k not in profile['song_vectors']}
+        if fresh:
+            self.put(playlist_id, {**profile, "song_vectors": {**profile['song_vectors'], **fresh}})
+
+
+def build_profile(sp, playlist_id, snapshot_id, previous=None, max_tracks=PROFILE_MAX_TRACKS):
+    """Streams the playlist page by page into a fresh profile."""
+    builder = ProfileBuilder(seed=snapshot_id)
+    with span("spotify.playlist_items", external="spotify"):
+        page = sp.playlist_items(playlist_id, limit=100)
+    while page:
+        builder.add_page(page['items'])
+        if not page['next'] or builder.track_count >= max_tracks:
+            break
+        with span("spotify.playlist_items", external="spotify"):
+            page = sp.next(page)
+    return builder.profile(playlist_id, snapshot_id, previous)
+
+
+def get_profile(sp, store, playlist_id, snapshot_id=None):
+    """
+    The playlist's profile, rebuilt only when Spotify's snapshot_id says the playlist
+    changed. Costs one small Spotify call when it is still fresh.
+    """
+    if snapshot_id is None:
+        with span("spotify.playlist", external="spotify"):
+            snapshot_id = sp.playlist(playlist_id, fields="snapshot_id")['snapshot_id']
+    previous = store.get(playlist_id)
+    if previous and previous['snapshot_id'] == snapshot_id:
+        return previous
+    with span("build_playlist_profile", playlist=playlist_id) as s:
+        profile = build_profile(sp, playlist_id, snapshot_id, previous)
+        s.set(tracks=profile['track_count'])
+    store.put(playlist_id, profile)
+    return profile
+
+
+def top_artists(profile, n=10):
+    return profile['top_artists'][:n]
+
+
+def sample_tracks(profile, k):
+    """
+    k random tracks ({"name", "artist"}) from the profile's sample, without re-reading Spotify.
+
+    Songs with a known lyric vector are weighted up by their similarity to the playlist
+    centroid, so quizzes lean towards songs typical of the playlist (and already ingested).
+    """
+    center = centroid(profile)
+    weights = []
+    for t in profile['sample']:
+        vector = profile['song_vectors'].get(song_key(t['name'], t['artist'])) if center is not None else None
+        weights.append(1.0 + VIBE_WEIGHT * max(0.0, float(_decode_vector(vector) @ center)) if vector else 1.0)
+    # Weighted sampling without replacement: keep the k largest random()^(1/weight)
+    keys = [random.random() ** (1.0 / w) for w in weights]
+    picked = sorted(range(len(keys)), key=keys.__getitem__, reverse=True)[:k]
+    return [{"name": profile['sample'][i]['name'], "artist": profile['sample'][i]['artist']} for i in picked]
+
+
+def sample_first_page(sp, playlist_id, k):
+    """k random tracks from the playlist's first page, for playlists without a profile yet."""
+    builder = ProfileBuilder()
+    with span("spotify.playlist_items", external="spotify"):
+        builder.add_page(sp.playlist_items(playlist_id, limit=100)['items'])
+    picked = random.sample(builder.sample, min(k, len(builder.sample)))
+    return [{"name": t['name'], "artist": t['artist']} for t in picked]
+
+
+def centroid(profile):
+    """Normalized mean lyric embedding of the playlist's ingested songs, or None."""
+    vectors = [_decode_vector(v) for v in profile['song_vectors'].values()]
+    if not vectors:
+        return None
+    mean = np.mean(vectors, axis=0)
+    return mean / max(float(np.linalg.norm(mean)), 1e-9)
@@ -0,0 +1,227 @@
+import os
+import json
+import threading
+from collections import defaultdict, deque
+from .tracing import span
+
+SYNC_STATE_PATH = os.getenv("SYNC_STATE_PATH", "./sync_state.json")
+REMOVE_BATCH_SIZE = 50
+
+
+class SyncStateStore:
+    """
+    Remembers, per Spotify playlist, the YouTube Music playlist it was synced to, the
+    Spotify snapshot_id at that time, and which videoId/setVideoId each track became.
+
+    {spotify_playlist_id: {"yt_playlist_id", "snapshot_id", "name",
+                           "tracks": [{"key", "id", "videoId", "setVideoId"}]}}
+    """
+
+    def __init__(self, path=SYNC_STATE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def get(self, playlist_id):
+        with self.lock:
+            return self.state.get(playlist_id)
+
+    def put(self, playlist_id, entry):
+        with self.lock:
+            self.state[playlist_id] = entry
+            # Write-then-rename so a crash never leaves a truncated state file
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f)
+            os.replace(tmp_path, self.path)
+
+
+def keyed_tracks(tracks):
+    """
+    Gives every track a key that is stable across syncs and unique within the playlist:
+    the Spotify track id plus its occurrence number, so duplicates diff correctly.
+    """
+    seen = defaultdict(int)
+    keyed = []
+    for t in tracks:
+        key = f"{t.id}#{seen[t.id]}"
+        seen[t.id] += 1
+        keyed.append((key, t))
+    return keyed
+
+
+def diff_tracks(old_keys, new_keys):
+    """Returns (added, removed, reordered) between two ordered key lists."""
+    old_set, new_set = set(old_keys), set(new_keys)
+    added = [k for k in new_keys if k not in old_set]
+    removed = [k for k in old_keys if k not in new_set]
+    kept_old = [k for k in old_keys if k in new_set]
+    kept_new = [k for k in new_keys if k in old_set]
+    return added, removed, kept_old != kept_new
+
+
+def plan_moves(current, target):
+    """
+    Minimal list of (item, before_item) moves turning `current` into `target` (same items).
+    Items on a longest increasing subsequence of target positions stay put; every other
+    item is moved before its successor in `target` (before_item None = move to the end).
+    """
+    position = {item: i for i, item in enumerate(target)}
+    seq = [position[item] for item in current]
+
+    # Patience-sorting LIS with back-pointers
+    tails, tails_idx, prev = [], [], [-1] * len(seq)
+    for i, p in enumerate(seq):
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tails[mid] < p:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == len(tails):
+            tails.append(p)
+            tails_idx.append(i)
+        else:
+            tails[lo] = p
+            tails_idx[lo] = i
+        prev[i] = tails_idx[lo - 1] if lo else -1
+    stay = set()
+    i = tails_idx[-1] if tails_idx else -1
+    while i >= 0:
+        stay.add(current[i])
+        i = prev[i]
+
+    # Walk the target backwards so each item's successor is already in its final place
+    moves = []
+    for i in range(len(target) - 1, -1, -1):
+        if target[i] not in stay:
+            moves.append((target[i], target[i + 1] if i + 1 < len(target) else None))
+    return moves
+
+
+def sync_playlist(yt, store, playlist_id, name, snapshot_id, tracks, resolve_video_id,
+                  add_batch, on_progress=None):
+    """
+    Brings the YouTube Music copy of a Spotify playlist up to date by applying only the
+    difference since the last sync.
+
+    - `resolve_video_id(track)` searches/matches one track, returning a videoId or None.
+    - `add_batch(yt_playlist_id, video_ids)` adds videos and returns a commit summary with
+      the videoIds that could not be added under "failed".
+    - `on_progress(done, total, label)` is called while new tracks are being resolved.
+
+    Returns a summary dict: created, added, removed, moved, unmatched.
+    """
+    entry = store.get(playlist_id)
+    summary = {"created": False, "added": 0, "removed": 0, "moved": 0, "unmatched": 0}
+
+    def checkpoint(records):
+        # Progress so far, saved as soon as it is applied on YT Music. No snapshot_id: if the
+        # sync dies after this, the next one still diffs, but against what really happened.
+        store.put(playlist_id, {"yt_playlist_id": yt_playlist_id, "snapshot_id": None,
+                                "name": name, "tracks": records})
+
+    if entry is None:
+        with span("yt.create_playlist", external="ytmusic"):
+            yt_playlist_id = yt.create_playlist(title=name, description="Synced by MelodyMind")
+        # Record the mapping now, or a failure later on would create a second playlist next time
+        checkpoint([])
+        old_tracks = []
+        summary["created"] = True
+    else:
+        yt_playlist_id = entry['yt_playlist_id']
+        old_tracks = entry['tracks']
+
+    new = keyed_tracks(tracks)
+    old_by_key = {t['key']: t for t in old_tracks}
+    added, removed, reordered = diff_tracks([t['key'] for t in old_tracks], [k for k, _ in new])
+
+    # 0. An interrupted sync checkpoints videoIds before adding them, so they may or may not
+    # be on YT Music. Those that are get their setVideoId; the rest go back to unmatched and
+    # are resolved and added again instead of being trusted (or added twice).
+    if any(t['videoId'] and not t['setVideoId'] for t in old_tracks):
+        with span("yt.get_playlist", external="ytmusic"):
+            _attach_set_video_ids(old_tracks, yt.get_playlist(yt_playlist_id, limit=None)['tracks'])
+        for t in old_tracks:
+            if t['videoId'] and not t['setVideoId']:
+                t['videoId'] = None
+
+    # 1. Remove tracks that left the Spotify playlist
+    to_remove = [old_by_key[k] for k in removed if old_by_key[k]['videoId'] and old_by_key[k]['setVideoId']]
+    for i in range(0, len(to_remove), REMOVE_BATCH_SIZE):
+        batch = to_remove[i:i + REMOVE_BATCH_SIZE]
+        with span("yt.remove_playlist_items", external="ytmusic", batch=len(batch)):
+            yt.remove_playlist_items(yt_playlist_id, [{"videoId": t['videoId'], "setVideoId": t['setVideoId']}
+                                                      for t in batch])
+        gone = {t['key'] for t in batch}
+        old_tracks = [t for t in old_tracks if t['key'] not in gone]
+        checkpoint(old_tracks)
+    summary["removed"] = len(to_remove)
+
+    # 2. Resolve new tracks (and earlier misses, which get another chance)
+    to_resolve = [(k, t) for k, t in new if k not in old_by_key or not old_by_key[k]['videoId']]
+    resolved = {}
+    for n, (key, t) in enumerate(to_resolve):
+        if on_progress:
+            on_progress(n + 1, len(to_resolve), f"{t.name} by {t.artist}")
+        resolved[key] = resolve_video_id(t)
+    summary["unmatched"] = sum(1 for v in resolved.values() if not v)
+
+    def records():
+        return [{"key": key, "id": t.id, "videoId": resolved[key], "setVideoId": None}
+                if key in resolved else dict(old_by_key[key]) for key, t in new]
+
+    new_video_ids = [resolved[k] for k, _ in to_resolve if resolved[k]]
+    rejected = set()
+    if new_video_ids:
+        # Saved before adding: if add_batch dies part-way, the next sync checks these
+        # against the YT playlist (step 0) rather than adding the committed ones again
+        checkpoint(records())
+        rejected = set(add_batch(yt_playlist_id, new_video_ids)['failed'])
+        # Rejected videos count as unmatched so the next sync tries them again
+        for key in resolved:
+            if resolved[key] in rejected:
+                resolved[key] = None
+    summary["added"] = len(new_video_ids) - sum(1 for v in new_video_ids if v in rejected)
+    summary["unmatched"] = sum(1 for v in resolved.values() if not v)
+
+    result = records()
+    if new_video_ids:
+        checkpoint(result)
+
+    # 3. Reorder: new videos land at the end, and kept tracks may have moved on Spotify
+    missing_set_ids = any(r['videoId'] and not r['setVideoId'] for r in result)
+    if summary["added"] or reordered or missing_set_ids:
+        with span("yt.get_playlist", external="ytmusic"):
+            items = yt.get_playlist(yt_playlist_id, limit=None)['tracks']
+        _attach_set_video_ids(result, items)
+
+        target = [r['setVideoId'] for r in result if r['setVideoId']]
+        target_set = set(target)
+        current = [i['setVideoId'] for i in items if i['setVideoId'] in target_set]
+        if current != target:
+            moves = plan_moves(current, target)
+            for set_id, before_id in moves:
+                with span("yt.edit_playlist.move", external="ytmusic"):
+                    yt.edit_playlist(yt_playlist_id, moveItem=(set_id, before_id) if before_id else set_id)
+            summary["moved"] = len(moves)
+
+    store.put(playlist_id, {"yt_playlist_id": yt_playlist_id, "snapshot_id": snapshot_id,
+                            "name": name, "tracks": result})
+    return summary
+
+
+def _attach_set_video_ids(records, playlist_items):
+    """Fills missing setVideoIds by handing out unclaimed playlist items with the same videoId."""
+    claimed = {r['setVideoId'] for r in records if r['setVideoId']}
+    free = defaultdict(deque)
+    for item in playlist_items:
+        if item.get('setVideoId') and item['setVideoId'] not in claimed:
+            free[item['videoId']].append(item['setVideoId'])
+    for r in records:
+        if r['videoId'] and not r['setVideoId'] and free[r['videoId']]:
+            r['setVideoId'] = free[r['videoId']].popleft()
@@ -0,0 +1,195 @@
+import os
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from .playlist_profile import get_profile, sample_tracks
+from .rate_limit import RateLimiter
+from .tracing import span
+
+PREFETCH_PLAYLISTS = int(os.getenv("PREFETCH_PLAYLISTS", "3"))  # 0 disables prefetching
+PREFETCH_TRACKS = int(os.getenv("PREFETCH_TRACKS", "5"))  # Songs a quiz samples per playlist
+# Lyric fetches per user... (a full listing is PREFETCH_PLAYLISTS x PREFETCH_TRACKS at most)
+PREFETCH_USER_BUDGET = int(os.getenv("PREFETCH_USER_BUDGET", "20"))
+PREFETCH_BUDGET_WINDOW_S = float(os.getenv("PREFETCH_BUDGET_WINDOW_S", "600"))  # ...per this many seconds
+FOLD_PRIORITY = 1_000_000  # Profile upkeep runs after every prefetch job
+
+
+class PrefetchScheduler:
+    """
+    Speculatively warms quiz context for playlists the user is likely to pick.
+
+    schedule() queues one low-priority job per listed playlist (earlier in the list runs
+    first). A job refreshes the playlist profile, picks the songs its quiz will use and
+    ingests them. prepare_quiz_for_playlist then takes that pick with take_planned(),
+    so the songs it ingests are the warm ones.
+
+    - A single worker thread runs jobs and pauses between steps while any foreground()
+      block is active, so it never competes with a request the user is waiting on.
+    - Each user has a token-bucket budget of lyric fetches; songs `is_warm` reports as
+      already ingested are free. Once it is spent, the remaining songs are dropped rather
+      than delayed.
+    - A playlist's pick is kept while its snapshot is unchanged, so listing again doesn't
+      throw away warm songs for a new random pick.
+    - A new schedule() for a user cancels that user's pending jobs, as does cancel().
+    - `fold(playlist_id, tracks)` (optional) folds ingested songs' lyric vectors into the
+      playlist profile; it runs here, after prefetches and for fold_later() requests, so
+      quiz requests never pay for it. So do refresh_later() profile rebuilds.
+    """
+
+    def __init__(self, ingest, profiles, user_budget=PREFETCH_USER_BUDGET, window_s=PREFETCH_BUDGET_WINDOW_S,
+                 tracks_per_playlist=PREFETCH_TRACKS, fold=None, is_warm=None):
+        self.ingest = ingest
+        self.is_warm = is_warm or (lambda artist, song: False)
+        self.profiles = profiles
+        self.fold = fold
+        self.user_budget = user_budget
+        self.window_s = window_s
+        self.tracks_per_playlist = tracks_per_playlist
+        self.cond = threading.Condition()
+        self.queue = []  # (priority, seq, job)
+        self.seq = itertools.count()
+        self.generations = {}  # user -> generation; jobs from older generations are cancelled
+        self.budgets = {}  # user -> RateLimiter
+        self.planned = {}  # playlist_id -> (snapshot_id, tracks)
+        self.foreground_count = 0
+        self.worker = None
+        self.counts = {"scheduled": 0, "ingested": 0, "warm": 0, "cancelled": 0, "over_budget": 0, "taken": 0}
+
+    # --- FOREGROUND ---
+    @contextmanager
+    def foreground(self):
+        """Wrap user-facing work: prefetching pauses until the block exits."""
+        with self.cond:
+            self.foreground_count += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.foreground_count -= 1
+                self.cond.notify_all()
+
+    def _yield_to_foreground(self):
+        with self.cond:
+            while self.foreground_count:
+                self.cond.wait()
+
+    # --- SCHEDULING ---
+    def schedule(self, user, sp, playlists):
+        """Queues prefetch for `playlists` ([(playlist_id, snapshot_id or None)]), most likely first."""
+        with self.cond:
+            generation = self.generations.get(user, 0) + 1
+            self.generations[user] = generation
+            for priority, (playlist_id, snapshot_id) in enumerate(playlists):
+                job = {"user": user, "generation": generation, "sp": sp,
+                       "playlist_id": playlist_id, "snapshot_id": snapshot_id}
+                heapq.heappush(self.queue, (priority, next(self.seq), job))
+                self.counts['scheduled'] += 1
+            self._ensure_worker()
+            self.cond.notify_all()
+
+    def _ensure_worker(self):
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = threading.Thread(target=self._run, name="prefetch", daemon=True)
+            self.worker.start()
+
+    def fold_later(self, playlist_id, tracks):
+        """Queues folding of songs a foreground request ingested, behind every prefetch."""
+        if self.fold is None:
+            return
+        with self.cond:
+            job = {"fold": True, "playlist_id": playlist_id, "tracks": list(tracks)}
+            heapq.heappush(self.queue, (FOLD_PRIORITY, next(self.seq), job))
+            self._ensure_worker()
+            self.cond.notify_all()
+
+    def refresh_later(self, sp, playlist_id):
+        """Queues a profile refresh (a snapshot check, and a rebuild if the playlist changed)."""
+        with self.cond:
+            job = {"refresh": True, "sp": sp, "playlist_id": playlist_id}
+            heapq.heappush(self.queue, (0, next(self.seq), job))
+            self._ensure_worker()
+            self.cond.notify_all()
+
+    def cancel(self, user):
+        """Drops every pending job of `user`. A job already ingesting stops after its current song."""
+        with self.cond:
+            self.generations[user] = self.generations.get(user, 0) + 1
+
+    def _cancelled(self, job):
+        return 'user' in job and self.generations.get(job['user']) != job['generation']
+
+    def take_planned(self, playlist_id, snapshot_id):
+        """The songs prefetched for this playlist snapshot (each pick is handed out once), or None."""
+        with self.cond:
+            plan = self.planned.pop(playlist_id, None)
+            if plan is None or plan[0] != snapshot_id:
+                return None
+            self.counts['taken'] += 1
+            return plan[1]
+
+    # --- WORKER ---
+    def _budget(self, user):
+        if user not in self.budgets:
+            self.budgets[user] = RateLimiter(self.user_budget / self.window_s, burst=self.user_budget)
+        return self.budgets[user]
+
+    def _next_job(self):
+        with self.cond:
+            while not self.queue:
+                self.cond.wait()
+            return heapq.heappop(self.queue)[2]
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if self._cancelled(job):
+                self.counts['cancelled'] += 1
+                continue
+            try:
+                if job.get('fold'):
+                    self._yield_to_foreground()
+                    self.fold(job['playlist_id'], job['tracks'])
+                elif job.get('refresh'):
+                    self._yield_to_foreground()
+                    get_profile(job['sp'], self.profiles, job['playlist_id'])
+                else:
+                    self._prefetch(job)
+            except Exception as e:
+                print(f"⚠️ Prefetch failed for {job['playlist_id']}: {e}")
+
+    def _prefetch(self, job):
+        self._yield_to_foreground()
+        with span("prefetch", playlist=job['playlist_id']) as s:
+            profile = get_profile(job['sp'], self.profiles, job['playlist_id'], job['snapshot_id'])
+            with self.cond:
+                plan = self.planned.get(job['playlist_id'])
+                if plan is None or plan[0] != profile['snapshot_id']:
+                    plan = self.planned[job['playlist_id']] = (
+                        profile['snapshot_id'], sample_tracks(profile, self.tracks_per_playlist))
+            tracks = plan[1]
+
+            ingested, warm = [], []
+            for t in tracks:
+                self._yield_to_foreground()
+                if self._cancelled(job):
+                    self.counts['cancelled'] += 1
+                    break
+                if self.is_warm(t['artist'], t['name']):
+                    warm.append(t)
+                    continue
+                if not self._budget(job['user']).try_acquire():
+                    self.counts['over_budget'] += 1
+                    break
+                self.ingest(t['artist'], t['name'])
+                ingested.append(t)
+            self.counts['ingested'] += len(ingested)
+            self.counts['warm'] += len(warm)
+            s.set(ingested=len(ingested), warm=len(warm))
+            if self.fold is not None and (ingested or warm):
+                # Warm songs may have been ingested for another playlist: fold them in here too
+                self.fold(job['playlist_id'], ingested + warm)
+
+    def stats(self):
+        with self.cond:
+            return {**self.counts, "pending": len(self.queue)}
@@ -0,0 +1,66 @@
+import os
+import threading
+
+# "live" talks to Spotify / YouTube Music / Genius / Gemini; "fake" uses the deterministic
+# offline implementations in services.fakes (for load tests and local development).
+PROVIDER_MODE = os.getenv("MELODYMIND_PROVIDERS", "live").lower()
+
+_fake_lock = threading.Lock()
+_fake_services = {}
+
+
+def use_fakes():
+    return PROVIDER_MODE == "fake"
+
+
+def _fake(name):
+    """Fake clients are process-wide singletons so their state (e.g. YT playlists) persists."""
+    with _fake_lock:
+        if name not in _fake_services:
+            from . import fakes
+            if "catalog" not in _fake_services:
+                _fake_services["catalog"] = fakes.load_catalog()
+            catalog = _fake_services["catalog"]
+            _fake_services[name] = {
+                "spotify": lambda: fakes.FakeSpotify(catalog),
+                "ytmusic": lambda: fakes.FakeYTMusic(catalog),
+                "genius": lambda: fakes.FakeGenius(),
+                "gemini": lambda: fakes.FakeGemini(),
+            }[name]()
+        return _fake_services[name]
+
+
+def spotify_client(access_token):
+    if use_fakes():
+        return _fake("spotify")
+    import spotipy
+    return spotipy.Spotify(auth=access_token)
+
+
+def ytmusic_client(client_secrets_file, oauth_credentials):
+    if use_fakes():
+        return _fake("ytmusic")
+    from ytmusicapi import YTMusic
+    return YTMusic(client_secrets_file, oauth_credentials=oauth_credentials)
+
+
+def lyrics_client(token):
+    if use_fakes():
+        return _fake("genius")
+    import lyricsgenius
+    return lyricsgenius.Genius(token, verbose=False, remove_section_headers=True)
+
+
+def embedding_model(name='all-MiniLM-L6-v2'):
+    if use_fakes():
+        from .fakes import FakeEmbedder
+        return FakeEmbedder()
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name)
+
+
+def llm_client(api_key):
+    if use_fakes():
+        return _fake("gemini")
+    from google import genai
+    return genai.Client(api_key=api_key)
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import base64
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from .quiz_pipeline import PROMPT_VERSION, GEMINI_MODEL, validate_question
+
+QUIZ_CACHE_TTL_S = float(os.getenv("QUIZ_CACHE_TTL_S", str(7 * 24 * 3600)))
+QUIZ_CACHE_MAX_ENTRIES = int(os.getenv("QUIZ_CACHE_MAX_ENTRIES", "20000"))
+
+
+def _encode_vector(vector):
+    if vector is None:
+        return None
+    return base64.b64encode(np.asarray(vector, dtype=np.float16).tobytes()).decode("ascii")
+
+
+def _decode_vector(text):
+    if not text:
+        return None
+    vector = np.frombuffer(base64.b64decode(text), dtype=np.float16).astype(np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-9)
+
+
+class QuizCache:
+    """
+    On-disk cache of validated LLM quiz questions, so popular songs stop costing Gemini calls.
+
+    - Key: (chunk id, mode, distractor set, prompt version, model). A new prompt version or
+      model never serves answers written for the old one.
+    - Each key keeps up to `max_variants` questions. A hit serves a random variant with its
+      options reshuffled, and with probability `refresh_rate` misses on purpose (while there
+      is room) so a fresh variant gets generated and the quiz doesn't feel canned.
+    - On an exact miss, a chunk of the same song whose embedding is at least
+      `near_duplicate_threshold` similar (e.g. a repeated chorus) can answer instead.
+    - Entries expire after `ttl_s`; beyond `max_entries` the least recently used go first.
+
+    Storage is an append-only JSONL log, compacted (write-then-rename) when it is mostly dead.
+    """
+
+    def __init__(self, path, ttl_s=QUIZ_CACHE_TTL_S, max_entries=QUIZ_CACHE_MAX_ENTRIES, max_variants=3,
+                 refresh_rate=0.15, near_duplicate_threshold=0.97):
+        self.path = path
+        self.log_path = os.path.join(path, "questions.jsonl")
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.max_variants = max_variants
+        self.refresh_rate = refresh_rate
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> {"created", "group", "embedding", "variants"}
+        self.by_group = {}  # (song, artist, mode, prompt version, model) -> {key}
+        self.log_lines = 0
+        self.live_lines = 0  # Variants still served; the rest of the log is dead weight
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    # --- KEYS ---
+    @staticmethod
+    def key(chunk_id, mode, distractors=None, model=GEMINI_MODEL, prompt_version=PROMPT_VERSION):
+        raw = json.dumps([prompt_version, model, chunk_id, mode, sorted(distractors or [])])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _group(spec, model, prompt_version):
+        return (spec.get('song'), spec.get('artist'), spec['mode'], prompt_version, model)
+
+    # --- PERSISTENCE ---
+    def _load(self):
+        if not os.path.exists(self.log_path):
+            return
+        now = time.time()
+        torn = False
+        with open(self.log_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-put can leave a torn line behind
+                    torn = True
+                    continue
+                self.log_lines += 1
+                if now - row['created'] > self.ttl_s:
+                    continue
+                self._add(row['key'], tuple(row['group']), row['created'],
+                          _decode_vector(row.get('embedding')), row['question'])
+        self._evict()
+        if torn:
+            # Rewrite without it, or the next append would be glued onto the torn line
+            self._compact()
+
+    def _add(self, key, group, created, embedding, question):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = {"created": created, "group": group, "embedding": embedding,
+                                         "variants": []}
+            self.by_group.setdefault(group, set()).add(key)
+        before = len(entry['variants'])
+        entry['variants'] = (entry['variants'] + [question])[-self.max_variants:]
+        self.live_lines += len(entry['variants']) - before
+        self.entries.move_to_end(key)
+
+    def _drop(self, key):
+        entry = self.entries.pop(key)
+        self.live_lines -= len(entry['variants'])
+        keys = self.by_group.get(entry['group'])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.by_group[entry['group']]
+
+    def _evict(self):
+        now = time.time()
+        for key in [k for k, e in self.entries.items() if now - e['created'] > self.ttl_s]:
+            self._drop(key)
+        while len(self.entries) > self.max_entries:
+            self._drop(next(iter(self.entries)))
+
+    def _compact(self):
+        """Rewrites the log with only live variants once most of it is expired or evicted."""
+        tmp_path = self.log_path + ".tmp"
+        lines = 0
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key, entry in self.entries.items():
+                for question in entry['variants']:
+                    f.write(json.dumps({"key": key, "group": list(entry['group']), "created": entry['created'],
+                                        "embedding": _encode_vector(entry['embedding']),
+                                        "question": question}) + "\n")
+                    lines += 1
+        os.replace(tmp_path, self.log_path)
+        self.log_lines = lines
+
+    # --- LOOKUP ---
+    def _serve(self, entry):
+        question = dict(random.choice(entry['variants']))
+        question['options'] = random.sample(question['options'], len(question['options']))
+        return question
+
+    def get(self, spec, model=GEMINI_MODEL, prompt_version=PROMPT_VERSION):
+        """
+        A cached question for `spec` ({"chunk_id", "mode", "distractors", "song", "artist",
+        optional "embedding"}), or None on a miss.
+        """
+        key = self.key(spec['chunk_id'], spec['mode'], spec.get('distractors'), model, prompt_version)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry['created'] > self.ttl_s:
+                self._drop(key)
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                if len(entry['variants']) < self.max_variants and random.random() < self.refresh_rate:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+                return self._serve(entry)
+
+            embedding = spec.get('embedding')
+            if embedding is not None and self.near_duplicate_threshold < 1:
+                query = np.asarray(embedding, dtype=np.float32)
+                query = query / max(float(np.linalg.norm(query)), 1e-9)
+                best, best_sim = None, self.near_duplicate_threshold
+                for other in self.by_group.get(self._group(spec, model, prompt_version), ()):
+                    candidate = self.entries[other]
+                    if candidate['embedding'] is None or now - candidate['created'] > self.ttl_s:
+                        continue
+                    sim = float(candidate['embedding'] @ query)
+                    if sim >= best_sim:
+                        best, best_sim = candidate, sim
+                if best is not None:
+                    self.near_hits += 1
+                    return self._serve(best)
+
+            self.misses += 1
+            return None
+
+    def put(self, spec, question, model=GEMINI_MODEL, prompt_version=PROMPT_VERSION):
+        """Stores a question for `spec`. Invalid questions are never cached."""
+        if validate_question(question):
+            return False
+        key = self.key(spec['chunk_id'], spec['mode'], spec.get('distractors'), model, prompt_version)
+        group = self._group(spec, model, prompt_version)
+        embedding = spec.get('embedding')
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            embedding = embedding / max(float(np.linalg.norm(embedding)), 1e-9)
+        with self.lock:
+            created = self.entries[key]['created'] if key in self.entries else time.time()
+            self._add(key, group, created, embedding, question)
+            self._evict()
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "group": list(group), "created": created,
+                                    "embedding": _encode_vector(embedding), "question": question}) + "\n")
+            self.log_lines += 1
+            if self.log_lines > 2 * self.live_lines + 100:
+                self._compact()
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "near_hits": self.near_hits,
+                    "misses": self.misses}
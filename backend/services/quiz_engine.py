@@ -1,12 +1,13 @@
 import os
-import random
-import json
-import lyricsgenius
 import chromadb
+import numpy as np
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-from google import genai
-from pydantic import BaseModel, Field
+from . import providers
+from .quiz_pipeline import TEMPLATE_SHARE, generate_questions, song_filter, sample_contexts, plan_questions
+from .compact_store import CompactVectorStore
+from .hard_negative_index import HardNegativeIndex
+from .quiz_cache import QuizCache
+from .tracing import span, traced
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,29 +15,89 @@ load_dotenv()
 # --- CONFIG ---
 GENIUS_TOKEN = os.getenv("GENIUS_TOKEN")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+# Optional: mirror embeddings into a quantized memory-mapped store and use it for
+# hard-negative search (e.g. COMPACT_STORE_PATH=./compact_store COMPACT_STORE_DTYPE=int8)
+COMPACT_STORE_PATH = os.getenv("COMPACT_STORE_PATH")
+COMPACT_STORE_DTYPE = os.getenv("COMPACT_STORE_DTYPE", "float16")
+# Optional: song-level ANN index for distractors (takes precedence over the stores above)
+HARD_NEGATIVE_INDEX_PATH = os.getenv("HARD_NEGATIVE_INDEX_PATH")
+# Validated LLM questions are reused across users; set QUIZ_CACHE_PATH= (empty) to disable
+QUIZ_CACHE_PATH = os.getenv("QUIZ_CACHE_PATH", "./quiz_cache")
 
 # Init Clients
-genius = lyricsgenius.Genius(
-    GENIUS_TOKEN, verbose=False, remove_section_headers=True)
-chroma_client = chromadb.PersistentClient(path="./chroma_db", settings=chromadb.Settings(allow_reset=True))
+# Genius, Gemini and the embedder come from services.providers (MELODYMIND_PROVIDERS=fake for offline runs)
+genius = providers.lyrics_client(GENIUS_TOKEN)
+chroma_client = chromadb.PersistentClient(path=CHROMA_PATH, settings=chromadb.Settings(allow_reset=True))
 # collection = chroma_client.get_or_create_collection(
 #     name="lyrics_knowledge_base")
 collection = None
-embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-client = genai.Client(api_key=GEMINI_API_KEY)
+embedding_model = providers.embedding_model('all-MiniLM-L6-v2')
+client = providers.llm_client(GEMINI_API_KEY)
 
 
-class QuizQuestion(BaseModel):
-    question: str = Field(description="The text of the question.")
-    options: list[str] = Field(
-        description="A list of multiple-choice options.")
-    correct_answer: str = Field(
-        description="The correct answer from the options.")
-    explanation: str = Field(
-        description="A brief explanation of why the answer is correct.")
-    difficulty: str
+def open_mirror(open_store, path):
+    """Opens an optional vector mirror; one another process holds is skipped, not fatal."""
+    if not path:
+        return None
+    try:
+        return open_store(path)
+    except RuntimeError as e:
+        # Chroma stays complete: quick_ingest mirrors skipped songs once the store is ours again
+        print(f"⚠️ {e} Running without it.")
+        return None
+
+
+compact_store = open_mirror(lambda path: CompactVectorStore(path, dtype=COMPACT_STORE_DTYPE), COMPACT_STORE_PATH)
+hard_negative_index = open_mirror(HardNegativeIndex, HARD_NEGATIVE_INDEX_PATH)
+quiz_cache = QuizCache(QUIZ_CACHE_PATH) if QUIZ_CACHE_PATH else None
 
 
+def engine_stats():
+    """Gauges for /metrics: quiz cache effectiveness and how much vector data each mirror scans."""
+    stats = {}
+    if quiz_cache is not None:
+        stats.update({f"quiz_cache_{k}": v for k, v in quiz_cache.stats().items()})
+    if compact_store is not None:
+        stats['compact_store_resident_bytes'] = compact_store.resident_bytes()
+    if hard_negative_index is not None:
+        stats['hard_negative_index_resident_bytes'] = (hard_negative_index.chunks.resident_bytes()
+                                                       + hard_negative_index.songs.resident_bytes())
+    return stats
+
+
+def is_ingested(artist, song_title):
+    """True when the song's lyrics are already in the store (ingesting it costs no Genius call)."""
+    global collection
+    if not collection:
+        collection = chroma_client.get_or_create_collection(name="lyrics_knowledge_base")
+    with span("chroma.get_existing", song=song_title):
+        where = song_filter([{"name": song_title, "artist": artist}])
+        return bool(collection.get(where=where, limit=1)['ids'])
+
+
+def mirror_existing(song_title, existing):
+    """
+    Mirrors a song that is already in Chroma into whichever optional store lacks it, e.g.
+    songs ingested before COMPACT_STORE_PATH was set or by the bulk ingest CLI.
+    """
+    missing_compact = compact_store is not None and existing['ids'][0] not in compact_store.row_by_id
+    missing_index = (hard_negative_index is not None and hard_negative_index.song_id(existing['metadatas'][0])
+                     not in hard_negative_index.songs.row_by_id)
+    if not (missing_compact or missing_index):
+        return
+    with span("chroma.get_embeddings", song=song_title):
+        existing = collection.get(ids=existing['ids'], include=["metadatas", "embeddings"])
+    embeds = np.asarray(existing['embeddings'], dtype=np.float32)
+    if missing_compact:
+        with span("compact_store.upsert", chunks=len(embeds)):
+            compact_store.upsert(existing['ids'], embeds, existing['metadatas'])
+    if missing_index:
+        with span("hard_negative_index.add", chunks=len(embeds)):
+            hard_negative_index.add(existing['ids'], embeds, existing['metadatas'])
+
+
+@traced("quick_ingest")
 def quick_ingest(artist, song_title):
     """Fetches lyrics and stores them immediately for the quiz."""
     global collection
@@ -45,11 +106,15 @@ def quick_ingest(artist, song_title):
         
     try:
         # Check if already exists to save API calls
-        existing = collection.get(where={"song": song_title})
+        with span("chroma.get_existing", song=song_title):
+            existing = collection.get(where=song_filter([{"name": song_title, "artist": artist}]))
         if existing['ids']:
+            mirror_existing(song_title, existing)
             return True
 
-        song = genius.search_song(song_title, artist)
+        with span("genius.search_song", external="genius", song=song_title) as s:
+            song = genius.search_song(song_title, artist)
+            s.set(found=bool(song))
         if not song:
             return False
 
@@ -68,133 +133,78 @@ def quick_ingest(artist, song_title):
         docs = [c['text'] for c in chunks]
         metas = [{"song": c['song'], "artist": c['artist']} for c in chunks]
         ids = [c['id'] for c in chunks]
-        embeds = embedding_model.encode(docs).tolist()
-
-        collection.upsert(documents=docs, embeddings=embeds,
-                          metadatas=metas, ids=ids)
+        with span("encode", chunks=len(docs)):
+            embeds = embedding_model.encode(docs)
+
+        with span("chroma.upsert", chunks=len(docs)):
+            collection.upsert(documents=docs, embeddings=embeds.tolist(),
+                              metadatas=metas, ids=ids)
+        if compact_store is not None:
+            with span("compact_store.upsert", chunks=len(docs)):
+                compact_store.upsert(ids, embeds, metas)
+        if hard_negative_index is not None:
+            with span("hard_negative_index.add", chunks=len(docs)):
+                hard_negative_index.add(ids, embeds, metas)
         return True
     except Exception as e:
         print(f"Ingest Error: {e}")
         return False
 
 
-def generate_batch_quiz(num_questions=10, clean_tracks=[]):
-    """Generates a mix of Normal (80%) and Hard (20%) questions."""
-    questions = []
-    
+def song_vectors(clean_tracks):
+    """Mean lyric embedding per ingested song, keyed like chunk ids ("artist_song")."""
+    global collection
+    if not collection:
+        collection = chroma_client.get_or_create_collection(name="lyrics_knowledge_base")
+    where = song_filter(clean_tracks)
+    if where is None:
+        return {}
+    with span("chroma.get_song_vectors", songs=len(clean_tracks)):
+        docs = collection.get(where=where, include=["metadatas", "embeddings"])
+    grouped = {}
+    for meta, embedding in zip(docs['metadatas'], docs['embeddings']):
+        grouped.setdefault(f"{meta['artist']}_{meta['song']}", []).append(embedding)
+    return {key: np.mean(vectors, axis=0) for key, vectors in grouped.items()}
+
+
+@traced("generate_batch_quiz")
+def generate_batch_quiz(num_questions=10, clean_tracks=[], template_share=TEMPLATE_SHARE):
+    """
+    Generates a mix of Normal (80%) and Hard (20%) questions.
+    `template_share` of them are built locally from templates instead of by Gemini.
+    """
     global collection
     if not collection:
         collection = chroma_client.get_or_create_collection(name="lyrics_knowledge_base")
     
-    # Try to fetch contexts
+    # Only draw contexts from this playlist's songs: the store is shared and may be
+    # pre-warmed with thousands of other songs by the bulk ingest CLI.
     try:
-        all_docs = collection.get(
-            limit=30, include=["documents", "metadatas", "embeddings"])
+        all_docs = sample_contexts(collection, clean_tracks)
     except Exception as e:
         # Safety net: if collection is stale, recreate it and try again
         print(f"Collection error: {e}. Recreating...")
         collection = chroma_client.get_or_create_collection(name="lyrics_knowledge_base")
-        all_docs = collection.get(limit=30, include=["documents", "metadatas", "embeddings"])
-    
-    
+        all_docs = sample_contexts(collection, clean_tracks)
+
     if not all_docs['documents']:
         return []
 
-    count = len(all_docs['documents'])
-
-    for i in range(num_questions):
-        is_hard = (i >= num_questions * 0.8)
-        mode = "Hard" if is_hard else "Normal"
-
-        # Pick random context
-        idx = random.randint(0, count - 1)
-        lyric = all_docs['documents'][idx]
-        meta = all_docs['metadatas'][idx]
-
-        prompt = ""
-
-        if is_hard:
-            correct_vec = all_docs['embeddings'][idx]
-            # Find distractors via vector search (Hard Negatives)
-            results = collection.query(
-                query_embeddings=[correct_vec], n_results=5,
-                where={"song": {"$ne": meta['song']}}
-            )
-            
-            distractors = [m['song'] + " by " + m['artist']
-                           for m in results['metadatas'][0]][:3]
-        
-            # Fallback: Random from clean_tracks
-            while len(distractors) < 3 and clean_tracks:
-                ct = random.choice(clean_tracks)
-                option = f"{ct['name']} by {ct['artist']}"
-                if option not in distractors and option != f"{meta['song']} by {meta['artist']}":
-                    distractors.append(option)
-
-            correct_option = f"{meta['song']} by {meta['artist']}"
-
-            prompt = f"""
-                You are a quiz master. Create a multiple-choice question based on this lyric.
-                
-                LYRIC SEGMENT:
-                "{lyric}"
-                
-                THE CORRECT ANSWER IS:
-                "{correct_option}"
-                
-                THE WRONG OPTIONS (DISTRACTORS) MUST BE:
-                {json.dumps(distractors)}
-                
-                RULES:
-                1. The question should be: "Which song contains these lyrics?"
-                2. You must use the provided options. Do not make up new ones.
-                3. Output purely in JSON format.
-                
-                OUTPUT JSON:
-                {{
-                    "question": "Which song features the line \n "{lyric}"...",
-                    "options": ["Option A", "Option B", "Option C", "Option D"],
-                    "correct_answer": "{correct_option}",
-                    "explanation": "Briefly mention why the lyrics fit the correct song's theme vs the others."
-                }}
-            """
-        else:
-            # --- NORMAL MODE LOGIC ---
-            prompt = f"""
-                You are a music trivia generator. I will provide you with a segment of lyrics from the song "{meta['song']}" by "{meta['artist']}".
-                
-                LYRIC SEGMENT:
-                "{lyric}"
-                
-                TASK:
-                Generate a multiple-choice question based specifically on these lyrics. 
-                You can ask about the meaning, the metaphor used, or complete the line. If you ask about meaning or complete the line or metaphor used, include the song title and artist {meta['song']} {meta['artist']} in the question.
-                
-                
-                OUTPUT FORMAT (Strict JSON):
-                {{
-                    "question": "The text of the question",
-                    "options": ["Option A", "Option B", "Option C", "Option D"],
-                    "correct_answer": "Option A",
-                    "explanation": "Brief explanation of why it is correct."
-                }}
-            """
-
-        try:
-            resp = client.models.generate_content(
-                model="gemini-2.5-flash", #   gemini-3-flash-preview
-                contents=prompt + "\nOutput strictly in JSON compatible with QuizQuestion schema.",
-                config={"response_mime_type": "application/json",
-                        "response_json_schema": QuizQuestion.model_json_schema()}
-            )
-            q_data = json.loads(resp.text)
-            q_data['difficulty'] = mode
-            questions.append(q_data)
-        except Exception as e:
-            print(f"Gen Error: {e}")
-
-    # This will delete all collections, embeddings, documents, and metadata
-    chroma_client.reset()
-    collection = None
-    
+    vector_index = compact_store if compact_store is not None else collection
+    questions, llm_slots, specs, fallbacks = plan_questions(
+        all_docs, num_questions, clean_tracks, vector_index, hard_negative_index, template_share)
+
+    # Malformed answers are repaired locally where possible; only the rest cost another call
+    with span("generate_questions", questions=len(specs), templates=num_questions - len(specs)) as gen_span:
+        answers, stats = generate_questions(client, specs, cache=quiz_cache)
+        gen_span.set(**stats)
+    if stats['repaired'] or stats['retried'] or stats['dropped']:
+        print(f"🩹 Quiz repair: {stats}")
+
+    for i, answer in zip(llm_slots, answers):
+        # Slow or rate-limited LLM: keep the quiz full with the template question
+        questions[i] = answer if answer is not None else fallbacks[i]
+    questions = [q for q in questions if q is not None]
+
+    # The index is kept between requests so already-ingested songs skip Genius next time
     return questions
@@ -0,0 +1,464 @@
+import os
+import json
+import time
+import random
+import textwrap
+from pydantic import BaseModel, Field, ValidationError
+from .tracing import span
+
+# Shared by the API (quiz_engine), the standalone scripts and benchmarks/bench_quiz.
+# Bump PROMPT_VERSION whenever a prompt's wording changes so recorded/cached LLM
+# answers from the old prompt are not mistaken for answers to the new one.
+PROMPT_VERSION = "1"
+GEMINI_MODEL = "gemini-2.5-flash"
+HARD_SHARE = 0.2  # Last 20% of a batch are "Which song contains these lyrics?" questions
+JSON_SUFFIX = "\nOutput strictly in JSON compatible with QuizQuestion schema."
+NUM_OPTIONS = 4
+# Questions still invalid after local repair get another LLM call, but only while the
+# batch is younger than the deadline
+REPAIR_DEADLINE_S = float(os.getenv("QUIZ_REPAIR_DEADLINE_S", "8"))
+MAX_LLM_RETRIES = int(os.getenv("QUIZ_MAX_LLM_RETRIES", "1"))
+# Share of each batch built from templates (no LLM call): "which song contains these
+# lyrics" for hard questions, "complete the line" for normal ones
+TEMPLATE_SHARE = float(os.getenv("QUIZ_TEMPLATE_SHARE", "0.3"))
+CONTEXT_LIMIT = 30  # Lyric chunks a batch draws its questions from
+RETRY_SUFFIX = ("\nYour previous answer was rejected. Return one JSON object with exactly 4 distinct "
+                "options, and make correct_answer an exact copy of one of them.")
+
+
+class QuizQuestion(BaseModel):
+    question: str = Field(description="The text of the question.")
+    options: list[str] = Field(
+        description="A list of multiple-choice options.")
+    correct_answer: str = Field(
+        description="The correct answer from the options.")
+    explanation: str = Field(
+        description="A brief explanation of why the answer is correct.")
+    difficulty: str = "Normal"
+
+
+def question_mode(i, num_questions):
+    return "Hard" if i >= num_questions * (1 - HARD_SHARE) else "Normal"
+
+
+def option_label(song, artist):
+    return f"{song} by {artist}"
+
+
+# Templates are dedented once, before formatting: multi-line lyrics start at column 0
+# and would otherwise stop textwrap.dedent from removing anything.
+NORMAL_TEMPLATE = textwrap.dedent("""
+    You are a music trivia generator. I will provide you with a segment of lyrics from the song "{song}" by "{artist}".
+
+    LYRIC SEGMENT:
+    "{lyric}"
+
+    TASK:
+    Generate a multiple-choice question based specifically on these lyrics.
+    You can ask about the meaning, the metaphor used, or complete the line. If you ask about meaning or complete the line or metaphor used, include the song title and artist {song} {artist} in the question.
+
+    OUTPUT FORMAT (Strict JSON):
+    {{
+        "question": "The text of the question",
+        "options": ["Option A", "Option B", "Option C", "Option D"],
+        "correct_answer": "Option A",
+        "explanation": "Brief explanation of why it is correct."
+    }}
+""")
+
+HARD_TEMPLATE = textwrap.dedent("""
+    You are a quiz master. Create a multiple-choice question based on this lyric.
+
+    LYRIC SEGMENT:
+    "{lyric}"
+
+    THE CORRECT ANSWER IS:
+    "{correct_option}"
+
+    THE WRONG OPTIONS (DISTRACTORS) MUST BE:
+    {distractors}
+
+    RULES:
+    1. The question should be: "Which song contains these lyrics?"
+    2. You must use the provided options. Do not make up new ones.
+    3. Output purely in JSON format.
+
+    OUTPUT JSON:
+    {{
+        "question": "Which song features the line \\n "{lyric}"...",
+        "options": ["Option A", "Option B", "Option C", "Option D"],
+        "correct_answer": "{correct_option}",
+        "explanation": "Briefly mention why the lyrics fit the correct song's theme vs the others."
+    }}
+""")
+
+
+def normal_prompt(lyric, song, artist):
+    return NORMAL_TEMPLATE.format(lyric=lyric, song=song, artist=artist)
+
+
+def hard_prompt(lyric, correct_option, distractors):
+    return HARD_TEMPLATE.format(lyric=lyric, correct_option=correct_option, distractors=json.dumps(distractors))
+
+
+def build_prompt(lyric, meta, mode, distractors=None):
+    if mode == "Hard":
+        return hard_prompt(lyric, option_label(meta['song'], meta['artist']), distractors or [])
+    return normal_prompt(lyric, meta['song'], meta['artist'])
+
+
+def pick_distractors(vector_index, correct_vec, meta, clean_tracks=(), hard_negative_index=None, k=3):
+    """
+    Up to `k` "Song by Artist" options that sound like the correct song but aren't it.
+
+    Uses the song-level ANN index when there is one, else a Chroma-shaped `vector_index`
+    (Chroma collection or CompactVectorStore), then tops up from the playlist's tracks.
+    """
+    correct_option = option_label(meta['song'], meta['artist'])
+    if hard_negative_index is not None:
+        picked = hard_negative_index.distractor_songs(correct_vec, k=k, exclude_song=meta['song'])
+        distractors = [option_label(p['song'], p['artist']) for p in picked]
+    else:
+        # Chunk-level results: neighbouring chunks often share a song, so over-fetch and dedupe
+        results = vector_index.query(
+            query_embeddings=[correct_vec], n_results=k * 4,
+            where={"song": {"$ne": meta['song']}}
+        )
+        distractors = list(dict.fromkeys(option_label(m['song'], m['artist'])
+                                         for m in results['metadatas'][0]))[:k]
+
+    # Fallback: Random from clean_tracks
+    candidates = {option_label(t['name'], t['artist']) for t in clean_tracks} - {correct_option}
+    while len(distractors) < k and candidates - set(distractors):
+        option = random.choice(sorted(candidates - set(distractors)))
+        distractors.append(option)
+    return distractors
+
+
+def request_question(llm, prompt, model=GEMINI_MODEL):
+    """One schema-constrained LLM call. Returns the raw response (text + usage_metadata)."""
+    return llm.models.generate_content(
+        model=model,
+        contents=prompt + JSON_SUFFIX,
+        config={"response_mime_type": "application/json",
+                "response_json_schema": QuizQuestion.model_json_schema()}
+    )
+
+
+def parse_question(text, mode):
+    if not isinstance(text, str):
+        # Blocked or empty candidates come back without text
+        raise ValueError("LLM returned no text")
+    q_data = json.loads(text)
+    if not isinstance(q_data, dict):
+        raise ValueError("LLM answer is not a JSON object")
+    q_data['difficulty'] = mode
+    return q_data
+
+
+def validate_question(q_data):
+    """Reasons the question can't be played as-is; an empty list means it's fine."""
+    try:
+        q = QuizQuestion.model_validate(q_data)
+    except ValidationError as e:
+        return [f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()]
+    problems = []
+    if len(q.options) != NUM_OPTIONS:
+        problems.append(f"expected {NUM_OPTIONS} options, got {len(q.options)}")
+    if len({o.strip().lower() for o in q.options}) != len(q.options):
+        problems.append("duplicate options")
+    if q.correct_answer not in q.options:
+        problems.append("correct_answer is not one of the options")
+    return problems
+
+
+def repair_question(q_data, mode, correct_option=None, distractors=None):
+    """
+    Fixes what can be fixed without another LLM call and returns the new question dict.
+
+    Hard questions have a known answer set, so their options are rebuilt from the correct
+    option and the precomputed distractors. For normal questions the correct answer is
+    snapped to its option's spelling, or added when exactly one option is missing.
+    """
+    q = dict(q_data)
+    q['difficulty'] = mode
+    if not isinstance(q.get('explanation'), str):
+        q['explanation'] = ""
+
+    options = []
+    for option in q.get('options') or []:
+        if isinstance(option, str) and option.strip() and \
+                option.strip().lower() not in {o.lower() for o in options}:
+            options.append(option.strip())
+    answer = q.get('correct_answer').strip() if isinstance(q.get('correct_answer'), str) else None
+
+    wrong = [d for d in dict.fromkeys(distractors or []) if d != correct_option]
+    if mode == "Hard" and correct_option and len(wrong) >= NUM_OPTIONS - 1:
+        options = [correct_option] + wrong[:NUM_OPTIONS - 1]
+        random.shuffle(options)
+        answer = correct_option
+        if not isinstance(q.get('question'), str) or not q['question'].strip():
+            q['question'] = "Which song contains these lyrics?"
+    elif answer:
+        same = next((o for o in options if o.lower() == answer.lower()), None)
+        if same:
+            answer = same
+            if len(options) > NUM_OPTIONS:
+                options = [answer] + [o for o in options if o != answer][:NUM_OPTIONS - 1]
+                random.shuffle(options)
+        elif len(options) == NUM_OPTIONS - 1:
+            options.append(answer)
+            random.shuffle(options)
+
+    q['options'] = options
+    q['correct_answer'] = answer
+    return q
+
+
+def complete_question(text, mode, correct_option=None, distractors=None):
+    """
+    Parses, validates and (if needed) repairs one LLM answer.
+    Returns (question dict or None, outcome) with outcome "ok" | "repaired" | "invalid".
+    """
+    try:
+        q_data = parse_question(text, mode)
+    except (ValueError, TypeError):
+        return None, "invalid"
+    if not validate_question(q_data):
+        return q_data, "ok"
+    repaired = repair_question(q_data, mode, correct_option, distractors)
+    if not validate_question(repaired):
+        return repaired, "repaired"
+    return None, "invalid"
+
+
+def generate_questions(llm, specs, deadline_s=REPAIR_DEADLINE_S, max_retries=MAX_LLM_RETRIES, cache=None,
+                       on_stage=None):
+    """
+    Turns question specs ({"prompt", "mode", "correct_option", "distractors"}) into playable
+    questions: one LLM call each, local repair, then LLM retries only for what is still
+    invalid and only while the deadline allows. With a QuizCache, specs that also carry
+    "chunk_id", "song", "artist" (and optionally "embedding") are served from it when
+    possible, and every new valid question is stored. Returns (questions aligned with `specs`,
+    None where a question had to be dropped, and stats).
+
+    `on_stage(i, stage, seconds, **info)` (optional) is called for spec i after each "cache"
+    lookup (hit), "llm" call (prompt, retry, and resp or error) and "validate" step
+    (retry, outcome), e.g. for benchmarks/bench_quiz's per-stage timings.
+    """
+    start = time.monotonic()
+    stats = {"cache_hits": 0, "llm_calls": 0, "ok": 0, "repaired": 0, "retried": 0, "dropped": 0}
+    questions = [None] * len(specs)
+
+    def report(i, stage, t0, **info):
+        if on_stage is not None:
+            on_stage(i, stage, time.perf_counter() - t0, **info)
+
+    def ask(i, retry=False):
+        spec = specs[i]
+        stats["llm_calls"] += 1
+        prompt = spec['prompt'] + RETRY_SUFFIX if retry else spec['prompt']
+        t0 = time.perf_counter()
+        try:
+            with span("gemini.generate_content", external="gemini", mode=spec['mode'], retry=retry):
+                resp = request_question(llm, prompt)
+        except Exception as e:
+            print(f"Gen Error: {e}")
+            report(i, "llm", t0, prompt=prompt, retry=retry, error=e)
+            return None, "invalid"
+        report(i, "llm", t0, prompt=prompt, retry=retry, resp=resp)
+        t0 = time.perf_counter()
+        question, outcome = complete_question(getattr(resp, "text", None), spec['mode'],
+                                              spec.get('correct_option'), spec.get('distractors'))
+        report(i, "validate", t0, retry=retry, outcome=outcome)
+        return question, outcome
+
+    def keep(i, question, outcome):
+        stats[outcome] += 1
+        if cache is not None and specs[i].get('chunk_id'):
+            cache.put(specs[i], question)
+
+    pending = []
+    for i, spec in enumerate(specs):
+        if cache is not None and spec.get('chunk_id'):
+            t0 = time.perf_counter()
+            questions[i] = cache.get(spec)
+            report(i, "cache", t0, hit=questions[i] is not None)
+            if questions[i] is not None:
+                stats["cache_hits"] += 1
+                continue
+        questions[i], outcome = ask(i)
+        if questions[i] is None:
+            pending.append(i)
+        else:
+            keep(i, questions[i], outcome)
+
+    for _ in range(max_retries):
+        still_pending = []
+        for i in pending:
+            if time.monotonic() - start > deadline_s:
+                still_pending.append(i)
+                continue
+            stats["retried"] += 1
+            questions[i], outcome = ask(i, retry=True)
+            if questions[i] is None:
+                still_pending.append(i)
+            else:
+                keep(i, questions[i], outcome)
+        pending = still_pending
+
+    stats["dropped"] = len(pending)
+    return questions, stats
+
+
+# --- TEMPLATE QUESTIONS (no LLM) ---
+def template_slots(num_questions, share=TEMPLATE_SHARE):
+    """Which question indices of a batch are built from templates."""
+    count = min(num_questions, max(0, round(num_questions * share)))
+    return set(random.sample(range(num_questions), count))
+
+
+def which_song_question(lyric, correct_option, distractors):
+    """The hard question, built locally from the chunk and the precomputed distractors."""
+    wrong = [d for d in dict.fromkeys(distractors or []) if d != correct_option][:NUM_OPTIONS - 1]
+    if len(wrong) < NUM_OPTIONS - 1:
+        return None
+    options = [correct_option] + wrong
+    random.shuffle(options)
+    return {
+        "question": f'Which song features the line \n "{lyric}"...',
+        "options": options,
+        "correct_answer": correct_option,
+        "explanation": f"These lines are from {correct_option}.",
+        "difficulty": "Hard",
+    }
+
+
+def _lines(text):
+    return [line.strip() for line in text.split('\n') if line.strip()]
+
+
+def complete_line_question(lyric, meta, other_lyrics=()):
+    """
+    "Complete the line": shows one line of the chunk and asks for the next. Wrong options
+    are other lyric lines of similar length, from this song first, then the other chunks.
+    """
+    lines = _lines(lyric)
+    if len(lines) < 2:
+        return None
+    j = random.randrange(1, len(lines))
+    answer = lines[j]
+
+    # The prompt line can't be a wrong option: other chunks include this one
+    seen = {answer.lower(), lines[j - 1].lower()}
+    words = len(answer.split())
+    candidates = []
+    for source in (lines[:j - 1] + lines[j + 1:], [l for text in other_lyrics for l in _lines(text)]):
+        tier = []
+        for line in source:
+            if line.lower() not in seen:
+                seen.add(line.lower())
+                tier.append(line)
+        # Similar-length lines are harder to rule out at a glance; shuffling first varies the ties
+        random.shuffle(tier)
+        tier.sort(key=lambda line: abs(len(line.split()) - words))
+        candidates.extend(tier)
+    if len(candidates) < NUM_OPTIONS - 1:
+        return None
+
+    options = [answer] + candidates[:NUM_OPTIONS - 1]
+    random.shuffle(options)
+    return {
+        "question": f'Complete the line from "{meta["song"]}" by {meta["artist"]}: \n "{lines[j - 1]}" ...',
+        "options": options,
+        "correct_answer": answer,
+        "explanation": f'In "{meta["song"]}", "{lines[j - 1]}" is followed by "{answer}".',
+        "difficulty": "Normal",
+    }
+
+
+# --- BATCHES (shared by quiz_engine.generate_batch_quiz and benchmarks/bench_quiz) ---
+def song_filter(tracks):
+    """
+    Chroma filter for the chunks of these songs ({"name", "artist"}). The store is shared
+    and pre-warmed, so a title alone may belong to another artist's song.
+    """
+    pairs = [{"$and": [{"song": t['name']}, {"artist": t['artist']}]}
+             for t in {(t['name'], t['artist']): t for t in tracks}.values()]
+    if not pairs:
+        return None
+    return pairs[0] if len(pairs) == 1 else {"$or": pairs}
+
+
+def sample_contexts(collection, clean_tracks, limit=CONTEXT_LIMIT):
+    """Up to `limit` lyric chunks of the playlist's songs, as a Chroma get() result."""
+    with span("sample_contexts", songs=len(clean_tracks)) as s:
+        contexts = collection.get(where=song_filter(clean_tracks), limit=limit,
+                                  include=["documents", "metadatas", "embeddings"])
+        s.set(contexts=len(contexts['documents']))
+    return contexts
+
+
+def plan_questions(contexts, num_questions, clean_tracks, vector_index, hard_negative_index=None,
+                   template_share=TEMPLATE_SHARE, on_stage=None):
+    """
+    Picks a random context for each question of a batch and prepares it. Template slots
+    get their question right away; every other question becomes a generate_questions spec,
+    with its template kept as a fallback for when the LLM can't deliver.
+
+    `vector_index` (the Chroma collection or a CompactVectorStore) and `hard_negative_index`
+    are handed to pick_distractors. `on_stage(i, stage, seconds, **info)` (optional) is
+    called for question i after "distractors" (meta, distractors), "template" (question,
+    served) and "prompt".
+
+    Returns (questions with None in LLM slots, llm_slots, specs, {slot: fallback}).
+    """
+    def report(i, stage, t0, **info):
+        if on_stage is not None:
+            on_stage(i, stage, time.perf_counter() - t0, **info)
+
+    questions = [None] * num_questions
+    llm_slots, specs, fallbacks = [], [], {}
+    use_template = template_slots(num_questions, template_share)
+    for i in range(num_questions):
+        mode = question_mode(i, num_questions)
+
+        # Pick random context
+        idx = random.randint(0, len(contexts['documents']) - 1)
+        lyric = contexts['documents'][idx]
+        meta = contexts['metadatas'][idx]
+
+        distractors = None
+        if mode == "Hard":
+            # Find distractors via vector search (Hard Negatives)
+            t0 = time.perf_counter()
+            with span("distractor_query"):
+                distractors = pick_distractors(vector_index, contexts['embeddings'][idx], meta,
+                                               clean_tracks, hard_negative_index)
+            report(i, "distractors", t0, meta=meta, distractors=distractors)
+        correct_option = option_label(meta['song'], meta['artist'])
+
+        # Template version of this question: served directly, or kept as a fallback
+        # in case the LLM can't deliver one in time
+        t0 = time.perf_counter()
+        if mode == "Hard":
+            template = which_song_question(lyric, correct_option, distractors)
+        else:
+            template = complete_line_question(lyric, meta, contexts['documents'])
+        served = i in use_template and template is not None
+        report(i, "template", t0, question=template, served=served)
+        if served:
+            questions[i] = template
+            continue
+
+        t0 = time.perf_counter()
+        prompt = build_prompt(lyric, meta, mode, distractors)
+        report(i, "prompt", t0)
+        fallbacks[i] = template
+        llm_slots.append(i)
+        specs.append({"prompt": prompt, "mode": mode,
+                      "correct_option": correct_option if distractors else None,
+                      "distractors": distractors,
+                      "chunk_id": contexts['ids'][idx], "song": meta['song'], "artist": meta['artist'],
+                      "embedding": contexts['embeddings'][idx]})
+    return questions, llm_slots, specs, fallbacks
@@ -0,0 +1,66 @@
+import re
+import time
+import threading
+
+
+def http_status(error):
+    """The HTTP status behind a client-library error, or None when it doesn't say."""
+    status = getattr(error, "status", None) or getattr(error, "http_status", None)
+    if status is None:
+        # ytmusicapi only puts it in the message: "Server returned HTTP 400: Bad Request."
+        found = re.search(r"HTTP (\d{3})", str(error))
+        status = int(found.group(1)) if found else None
+    return status
+
+
+def is_rate_limited(error):
+    """True for HTTP 429-style errors from any of the client libraries."""
+    status = http_status(error)
+    if status is not None:
+        return status == 429
+    # No status anywhere: only a standalone 429 in the message counts (not e.g. a videoId)
+    return bool(re.search(r"\b429\b|too many requests", str(error), re.IGNORECASE))
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket: `rate` tokens per second, holding at most `burst` tokens.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """Takes tokens if available right now. Never blocks."""
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1, timeout=None):
+        """Blocks until tokens are available. Returns False if `timeout` seconds pass first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return True
+                wait = (tokens - self.tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import uuid
+import inspect
+import logging
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+
+# Latency histogram buckets in milliseconds (Prometheus-style cumulative "le" buckets)
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+logger = logging.getLogger("melodymind.trace")
+if os.getenv("TRACE_LOG", "1") != "0" and not logger.handlers:
+    # One JSON object per finished span on stderr; set TRACE_LOG=0 to silence
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_current_span = contextvars.ContextVar("melodymind_current_span", default=None)
+
+
+class _Metrics:
+    """Process-wide span latency histograms and external-call counters."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # span name -> {"buckets": [...], "sum": ms, "count": n}
+        self.external_calls = {}  # (service, operation, outcome) -> count
+
+    def observe(self, name, duration_ms):
+        with self.lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = {"buckets": [0] * len(LATENCY_BUCKETS_MS), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if duration_ms <= bound:
+                    hist["buckets"][i] += 1
+            hist["sum"] += duration_ms
+            hist["count"] += 1
+
+    def count_call(self, service, operation, outcome):
+        key = (service, operation, outcome)
+        with self.lock:
+            self.external_calls[key] = self.external_calls.get(key, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.external_calls.clear()
+
+
+metrics = _Metrics()
+
+
+class Span:
+    def __init__(self, name, parent, attrs):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:8]
+        self.parent_id = parent.span_id if parent else None
+        self.depth = parent.depth + 1 if parent else 0
+        self.attrs = attrs
+        self.status = "ok"
+        self.duration_ms = None
+
+    def set(self, **attrs):
+        """Attaches extra attributes (e.g. result sizes) while the span is open."""
+        self.attrs.update(attrs)
+
+
+@contextmanager
+def span(name, external=None, **attrs):
+    """
+    Times a block and nests it under the currently open span.
+
+    Pass `external="spotify" | "ytmusic" | "genius" | "gemini"` for calls to another
+    service; they are also counted per service/outcome for /metrics.
+    """
+    parent = _current_span.get()
+    current = Span(name, parent, attrs)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        current.duration_ms = (time.perf_counter() - start) * 1000
+        _current_span.reset(token)
+        metrics.observe(name, current.duration_ms)
+        if external:
+            metrics.count_call(external, name, current.status)
+        logger.info(json.dumps({
+            "span": name,
+            "trace_id": current.trace_id,
+            "span_id": current.span_id,
+            "parent_id": current.parent_id,
+            "depth": current.depth,
+            "duration_ms": round(current.duration_ms, 3),
+            "status": current.status,
+            **({"external": external} if external else {}),
+            **current.attrs,
+        }, default=str))
+
+
+def traced(name=None, external=None):
+    """Decorator form of span() for sync and async functions."""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, external=external):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, external=external):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def render_prometheus(gauges=None):
+    """
+    Current metrics in the Prometheus text exposition format.
+    `gauges` ({name: value}) adds point-in-time values owned by other modules, as melodymind_<name>.
+    """
+    lines = [
+        "# HELP melodymind_span_duration_ms Span latency in milliseconds.",
+        "# TYPE melodymind_span_duration_ms histogram",
+    ]
+    with metrics.lock:
+        for name, hist in sorted(metrics.histograms.items()):
+            for bound, count in zip(LATENCY_BUCKETS_MS, hist["buckets"]):
+                lines.append(f'melodymind_span_duration_ms_bucket{{span="{_label(name)}",le="{bound}"}} {count}')
+            lines.append(f'melodymind_span_duration_ms_bucket{{span="{_label(name)}",le="+Inf"}} {hist["count"]}')
+            lines.append(f'melodymind_span_duration_ms_sum{{span="{_label(name)}"}} {hist["sum"]:.3f}')
+            lines.append(f'melodymind_span_duration_ms_count{{span="{_label(name)}"}} {hist["count"]}')
+
+        lines.append("# HELP melodymind_external_calls_total Calls to external services.")
+        lines.append("# TYPE melodymind_external_calls_total counter")
+        for (service, operation, outcome), count in sorted(metrics.external_calls.items()):
+            lines.append(f'melodymind_external_calls_total{{service="{_label(service)}",'
+                         f'operation="{_label(operation)}",outcome="{outcome}"}} {count}')
+
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f"# TYPE melodymind_{name} gauge")
+        lines.append(f"melodymind_{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -4,7 +4,7 @@ import json
 import random
 #from openai import OpenAI
 from google import genai
-from pydantic import BaseModel, Field
+from backend.services.quiz_pipeline import hard_prompt, option_label, request_question
 
 os.environ['GEMINI_API_KEY'] = ''
 
@@ -14,13 +14,6 @@ chroma_client = chromadb.PersistentClient(path="./chroma_db")
 collection = chroma_client.get_collection(name="lyrics_knowledge_base")
 client = genai.Client()
 
-class QuizQuestion(BaseModel):
-    question: str = Field(description="The text of the question.")
-    options: list[str] = Field(description="A list of multiple-choice options.")
-    correct_answer: str = Field(description="The correct answer from the options.")
-    explanation: str = Field(description="A brief explanation of why the answer is correct.")
-
-
 def get_challenge_data():
     """
     1. Picks a random lyric (Correct Answer).
@@ -58,7 +51,7 @@ def get_challenge_data():
         
         # Only add if we haven't seen this artist/song yet
         if artist not in seen_artists:
-            distractors.append(f"{song} by {artist}")
+            distractors.append(option_label(song, artist))
             seen_artists.add(artist)
             
         if len(distractors) >= 3:
@@ -75,48 +68,19 @@ def generate_hard_question(lyric, meta, distractors):
     """
     Asks the LLM to create a question using the SPECIFIC hard negatives we found.
     """
-    correct_option = f"{meta['song']} by {meta['artist']}"
+    correct_option = option_label(meta['song'], meta['artist'])
     options = distractors + [correct_option]
     random.shuffle(options) # Shuffle so D isn't always the answer
-    
-    prompt = f"""
-    You are a quiz master. Create a multiple-choice question based on this lyric.
-    
-    LYRIC SEGMENT:
-    "{lyric}"
-    
-    THE CORRECT ANSWER IS:
-    "{correct_option}"
-    
-    THE WRONG OPTIONS (DISTRACTORS) MUST BE:
-    {json.dumps(distractors)}
-    
-    RULES:
-    1. The question should be: "Which song contains these lyrics?"
-    2. You must use the provided options. Do not make up new ones.
-    3. Output purely in JSON format.
-    
-    OUTPUT JSON:
-    {{
-        "question": "Which song features the line...",
-        "options": ["Option A", "Option B", "Option C", "Option D"],
-        "correct_answer": "{correct_option}",
-        "explanation": "Briefly mention why the lyrics fit the correct song's theme vs the others."
-    }}
-    """
-    
+
+    # Same prompt and QuizQuestion schema as the API (backend/services/quiz_pipeline.py)
+    prompt = hard_prompt(lyric, correct_option, distractors)
+
     # response = client.chat.completions.create(
     #     model="gpt-3.5-turbo",
     #     messages=[{"role": "user", "content": prompt}],
     #     response_format={"type": "json_object"}
     # )
-    response = client.models.generate_content(
-        model="gemini-2.5-flash", contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_json_schema": QuizQuestion.model_json_schema(),
-        },
-    )
+    response = request_question(client, prompt)
 
     return response.text
 
@@ -5,7 +5,7 @@ import json
 import random
 # from openai import OpenAI
 from google import genai
-from pydantic import BaseModel, Field
+from backend.services.quiz_pipeline import normal_prompt, request_question
 
 print('GEMINI_API_KEY set up.')
 # --- CONFIGURATION ---
@@ -18,13 +18,6 @@ client = genai.Client()
 chroma_client = chromadb.PersistentClient(path="./chroma_db")
 collection = chroma_client.get_collection(name="lyrics_knowledge_base")
 
-class QuizQuestion(BaseModel):
-    question: str = Field(description="The text of the question.")
-    options: list[str] = Field(description="A list of multiple-choice options.")
-    correct_answer: str = Field(description="The correct answer from the options.")
-    explanation: str = Field(description="A brief explanation of why the answer is correct.")
-
-
 def get_random_lyric_context():
     """
     Retrieves a random lyric chunk from the database to base a question on.
@@ -56,24 +49,8 @@ def generate_quiz_question(lyric_segment, metadata):
 
     # PROMPT ENGINEERING:
     # We ask for JSON output so our frontend (React/Streamlit) can parse it easily.
-    prompt = f"""
-    You are a music trivia generator. I will provide you with a segment of lyrics from the song "{song}" by "{artist}".
-    
-    LYRIC SEGMENT:
-    "{lyric_segment}"
-    
-    TASK:
-    Generate a multiple-choice question based specifically on these lyrics. 
-    You can ask about the meaning, the metaphor used, or complete the line.
-    
-    OUTPUT FORMAT (Strict JSON):
-    {{
-        "question": "The text of the question",
-        "options": ["Option A", "Option B", "Option C", "Option D"],
-        "correct_answer": "Option A",
-        "explanation": "Brief explanation of why it is correct."
-    }}
-    """
+    # The prompt and QuizQuestion schema are shared with the API (backend/services/quiz_pipeline.py)
+    prompt = normal_prompt(lyric_segment, song, artist)
 
     # response = client.chat.completions.create(
     #     model="gpt-3.5-turbo", # Or "gpt-4-turbo" for better reasoning
@@ -84,13 +61,7 @@ def generate_quiz_question(lyric_segment, metadata):
     #     temperature=0.7,
     #     response_format={"type": "json_object"} # JSON Mode (Critical for App Dev)
     # )
-    response = client.models.generate_content(
-        model="gemini-2.5-flash", contents=prompt,
-        config={
-            "response_mime_type": "application/json",
-            "response_json_schema": QuizQuestion.model_json_schema(),
-        },
-    )
+    response = request_question(client, prompt)
 
     # return response.choices[0].message.content
     return response.text
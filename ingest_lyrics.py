@@ -1,40 +1,72 @@
 import os
+import csv
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import lyricsgenius
 import chromadb
+import numpy as np
+from dotenv import load_dotenv
 from sentence_transformers import SentenceTransformer
+from backend.services.compact_store import CompactVectorStore, SUPPORTED_DTYPES
+from backend.services.hard_negative_index import HardNegativeIndex
+
+# Load environment variables from .env file
+load_dotenv()
 
 # --- CONFIGURATION ---
 # Get your token from: https://genius.com/api-clients
-GENIUS_TOKEN = ""
-
-# 1. Initialize Clients
-genius = lyricsgenius.Genius(GENIUS_TOKEN)
-genius.verbose = False  # Turn off status messages
-genius.remove_section_headers = True # Remove [Chorus], [Verse 1], etc.
+GENIUS_TOKEN = os.getenv("GENIUS_TOKEN")
+COLLECTION_NAME = "lyrics_knowledge_base"
 
 # Load a small, fast embedding model (runs locally on CPU)
 print("⏳ Loading embedding model...")
 embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
 
-# Initialize Vector DB (Persist to disk so data is saved)
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
-collection = chroma_client.get_or_create_collection(name="lyrics_knowledge_base")
+# The vector DB is opened in connect_vector_db() so the CLI can point it at the
+# backend's store (the backend runs from /backend and uses ./chroma_db there).
+chroma_client = None
+collection = None
+# Optional mirrors the backend searches for distractors, fed as batches are stored
+# (--compact-store-path, --index-path: the backend's COMPACT_STORE_PATH and
+# HARD_NEGATIVE_INDEX_PATH). A mirror has one writer, so only while the backend is
+# stopped; otherwise ingest into Chroma alone and the backend mirrors songs as it uses them.
+compact_store = None
+hard_negative_index = None
 
-def fetch_and_chunk_lyrics(artist_name, song_title, chunk_size=4):
+# lyricsgenius keeps a requests.Session per client, so every fetch worker gets its own
+_thread_local = threading.local()
+
+
+def get_genius():
+    """Returns a Genius client private to the calling thread."""
+    if not hasattr(_thread_local, "genius"):
+        genius = lyricsgenius.Genius(GENIUS_TOKEN, timeout=15, retries=2)
+        genius.verbose = False  # Turn off status messages
+        genius.remove_section_headers = True # Remove [Chorus], [Verse 1], etc.
+        _thread_local.genius = genius
+    return _thread_local.genius
+
+
+def connect_vector_db(path="./chroma_db"):
+    """Opens (or creates) the persistent lyrics collection."""
+    global chroma_client, collection
+    chroma_client = chromadb.PersistentClient(path=path)
+    collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
+    return collection
+
+
+def chunk_lyrics(lyrics, artist_name, song_title, chunk_size=4):
     """
-    Fetches lyrics and breaks them into 'chunks' (e.g., 4 lines at a time).
+    Breaks lyrics into 'chunks' (e.g., 4 lines at a time).
     Small chunks are better for retrieval than whole songs.
+    IDs match services.quiz_engine.quick_ingest so the backend sees these songs as ingested.
     """
-    print(f"🎤 Fetching lyrics for: {song_title} by {artist_name}...")
-    song = genius.search_song(song_title, artist_name)
-    
-    if not song:
-        print("❌ Song not found.")
-        return []
-
-    lines = [line for line in song.lyrics.split('\n') if line.strip()]
+    lines = [line for line in lyrics.split('\n') if line.strip()]
     chunks = []
-    
+
     # Simple chunking: Group every 'chunk_size' lines together
     for i in range(0, len(lines), chunk_size):
         chunk_text = "\n".join(lines[i:i+chunk_size])
@@ -44,63 +76,294 @@ def fetch_and_chunk_lyrics(artist_name, song_title, chunk_size=4):
             "artist": artist_name,
             "id": f"{artist_name}_{song_title}_{i}"
         })
-        
-    print(f"✅ Created {len(chunks)} chunks.")
     return chunks
 
-def embed_and_store(chunks):
+
+def fetch_and_chunk_lyrics(artist_name, song_title, chunk_size=4):
+    """
+    Fetches lyrics and breaks them into chunks.
+    """
+    song = get_genius().search_song(song_title, artist_name)
+
+    if not song:
+        return []
+
+    return chunk_lyrics(song.lyrics, artist_name, song_title, chunk_size)
+
+
+def embed_and_store(chunks, embed_batch_size=256):
     """
     Converts text chunks to vectors and stores them in ChromaDB.
     """
     if not chunks:
         return
 
-    print("🧠 Embedding and storing in Vector DB...")
-    
     # Prepare lists for ChromaDB
     documents = [c['text'] for c in chunks]
     metadatas = [{"song": c['song'], "artist": c['artist']} for c in chunks]
     ids = [c['id'] for c in chunks]
-    
+
     # Generate Embeddings (The "Deep Learning" part)
-    embeddings = embedding_model.encode(documents).tolist()
+    embeddings = embedding_model.encode(documents, batch_size=embed_batch_size)
 
     # Upsert (Update if exists, Insert if new)
     collection.upsert(
         documents=documents,
-        embeddings=embeddings,
+        embeddings=embeddings.tolist(),
         metadatas=metadatas,
         ids=ids
     )
-    print(f"💾 Stored {len(chunks)} vectors in ChromaDB.")
+    mirror_chunks(ids, embeddings, metadatas)
+
+
+def mirror_chunks(ids, embeddings, metadatas):
+    """Copies stored chunks into the compact store and hard-negative index, if enabled."""
+    if compact_store is not None:
+        compact_store.upsert(ids, embeddings, metadatas)
+    if hard_negative_index is not None:
+        hard_negative_index.add(ids, embeddings, metadatas)
+
+
+def backfill_mirrors(page_size=2000):
+    """
+    Copies every chunk already in ChromaDB into the enabled mirrors, for songs stored
+    before --compact-store-path / --index-path were used. Re-running it is harmless.
+    """
+    copied = 0
+    while True:
+        page = collection.get(include=["metadatas", "embeddings"], limit=page_size, offset=copied)
+        if not page['ids']:
+            break
+        mirror_chunks(page['ids'], np.asarray(page['embeddings'], dtype=np.float32), page['metadatas'])
+        copied += len(page['ids'])
+        print(f"   🪞 {copied} chunks mirrored")
+    return copied
+
 
 def semantic_search(query_text):
     """
     Searches the database for lyrics that match the 'meaning' of the query.
     """
     print(f"\n🔎 Searching for meaning: '{query_text}'...")
-    
+
     # Convert query to vector
     query_vector = embedding_model.encode([query_text]).tolist()
-    
+
     results = collection.query(
         query_embeddings=query_vector,
         n_results=2  # Return top 2 matching chunks
     )
-    
+
     for i, doc in enumerate(results['documents'][0]):
         meta = results['metadatas'][0][i]
         print(f"\n--- Match {i+1} (Song: {meta['song']}) ---")
         print(doc)
 
+
+# --- SONG SOURCES ---
+def read_song_file(path):
+    """
+    Yields (artist, title) pairs from a .csv (columns: artist,title) or a .jsonl
+    file ({"artist": ..., "title": ...} per line).
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    yield row['artist'], row['title']
+        else:
+            for row in csv.DictReader(f):
+                yield row['artist'], row['title']
+
+
+def read_playlist_songs(playlist_ids):
+    """Yields (artist, title) pairs for every track in the given Spotify playlists, page by page."""
+    import spotipy
+    from spotipy.oauth2 import SpotifyOAuth
+
+    sp = spotipy.Spotify(auth_manager=SpotifyOAuth(scope="playlist-read-private"))
+    for playlist_id in playlist_ids:
+        page = sp.playlist_items(playlist_id, limit=100)
+        while page:
+            for item in page['items']:
+                track = item['track']
+                if track:
+                    yield track['artists'][0]['name'], track['name']
+            page = sp.next(page) if page['next'] else None
+
+
+# --- CHECKPOINTING ---
+def song_key(artist, title):
+    return f"{artist.strip().lower()}\t{title.strip().lower()}"
+
+
+def load_checkpoint(path):
+    """Returns the keys of every song already handled by a previous run."""
+    done = set()
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    done.add(song_key(row['artist'], row['title']))
+    return done
+
+
+def append_checkpoint(path, rows):
+    """Appends finished songs. Only called after their chunks are safely upserted."""
+    if not path or not rows:
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row) + "\n")
+
+
+# --- BULK PIPELINE ---
+def bulk_ingest(songs, workers=8, upsert_batch=2000, embed_batch_size=256,
+                checkpoint_path=None, limit=None, report_every=50):
+    """
+    Streams (artist, title) pairs through a concurrent Genius fetch pool, then embeds
+    and upserts the resulting chunks in large batches.
+
+    Progress is checkpointed after every upsert, so an interrupted run can be restarted
+    with the same arguments and will skip everything that was already stored.
+    """
+    done = load_checkpoint(checkpoint_path)
+    if done:
+        print(f"↩️  Resuming: {len(done)} songs already in checkpoint.")
+
+    pending_chunks = []
+    pending_rows = []
+    stats = {"submitted": 0, "stored": 0, "missing": 0, "failed": 0, "chunks": 0}
+    start = time.perf_counter()
+
+    def flush():
+        if pending_chunks:
+            embed_and_store(pending_chunks, embed_batch_size)
+            stats["chunks"] += len(pending_chunks)
+        append_checkpoint(checkpoint_path, pending_rows)
+        pending_chunks.clear()
+        pending_rows.clear()
+
+    def report():
+        elapsed = time.perf_counter() - start
+        handled = stats["stored"] + stats["missing"] + stats["failed"]
+        rate = handled / elapsed if elapsed else 0.0
+        print(f"   📈 {handled} songs | {stats['stored']} stored, {stats['missing']} not found, "
+              f"{stats['failed']} failed | {stats['chunks']} chunks | {rate:.2f} songs/sec")
+
+    def collect(futures):
+        for future in futures:
+            artist, title = in_flight.pop(future)
+            try:
+                chunks = future.result()
+            except Exception as e:
+                # Not checkpointed, so it is retried on the next run
+                print(f"   ❌ {title} by {artist}: {e}")
+                stats["failed"] += 1
+                continue
+
+            if chunks:
+                pending_chunks.extend(chunks)
+                stats["stored"] += 1
+            else:
+                stats["missing"] += 1
+            pending_rows.append({"artist": artist, "title": title,
+                                 "status": "stored" if chunks else "missing"})
+
+            handled = stats["stored"] + stats["missing"] + stats["failed"]
+            if handled % report_every == 0:
+                report()
+
+        if len(pending_chunks) >= upsert_batch:
+            flush()
+
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for artist, title in songs:
+            if limit is not None and stats["submitted"] >= limit:
+                break
+            key = song_key(artist, title)
+            if key in done:
+                continue
+            done.add(key)  # Also drops duplicates inside the input itself
+
+            # Keep a bounded window of requests in flight instead of queueing the whole input
+            while len(in_flight) >= workers * 2:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+
+            in_flight[pool.submit(fetch_and_chunk_lyrics, artist, title)] = (artist, title)
+            stats["submitted"] += 1
+
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(finished)
+
+    flush()
+    report()
+    print(f"🏁 Finished in {time.perf_counter() - start:.1f}s")
+    return stats
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Bulk-ingest lyrics into the vector store to pre-warm the quiz index.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--songs", help="CSV (artist,title) or JSONL file of songs to ingest")
+    source.add_argument("--playlists", nargs="+", metavar="PLAYLIST_ID",
+                        help="Spotify playlist IDs whose tracks should be ingested")
+    source.add_argument("--search", help="Run a semantic search against the store and exit")
+    source.add_argument("--backfill", action="store_true",
+                        help="Copy chunks already in the store into --compact-store-path / --index-path and exit")
+    parser.add_argument("--db-path", default="./chroma_db", help="ChromaDB directory (default: ./chroma_db)")
+    parser.add_argument("--checkpoint", default="ingest_checkpoint.jsonl",
+                        help="Progress file used to resume interrupted runs")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent Genius fetches")
+    parser.add_argument("--upsert-batch", type=int, default=2000, help="Chunks per embed + upsert batch")
+    parser.add_argument("--embed-batch", type=int, default=256, help="Batch size passed to the encoder")
+    parser.add_argument("--limit", type=int, help="Stop after this many new songs")
+    parser.add_argument("--index-path",
+                        help="Also feed the backend's hard-negative ANN index at this path (backend stopped)")
+    parser.add_argument("--compact-store-path",
+                        help="Also feed the backend's compact vector store at this path (backend stopped)")
+    parser.add_argument("--compact-store-dtype", default="float16", choices=SUPPORTED_DTYPES,
+                        help="Must match the backend's COMPACT_STORE_DTYPE")
+    return parser.parse_args()
+
+
 # --- MAIN EXECUTION ---
 if __name__ == "__main__":
-    # 1. Ingest Data (Do this once per song)
-    # Let's use a song known for vivid imagery
-    chunks = fetch_and_chunk_lyrics("Pink Floyd", "Time")
-    embed_and_store(chunks)
-    
-    # 2. Test Semantic Search
-    # Note: I am NOT using keywords like "Time" or "Clock". 
-    # I am describing the FEELING.
-    semantic_search("The feeling of getting older and wasting life")
\ No newline at end of file
+    # Example: python ingest_lyrics.py --songs top_songs.csv --db-path backend/chroma_db --limit 5000
+    args = parse_args()
+    connect_vector_db(args.db_path)
+    try:
+        if args.compact_store_path:
+            compact_store = CompactVectorStore(args.compact_store_path, dtype=args.compact_store_dtype)
+        if args.index_path:
+            hard_negative_index = HardNegativeIndex(args.index_path)
+    except RuntimeError as e:
+        raise SystemExit(f"❌ {e} Stop it, or drop --compact-store-path/--index-path.")
+
+    if args.search:
+        semantic_search(args.search)
+    elif args.backfill:
+        if compact_store is None and hard_negative_index is None:
+            raise SystemExit("--backfill needs --compact-store-path and/or --index-path")
+        print(f"🪞 Backfilling mirrors from {args.db_path}...")
+        backfill_mirrors(args.upsert_batch)
+    else:
+        songs = read_song_file(args.songs) if args.songs else read_playlist_songs(args.playlists)
+        print(f"🚀 Bulk ingest into {args.db_path} with {args.workers} workers...")
+        bulk_ingest(
+            songs,
+            workers=args.workers,
+            upsert_batch=args.upsert_batch,
+            embed_batch_size=args.embed_batch,
+            checkpoint_path=args.checkpoint,
+            limit=args.limit,
+        )
+    if hard_negative_index is not None and hard_negative_index.needs_rebuild():
+        print("🧭 Retraining hard-negative index...")
+        hard_negative_index.rebuild()
@@ -2,8 +2,7 @@ import os
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 from google import genai
-from collections import Counter
-import random
+from backend.services.playlist_profile import PlaylistProfileStore, get_profile, top_artists
 
 # --- CONFIGURATION (Load these from a .env file in production) ---
 os.environ['SPOTIPY_CLIENT_ID'] = ''
@@ -15,26 +14,19 @@ os.environ['GEMINI_API_KEY'] = ''
 sp = spotipy.Spotify(auth_manager=SpotifyOAuth(scope="playlist-read-private"))
 # client = OpenAI(api_key=OPENAI_API_KEY)
 client = genai.Client()
+profiles = PlaylistProfileStore()
 
 
-def get_playlist_artists(playlist_id, limit=50):
+def get_playlist_artists(playlist_id, limit=10):
     """
-    Fetches tracks from a Spotify playlist and returns a list of the most 
-    common artists to ensure the trivia is relevant to the 'vibe'.
+    Returns the `limit` most common artists of a Spotify playlist to ensure the trivia
+    is relevant to the 'vibe'. Counts the whole playlist (it used to read only the first
+    50 tracks), from the stored playlist profile, which is only rebuilt when the
+    playlist's snapshot changed.
     """
-    print(f"🎵 Fetching tracks from playlist {playlist_id}...")
-    results = sp.playlist_items(playlist_id, limit=limit)
-    artists = []
-
-    for item in results['items']:
-        track = item['track']
-        if track:
-            # Get the main artist for each track
-            artists.append(track['artists'][0]['name'])
-
-    # Get top 10 most frequent artists in this playlist
-    top_artists = [artist for artist, count in Counter(artists).most_common(10)]
-    return top_artists
+    print(f"🎵 Loading profile for playlist {playlist_id}...")
+    profile = get_profile(sp, profiles, playlist_id)
+    return top_artists(profile, limit)
 
 
 def generate_trivia(artists):
@@ -81,10 +73,10 @@ if __name__ == "__main__":
 
     # 2. Extract Data
     try:
-        top_artists = get_playlist_artists(playlist_id)
+        playlist_artists = get_playlist_artists(playlist_id)
 
         # 3. Generate Content
-        trivia = generate_trivia(top_artists)
+        trivia = generate_trivia(playlist_artists)
 
         print("\n" + "="*30)
         print("   🎶 YOUR PLAYLIST TRIVIA 🎶")